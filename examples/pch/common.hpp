@@ -0,0 +1,18 @@
+//
+// Copyright (c) 2018 Stefan Seefeld
+// All rights reserved.
+//
+// This file is part of Faber. It is made available under the
+// Boost Software License, Version 1.0.
+// (Consult LICENSE or http://www.boost.org/LICENSE_1_0.txt)
+
+#ifndef common_hpp_
+#define common_hpp_
+
+#include <iostream>
+#include <string>
+#include <vector>
+
+void greet(std::vector<std::string> const &names);
+
+#endif
@@ -0,0 +1,15 @@
+//
+// Copyright (c) 2018 Stefan Seefeld
+// All rights reserved.
+//
+// This file is part of Faber. It is made available under the
+// Boost Software License, Version 1.0.
+// (Consult LICENSE or http://www.boost.org/LICENSE_1_0.txt)
+
+#include "common.hpp"
+
+void greet(std::vector<std::string> const &names)
+{
+  for (auto const &n : names)
+    std::cout << "hello " << n << '!' << std::endl;
+}
@@ -0,0 +1,17 @@
+//
+// Copyright (c) 2018 Stefan Seefeld
+// All rights reserved.
+//
+// This file is part of Faber. It is made available under the
+// Boost Software License, Version 1.0.
+// (Consult LICENSE or http://www.boost.org/LICENSE_1_0.txt)
+
+#ifndef greet_hpp_
+#define greet_hpp_
+
+#include <string>
+
+void greet(std::string const &name);
+void farewell(std::string const &name);
+
+#endif
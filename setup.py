@@ -69,7 +69,8 @@ setup(name='faber',
       cmdclass=versioneer.get_cmdclass({'build_doc': build_doc}),
       package_dir={'': 'src'},
       packages=find_packages(where='src'),
-      entry_points=dict(console_scripts=['faber=faber.cli:cli_main']),
+      entry_points=dict(console_scripts=['faber=faber.cli:cli_main',
+                                         'faber-client=faber.client:cli_main']),
       data_files=data + docs,
       setup_requires=['pytest-runner'],
       tests_require=['pytest'],
@@ -43,6 +43,10 @@ class action(object):
     """An action is executed in order to (re-)generate an 'artefact'."""
 
     var_ex = re.compile(r'\$\((?P<variable>\w+)\)')
+    # An action is hermetic if its command reads no files other than its
+    # sources (and their scanned headers), and writes no files other than
+    # its targets, so it may be run on a worker (see faber.scheduler.executor).
+    hermetic = False
 
     @staticmethod
     def command_string(func, targets, sources, kwds):
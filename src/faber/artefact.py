@@ -36,6 +36,8 @@ class artefact(object):
 
     _path_formatter = path_formatter()
     _qnames = defaultdict(list)
+    # set if the recipe writes a make-style dependency file next to the artefact
+    depfile = False
 
     @staticmethod
     def finish():
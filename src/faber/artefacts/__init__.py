@@ -29,6 +29,8 @@ class assemble(action):
     # run even in 'noexec' mode.
     # (see ..scheduler._pyaction)
     call.__noexec__ = True
+    # the assembly modifies the dependency graph, so don't run it in a worker thread
+    call.__inline__ = True
     command = staticmethod(call)
 
     def __status__(self, targets, status, command, time, stdout, stderr):
@@ -80,8 +82,13 @@ class composite(artefact):
         composite._targets[a] = self
         depend(self, a)
 
+    def _batch(self):
+        """Return the sources to build from, batched if this is a unity build."""
+        from .unity import batch
+        return batch(self.name, self.sources, self.features, self.module)
+
     def _assemble(self):
         from ..tools import compiler  # noqa F401
         if self.status is None:
             self.features.eval(update=False)
-            assembly.rule(self, self.sources, self.features, module=self.module)
+            assembly.rule(self, self._batch(), self.features, module=self.module)
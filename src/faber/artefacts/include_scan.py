@@ -7,9 +7,123 @@
 # (Consult LICENSE or http://www.boost.org/LICENSE_1_0.txt)
 
 from ..artefact import artefact, source
+from .. import types
+from .. import scheduler
+from ..scheduler import fscache
+from ..action import action
 from ..rule import rule, depend
 from ..tools.compiler import compiler
-from os.path import join, splitext
+from ..cache import file_digest
+from os.path import join, splitext, dirname, normpath, isabs, relpath, exists
+import re
+
+_include = re.compile(rb'^[ \t]*#[ \t]*include[ \t]*([<"])([^>"\n]+)[>"]', re.M)
+_computed = re.compile(rb'^[ \t]*#[ \t]*include[ \t]+[A-Za-z_]', re.M)
+_directives = {}  # map content digest to (includes, computed)
+
+
+class ComputedInclude(Exception):
+    """Raised if a file includes a header whose name is computed by a macro."""
+
+
+def _parse(filename):
+    """Return the `#include` directives in filename, as a list of
+    (quoted, name) tuples. Results are cached by content, so headers
+    included from many sources are only parsed once."""
+
+    st = fscache.stat(filename)
+    if st is None:
+        raise FileNotFoundError(filename)
+    digest = file_digest(filename, st=st)
+    if digest not in _directives:
+        with open(filename, 'rb') as f:
+            content = f.read()
+        includes = [(q == b'"', n.strip().decode('utf-8', 'replace'))
+                    for q, n in _include.findall(content)]
+        _directives[digest] = includes, bool(_computed.search(content))
+    includes, computed = _directives[digest]
+    if computed:
+        raise ComputedInclude(filename)
+    return includes
+
+
+def _resolve(directory, paths, quoted, name):
+    """Find the header `name` the way the preprocessor would.
+    Return None if it can't be found, i.e. if it is a system header."""
+
+    if isabs(name):
+        return name if fscache.isfile(name) else None
+    for d in ([directory] if quoted else []) + list(paths):
+        candidate = normpath(join(d, name))
+        if fscache.isfile(candidate):
+            return candidate
+    return None
+
+
+def includes(filename, paths=()):
+    """Return all headers filename includes, directly or indirectly,
+    resolved against the include paths. Headers that can't be found are
+    assumed to be system headers and ignored. Conditional inclusion is not
+    evaluated, so the result may contain more headers than the preprocessor
+    would actually read. Raise ComputedInclude if a header name is computed."""
+
+    paths = tuple(paths)
+    headers = []
+    seen = set([normpath(filename)])
+    stack = [normpath(filename)]
+    while stack:
+        f = stack.pop()
+        directory = dirname(f)
+        for quoted, name in _parse(f):
+            h = _resolve(directory, paths, quoted, name)
+            if h and h not in seen:
+                seen.add(h)
+                headers.append(h)
+                stack.append(h)
+    return headers
+
+
+class scanner(action):
+    """Scan sources for `#include` directives in-process, rather than
+    running the preprocessor. Sources using computed includes, or targets
+    with the 'scanner=compiler' feature, are scanned by the fallback
+    (compiler-based) action instead."""
+
+    _instances = {}
+
+    @staticmethod
+    def instance(fallback):
+        """Return the scanner using the given fallback action."""
+        if fallback not in scanner._instances:
+            scanner._instances[fallback] = scanner(fallback)
+        return scanner._instances[fallback]
+
+    def __init__(self, fallback):
+        action.__init__(self, fallback.name, self.scan)
+        # act on behalf of the fallback's tool (for qname, features, etc.)
+        self._cls, self._tool = fallback._cls, fallback._tool
+        self.fallback = fallback
+
+    def instantiate(self, features=()):
+        return self
+
+    def map(self, fs):
+        return self.fallback.map(fs)  # just forward variables from the fallback
+
+    def scan(self, targets, sources):
+        fs = targets[0].features
+        if 'scanner' in fs and fs.scanner == 'compiler':
+            return self.fallback(targets, sources)
+        paths = fs.include._value if 'include' in fs else []
+        try:
+            headers = includes(sources[0]._filename, paths)
+        except ComputedInclude:
+            return self.fallback(targets, sources)
+        # header paths need to be relative to the current module
+        base = targets[0].module.srcdir
+        headers = [h if isabs(h) else relpath(h, base) for h in headers]
+        with open(targets[0]._filename, 'w') as f:
+            f.writelines([h + '\n' for h in headers])
 
 
 class scan(artefact):
@@ -19,7 +133,10 @@ class scan(artefact):
     def __init__(self, src, obj, recipe=None, features=(), module=None):
 
         src = source.instantiate(src, module=module)
-        name = join(splitext(src.name)[0] + '.d')
+        # keep a header's extension, so its dependency file doesn't
+        # clash with that of a source file of the same name
+        stem = src.name if src.type in (types.h, types.hxx) else splitext(src.name)[0]
+        name = join(stem + '.d')
         artefact.__init__(self, name, features=features, module=module,
                           logfile=obj.logfile)
         self._obj = obj
@@ -36,7 +153,39 @@ class scan(artefact):
     def __status__(self, status):
         # the file format is simply a newline-separated list
         # of (header) filenames
-        if status:
-            headers = [h.strip() for h in open(self._filename).readlines()]
+        # (in noexec mode there is nothing to read)
+        # The file was stat'ed when it was bound (or after it was regenerated),
+        # so the cache usually has its timestamp already.
+        filename = self._filename
+        st = fscache.stat(filename) if status else None
+        if st is not None:
+            # avoid re-reading the file if the deps log has its content already
+            stamp = st.st_mtime_ns
+            headers = scheduler.headers(filename, stamp)
+            if headers is None:
+                headers = [h.strip() for h in open(filename).readlines()]
+                scheduler.record_headers(filename, headers, stamp)
             depend(self._obj, [source.instantiate(h, module=self.module)
                                for h in headers])
+
+
+def depfile(obj, module=None):
+    """Track the header dependencies of `obj` through the dependency file
+    its recipe writes while compiling, rather than scanning its sources
+    beforehand. The headers reported during the last build are added as
+    prerequisites right away."""
+
+    obj.depfile = True
+    add_reported_headers(obj)
+
+
+def add_reported_headers(obj):
+    """Add the headers the compiler reported for `obj` during
+    the last build (see :func:`depfile`) as its prerequisites."""
+
+    # headers that disappeared can't have been included by the last (successful) compilation
+    headers = [h for h in scheduler.headers(obj.qname) or [] if exists(h)]
+    if headers:
+        base = obj.module.srcdir
+        depend(obj, [source.instantiate(relpath(h, base), module=obj.module)
+                     for h in headers])
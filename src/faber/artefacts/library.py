@@ -21,7 +21,7 @@ from os.path import dirname, basename, normpath, join
 class library(composite):
 
     # This command assumes that source an target live in the same directory.
-    symlink = action('symlink', 'cd `dirname $(>)` && ln -s `basename $(>)` `basename $(<)`')
+    symlink = action('symlink', 'cd `dirname $(>)` && ln -sf `basename $(>)` `basename $(<)`')
 
     def __init__(self, *args, **kwds):
         version = kwds.pop('version', None)
@@ -46,7 +46,7 @@ class library(composite):
                     self.features += soname('{}.{}.{}'.format(base, self.version[0], self.version[1]))
                 a = artefact(base + '.' + '.'.join(self.version),
                              type=self.type, features=self.features, path_spec=self.path_spec, module=self.module)
-                self._versioned = assembly.rule(a, self.sources, features=self.features, module=self.module)
+                self._versioned = assembly.rule(a, self._batch(), features=self.features, module=self.module)
                 suffixes = list(reversed(['.'.join(self.version[:i]) for i in range(len(self.version))]))
                 links = [join(a.relpath, '{}.{}'.format(base, suffixes[i])) for i in range(len(suffixes) - 1)]
                 self.path_spec = a.path_spec
@@ -55,7 +55,7 @@ class library(composite):
                 for l in links:
                     a = rule(library.symlink, l, a)
                 return
-        assembly.rule(self, self.sources, self.features, module=self.module)
+        assembly.rule(self, self._batch(), self.features, module=self.module)
 
     @property
     def libname(self):
@@ -0,0 +1,33 @@
+#
+# Copyright (c) 2018 Stefan Seefeld
+# All rights reserved.
+#
+# This file is part of Faber. It is made available under the
+# Boost Software License, Version 1.0.
+# (Consult LICENSE or http://www.boost.org/LICENSE_1_0.txt)
+
+from .. import types
+from ..tools import compiler
+from . import composite
+from os.path import join, normpath
+
+
+class pch(composite):
+    """Precompile a header.
+    Objects pick up the precompiled header (and a dependency on it) through
+    its `use` features, e.g. `binary('hello', 'hello.cpp', features=common.use)`.
+    (With msvc, binaries and libraries built with these features also link
+    the object generated along with the precompiled header.)
+    As with any precompiled header, they need to be compiled with features
+    compatible to the ones the header was precompiled with."""
+
+    def __init__(self, name, header, *args, **kwds):
+        composite.__init__(self, name, header, *args, type=types.pch, **kwds)
+        self.use |= compiler.pchfile(self.filename)
+        self.use |= compiler.pchheader(self.sources[0]._filename)
+
+    @property
+    def _filename(self):
+        host = str(self.features.target.os) if 'target' in self.features else ''
+        name = self.type.synthesize_name(self.name, host)
+        return normpath(join(self.module.builddir, self.relpath, name))
@@ -0,0 +1,70 @@
+#
+# Copyright (c) 2018 Stefan Seefeld
+# All rights reserved.
+#
+# This file is part of Faber. It is made available under the
+# Boost Software License, Version 1.0.
+# (Consult LICENSE or http://www.boost.org/LICENSE_1_0.txt)
+
+"""Unity (a.k.a. jumbo) builds: compile batches of sources as a single
+translation unit each, to reduce the number of compiler invocations and
+the time spent parsing common headers."""
+
+from .. import types
+from .. import assembly
+from ..action import action
+from ..rule import rule
+from ..tools.compiler import compiler
+from os.path import abspath, dirname, relpath
+
+
+def _include(source, target):
+    """Return the path to include `source` by from `target`."""
+    try:
+        # relative paths keep the build relocatable
+        path = relpath(abspath(source), dirname(abspath(target)))
+    except ValueError:  # (on different drives)
+        path = abspath(source)
+    return path.replace('\\', '/')
+
+
+def _generate(targets, sources):
+    """Write a translation unit including all sources."""
+    lines = ['#include "{}"\n'.format(_include(s._filename, targets[0]._filename))
+             for s in sources]
+    with open(targets[0]._filename, 'w') as f:
+        f.writelines(lines)
+
+
+generate = action('unity', _generate)
+
+
+def batch(name, sources, features, module):
+    """If `features` contain `unity=N`, replace C and C++ sources by
+    generated translation units including up to N of them each.
+
+    As the generated files depend on the sources in their batch, a
+    modified source causes only its own batch to be recompiled.
+    All other sources are passed through unchanged."""
+
+    if 'unity' not in features or not features.unity._value:
+        return sources
+    size = int(features.unity._value)
+    batches = []
+    for t in (types.c, types.cxx):
+        group = [s for s in sources if s.type is t]
+        if size < 2 or len(group) < 2:
+            batches += group
+            continue
+        # generate the batches next to the objects they will be compiled to
+        compiler.check_instance_for_type(t)
+        fs = features | assembly.features(types.obj, t, features)
+        for i in range(0, len(group), size):
+            members = group[i:i + size]
+            if len(members) == 1:
+                batches += members
+                continue
+            filename = t.synthesize_name('{}.unity{}.'.format(name, i // size))
+            batches.append(rule(generate, filename, members, features=fs,
+                                path_spec=compiler.path_spec, module=module))
+    return batches + [s for s in sources if s.type not in (types.c, types.cxx)]
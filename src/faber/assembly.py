@@ -20,7 +20,8 @@ logger = logging.getLogger('rules')
 
 class _candidate(object):
 
-    def __init__(self, recipe, type, target, sources, features, intermediate, scan=None, logfile=None):
+    def __init__(self, recipe, type, target, sources, features, intermediate, scan=None, logfile=None,
+                 depfile=False):
         self.recipe = recipe
         self.type = type
         self.target = target
@@ -28,6 +29,7 @@ class _candidate(object):
         self.features = features
         self.intermediate = intermediate
         self.scan = scan  # this might be a recipe for include-scanning
+        self.depfile = depfile  # or the recipe itself may report the includes
         self.logfile = logfile
 
     def instantiate(self, module):
@@ -41,6 +43,9 @@ class _candidate(object):
             from .artefacts.include_scan import scan
             for s in sources:
                 scan(s, t, self.scan, features=self.features, module=module)
+        elif self.depfile:
+            from .artefacts.include_scan import depfile
+            depfile(t, module=module)
         return t
 
     def __repr__(self):
@@ -92,13 +97,21 @@ class _implicit_rule(object):
 
         fs = self.features.copy()
         fs |= features
-        # hack: if this is a C/C++ source compilation, inject a header-scan
+        # hack: if this is a C/C++ source (or header) compilation, inject a header-scan
         #       to track the additional header dependencies
         scan = None
-        if source[0].type in (types.c, types.cxx) and t.type is types.obj:
+        depfile = False
+        if (source[0].type in (types.c, types.cxx, types.h, types.hxx) and
+                t.type in (types.obj, types.pch)):
+            from .artefacts.include_scan import scanner
             tool = self.recipe.tool
-            scan = tool.makedep if tool else None
-        return _candidate(self.recipe, t.type, target, src, fs, intermediate, scan=scan, logfile=logfile)
+            if (tool and tool.depfile and 'scanner' in fs and fs.scanner == 'depfile' and
+                    t.type is types.obj):
+                depfile = True
+            elif tool:
+                scan = scanner.instance(tool.makedep)
+        return _candidate(self.recipe, t.type, target, src, fs, intermediate, scan=scan, logfile=logfile,
+                          depfile=depfile)
 
     def __repr__(self):
         return '<{} {} <- {}>'.format(self.recipe.qname,
@@ -149,6 +162,16 @@ def connect(target, source, features, intermediate=False, logfile=None):
                               features.essentials()))
 
 
+def features(target, source, features):
+    """Return the features of the implicit rule that would be used to generate
+    type `target` from type `source`, or an empty set if there is none."""
+
+    for r in _repository[target]:
+        if source in r.source and r.features.matches(features):
+            return r.features
+    return set()
+
+
 def implicit_rule(recipe, target, source):
     """Define an implicit rule to build target type from source type using recipe."""
 
@@ -170,7 +193,7 @@ def rule(target, sources, features=set(), intermediate=False, module=None):
 
     logger.info('assembly rule: {} <- {}'.format(target, sources))
     # now look at the source types to see what tools we may need.
-    for t in (types.c, types.cxx):
+    for t in (types.c, types.cxx, types.h, types.hxx):
         if any([s.type is t for s in sources]):
             from .tools.compiler import compiler
             compiler.check_instance_for_type(t)
@@ -6,11 +6,46 @@
 # Boost Software License, Version 1.0.
 # (Consult LICENSE or http://www.boost.org/LICENSE_1_0.txt)
 
+from concurrent.futures import ThreadPoolExecutor
+import urllib.request
+import urllib.error
 import sqlite3
 import hashlib
+import threading
+import socket
+import logging
+import json
+import mmap
+import struct
+import shutil
+import time
 import os
 import os.path
 
+logger = logging.getLogger('scheduler')
+
+_digests = {}  # map (algorithm, filename) to (stat signature, digest)
+
+
+def file_digest(filename, algorithm='md5', st=None):
+    """Return the (hex) digest of the given file's content.
+    The digest is only recomputed if the file's size, modification
+    time, or inode changed since it was last computed. Pass the file's
+    stat result as `st` if it is known already."""
+
+    st = st or os.stat(filename)
+    stamp = (st.st_size, st.st_mtime_ns, st.st_ino)
+    cached = _digests.get((algorithm, filename))
+    if cached and cached[0] == stamp:
+        return cached[1]
+    h = hashlib.new(algorithm)
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            h.update(chunk)
+    digest = h.hexdigest()
+    _digests[(algorithm, filename)] = (stamp, digest)
+    return digest
+
 
 class filecache(object):
     """Record all file artefacts to facilitate their cleanup."""
@@ -51,3 +86,572 @@ class filecache(object):
             for i in self.conn.execute('SELECT filename FROM files WHERE variant=?',
                                        (self.variant,)):
                 yield i[0]
+
+
+class signatures(object):
+    """Record content signatures of files, as well as the signatures
+    of the inputs each target was last generated from."""
+
+    def __init__(self, builddir):
+        fdir = os.path.join(builddir, '.faber')
+        if not os.path.exists(fdir):
+            os.makedirs(fdir)
+        self.filename = os.path.join(fdir, 'signatures')
+        self.conn = sqlite3.connect(self.filename)
+        # Create tables if they don't exist yet.
+        if not next(self.conn.execute('SELECT name FROM sqlite_master '
+                                      'WHERE type="table" AND name="files"'), None):
+            self.conn.execute('CREATE TABLE files (filename TEXT PRIMARY KEY, '
+                              'size INTEGER, mtime REAL, inode INTEGER, digest TEXT)')
+            self.conn.execute('CREATE TABLE targets (target TEXT PRIMARY KEY, signature TEXT)')
+        self._files = {}
+
+    def finish(self):
+        if self.conn:
+            self.conn.commit()
+            self.conn.close()
+            self.conn = None
+
+    def digest(self, filename):
+        """Return the digest of the given file's content.
+        The digest is only recomputed if the file's size, modification
+        time, or inode changed since it was last recorded."""
+
+        st = os.stat(filename)
+        key = (st.st_size, st.st_mtime, st.st_ino)
+        if filename not in self._files:
+            row = next(self.conn.execute('SELECT size, mtime, inode, digest FROM files '
+                                         'WHERE filename=?', (filename,)), None)
+            self._files[filename] = (tuple(row[:3]), row[3]) if row else (None, None)
+        recorded, digest = self._files[filename]
+        if recorded != key:
+            digest = file_digest(filename, st=st)
+            self._files[filename] = (key, digest)
+            self.conn.execute('INSERT OR REPLACE INTO files VALUES(?,?,?,?,?)',
+                              (filename,) + key + (digest,))
+        return digest
+
+    def __getitem__(self, target):
+        row = next(self.conn.execute('SELECT signature FROM targets WHERE target=?',
+                                     (target,)), None)
+        return row[0] if row else None
+
+    def __setitem__(self, target, signature):
+        self.conn.execute('INSERT OR REPLACE INTO targets VALUES(?,?)',
+                          (target, signature))
+
+
+class buildlog(object):
+    """Record the command and prerequisites each file artefact was
+    last generated with, so changes to either can be detected.
+    There is one record per file, whatever parameters it was generated
+    with, as a change of parameters is just what needs to be detected."""
+
+    def __init__(self, builddir):
+        fdir = os.path.join(builddir, '.faber')
+        if not os.path.exists(fdir):
+            os.makedirs(fdir)
+        self.filename = os.path.join(fdir, 'buildlog')
+        self.conn = sqlite3.connect(self.filename)
+        columns = [c[1] for c in self.conn.execute('PRAGMA table_info(commands)')]
+        if 'variant' in columns:
+            # drop logs recorded per parameter set
+            self.conn.execute('DROP TABLE commands')
+            columns = []
+        # Create table if it doesn't exist yet.
+        if not columns:
+            self.conn.execute('CREATE TABLE commands (target TEXT PRIMARY KEY, '
+                              'command TEXT, prerequisites TEXT)')
+        self._entries = None
+
+    def finish(self):
+        if self.conn:
+            self.conn.commit()
+            self.conn.close()
+            self.conn = None
+
+    def _load(self):
+        self._entries = {t: (c, p.split('\n') if p else [])
+                         for t, c, p in self.conn.execute('SELECT target, command, prerequisites '
+                                                          'FROM commands')}
+
+    def __getitem__(self, target):
+        """Return the (command, prerequisites) tuple recorded for target,
+        or None."""
+        if self._entries is None:
+            self._load()
+        return self._entries.get(target)
+
+    def __setitem__(self, target, value):
+        command, prerequisites = value
+        if self._entries is not None:
+            self._entries[target] = (command, list(prerequisites))
+        self.conn.execute('INSERT OR REPLACE INTO commands VALUES(?,?,?)',
+                          (target, command, '\n'.join(prerequisites)))
+
+
+class depslog(object):
+    """Record the headers each artefact was found to depend on, in a compact
+    append-only binary log.
+
+    The log starts with a magic string, followed by records of two kinds:
+
+      * path records, each defining the next (implicit) path id:
+        kind (0), length, utf-8 encoded path
+      * dependency records, superseding any earlier record for the same target:
+        kind (1), target id, stamp, count, and `count` path ids
+
+    It is read once (through mmap), and compacted if superseded records
+    dominate."""
+
+    magic = b'# faber deps log v1\n'
+    _path = struct.Struct('<BI')
+    _deps = struct.Struct('<BIQI')
+    compaction_count = 1000
+    compaction_ratio = 3
+
+    def __init__(self, builddir):
+        fdir = os.path.join(builddir, '.faber')
+        if not os.path.exists(fdir):
+            os.makedirs(fdir)
+        self.filename = os.path.join(fdir, 'deps')
+        self._paths = []  # map ids to paths...
+        self._ids = {}    # ...and paths to ids
+        self._entries = {}  # map target ids to (stamp, [header ids])
+        self._file = None
+        records, end = self._load()
+        if records > max(depslog.compaction_count,
+                         depslog.compaction_ratio * len(self._entries)):
+            self._compact()
+        elif end is not None:
+            # drop a partially written record, or an unreadable log
+            with open(self.filename, 'r+b') as f:
+                f.truncate(end)
+
+    def _load(self):
+        """Read the log, and return the number of dependency records,
+        as well as the offset to truncate it to, if needed."""
+        if not os.path.exists(self.filename) or not os.path.getsize(self.filename):
+            return 0, None
+        with open(self.filename, 'rb') as f, \
+             mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if data[:len(depslog.magic)] != depslog.magic:
+                return 0, 0
+            offset, size, records = len(depslog.magic), len(data), 0
+            try:
+                while offset < size:
+                    kind = data[offset]
+                    if kind == 0:
+                        _, length = depslog._path.unpack_from(data, offset)
+                        end = offset + depslog._path.size + length
+                        if end > size:
+                            break
+                        path = data[offset + depslog._path.size:end].decode('utf-8')
+                        self._ids[path] = len(self._paths)
+                        self._paths.append(path)
+                    elif kind == 1:
+                        _, target, stamp, count = depslog._deps.unpack_from(data, offset)
+                        start = offset + depslog._deps.size
+                        end = start + 4 * count
+                        if end > size:
+                            break
+                        self._entries[target] = (stamp, list(struct.unpack_from(f'<{count}I', data, start)))
+                        records += 1
+                    else:
+                        break
+                    offset = end
+            except struct.error:
+                pass
+            return records, offset if offset < size else None
+
+    def _compact(self):
+        """Rewrite the log, keeping only the most recent record for each target."""
+        entries = [(self._paths[t], stamp, [self._paths[h] for h in headers])
+                   for t, (stamp, headers) in self._entries.items()]
+        self._paths, self._ids, self._entries = [], {}, {}
+        tmp = self.filename + '.tmp'
+        with open(tmp, 'wb') as self._file:
+            self._file.write(depslog.magic)
+            for target, stamp, headers in entries:
+                self._record(target, headers, stamp)
+        self._file = None
+        os.replace(tmp, self.filename)
+
+    def _id(self, path):
+        id = self._ids.get(path)
+        if id is None:
+            encoded = path.encode('utf-8')
+            self._file.write(depslog._path.pack(0, len(encoded)))
+            self._file.write(encoded)
+            id = self._ids[path] = len(self._paths)
+            self._paths.append(path)
+        return id
+
+    def _record(self, target, headers, stamp):
+        ids = [self._id(h) for h in headers]
+        target = self._id(target)
+        self._file.write(depslog._deps.pack(1, target, stamp, len(ids)))
+        self._file.write(struct.pack(f'<{len(ids)}I', *ids))
+        self._entries[target] = (stamp, ids)
+
+    def finish(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def lookup(self, target):
+        """Return the (stamp, headers) tuple recorded for target, or None."""
+        id = self._ids.get(target)
+        entry = self._entries.get(id) if id is not None else None
+        if entry is None:
+            return None
+        return entry[0], [self._paths[h] for h in entry[1]]
+
+    def get(self, target, default=None):
+        entry = self.lookup(target)
+        return entry[1] if entry else default
+
+    def record(self, target, headers, stamp=0):
+        """Record the headers of target, unless they are unchanged."""
+        if self.lookup(target) == (stamp, list(headers)):
+            return
+        if not self._file:
+            new = not os.path.exists(self.filename) or not os.path.getsize(self.filename)
+            self._file = open(self.filename, 'ab')
+            if new:
+                self._file.write(depslog.magic)
+        self._record(target, headers, stamp)
+
+    def __setitem__(self, target, headers):
+        self.record(target, headers)
+
+
+class timings(object):
+    """Record how long it took to update each artefact, together with
+    the CPU time and peak memory usage of the action doing it."""
+
+    columns = ('target', 'action', 'tool', 'module', 'wall', 'cpu', 'rss')
+
+    def __init__(self, builddir):
+        fdir = os.path.join(builddir, '.faber')
+        if not os.path.exists(fdir):
+            os.makedirs(fdir)
+        self.filename = os.path.join(fdir, 'timings')
+        self.conn = sqlite3.connect(self.filename)
+        # (Re-)create table if it doesn't exist yet or is outdated.
+        columns = tuple(c[1] for c in self.conn.execute('PRAGMA table_info(timings)'))
+        if columns != timings.columns:
+            self.conn.execute('DROP TABLE IF EXISTS timings')
+            self.conn.execute('CREATE TABLE timings (target TEXT PRIMARY KEY, '
+                              'action TEXT, tool TEXT, module TEXT, '
+                              'wall REAL, cpu REAL, rss INTEGER)')
+        self._entries = {r[0]: r[1:] for r in self.conn.execute('SELECT * FROM timings')}
+
+    def finish(self):
+        if self.conn:
+            self.conn.commit()
+            self.conn.close()
+            self.conn = None
+
+    def mean(self):
+        """Return the mean duration of all recorded updates (or None)."""
+        if not self._entries:
+            return None
+        return sum(e[3] for e in self._entries.values()) / len(self._entries)
+
+    def mean_rss(self):
+        """Return the mean peak memory usage (in kB) of all recorded updates (or None)."""
+        rss = [e[5] for e in self._entries.values() if e[5] is not None]
+        return sum(rss) // len(rss) if rss else None
+
+    def get(self, target, default=None):
+        """Return the duration recorded for the given target."""
+        entry = self._entries.get(target)
+        return entry[3] if entry else default
+
+    def rss(self, target, default=None):
+        """Return the peak memory usage (in kB) recorded for the given target."""
+        entry = self._entries.get(target)
+        return entry[5] if entry and entry[5] is not None else default
+
+    def __iter__(self):
+        """Iterate over all records, as (target, action, tool, module, wall, cpu, rss) tuples."""
+        return iter((t,) + e for t, e in self._entries.items())
+
+    def __setitem__(self, target, value):
+        """Record a (action, tool, module, wall, cpu, rss) tuple for target."""
+        self._entries[target] = tuple(value)
+        self.conn.execute('INSERT OR REPLACE INTO timings VALUES(?,?,?,?,?,?,?)',
+                          (target,) + tuple(value))
+
+
+class probes(object):
+    """Record the output of commands run to discover a tool's properties
+    (version, target machine, etc.), keyed by the command line, the
+    executable's path, size, and modification time, as well as any
+    environment variables the result depends on."""
+
+    def __init__(self, builddir):
+        fdir = os.path.join(builddir, '.faber')
+        if not os.path.exists(fdir):
+            os.makedirs(fdir)
+        self.filename = os.path.join(fdir, 'probes')
+        self.conn = sqlite3.connect(self.filename)
+        # Create table if it doesn't exist yet.
+        if not next(self.conn.execute('SELECT name FROM sqlite_master '
+                                      'WHERE type="table" AND name="probes"'), None):
+            self.conn.execute('CREATE TABLE probes (key TEXT PRIMARY KEY, output TEXT)')
+
+    def finish(self):
+        if self.conn:
+            self.conn.commit()
+            self.conn.close()
+            self.conn = None
+
+    @staticmethod
+    def key(executable, cmd, env=()):
+        """Return the key for running `cmd` using `executable`, or None
+        if the executable can't be found."""
+        try:
+            st = os.stat(executable)
+        except (OSError, TypeError):
+            return None
+        key = [executable, st.st_size, st.st_mtime_ns, list(cmd)]
+        key += [(v, os.environ.get(v)) for v in env]
+        return hashlib.md5(repr(key).encode('utf-8')).hexdigest()
+
+    def __getitem__(self, key):
+        row = next(self.conn.execute('SELECT output FROM probes WHERE key=?', (key,)), None)
+        return row[0] if row else None
+
+    def __setitem__(self, key, output):
+        self.conn.execute('INSERT OR REPLACE INTO probes VALUES(?,?)', (key, output))
+
+
+class _store(object):
+    """Common base for stores of generated files, keeping track of hits and misses."""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+
+class artefactcache(_store):
+    """Store generated files by a key computed from the command and inputs
+    that generated them, so they can be retrieved rather than regenerated,
+    even in other build directories. Entries are evicted in least-recently-used
+    order whenever the cache grows beyond its maximum size.
+
+    Files are copied in and out of the cache, rather than linked, as tools
+    may update their outputs in place."""
+
+    def __init__(self, directory, max_size=5 << 30):
+        _store.__init__(self)
+        self.root = directory
+        self.max_size = max_size
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        self.conn = sqlite3.connect(os.path.join(directory, 'index'), timeout=60)
+        # Create table if it doesn't exist yet.
+        if not next(self.conn.execute('SELECT name FROM sqlite_master '
+                                      'WHERE type="table" AND name="entries"'), None):
+            self.conn.execute('CREATE TABLE entries (key TEXT PRIMARY KEY, files INTEGER, '
+                              'size INTEGER, atime REAL, stdout TEXT, stderr TEXT)')
+            self.conn.commit()
+
+    def finish(self):
+        if self.conn:
+            self.evict()
+            self.conn.close()
+            self.conn = None
+
+    def _path(self, key, i):
+        return os.path.join(self.root, key[:2], '{}.{}'.format(key, i))
+
+    @staticmethod
+    def _copy(src, dst):
+        # copy to a temporary first, so no one ever sees a partial file
+        tmp = '{}.{}.tmp'.format(dst, os.getpid())
+        try:
+            shutil.copy(src, tmp)
+            os.replace(tmp, dst)
+        except Exception:
+            if os.path.lexists(tmp):
+                os.remove(tmp)
+            raise
+
+    def retrieve(self, key, filenames):
+        """Copy the files stored under `key` to `filenames`, and return
+        the (stdout, stderr) tuple recorded with them. Return None
+        if there is no (complete) entry for `key`."""
+
+        with self.conn:
+            row = next(self.conn.execute('SELECT files, stdout, stderr FROM entries '
+                                         'WHERE key=?', (key,)), None)
+            if row and row[0] == len(filenames):
+                try:
+                    for i, f in enumerate(filenames):
+                        self._copy(self._path(key, i), f)
+                except OSError:
+                    row = None
+                else:
+                    self.conn.execute('UPDATE entries SET atime=? WHERE key=?',
+                                      (time.time(), key))
+            else:
+                row = None
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row[1], row[2]
+
+    def store(self, key, filenames, stdout='', stderr=''):
+        """Store copies of `filenames` under `key`."""
+
+        os.makedirs(os.path.dirname(self._path(key, 0)), exist_ok=True)
+        size = 0
+        for i, f in enumerate(filenames):
+            self._copy(f, self._path(key, i))
+            size += os.path.getsize(f)
+        with self.conn:
+            self.conn.execute('INSERT OR REPLACE INTO entries VALUES(?,?,?,?,?,?)',
+                              (key, len(filenames), size, time.time(), stdout, stderr))
+
+    def evict(self):
+        """Remove least recently used entries until the cache's size
+        doesn't exceed its maximum."""
+
+        with self.conn:
+            size = self.conn.execute('SELECT TOTAL(size) FROM entries').fetchone()[0]
+            if size <= self.max_size:
+                return
+            for key, files, s in list(self.conn.execute('SELECT key, files, size FROM entries '
+                                                        'ORDER BY atime')):
+                for i in range(files):
+                    try:
+                        os.remove(self._path(key, i))
+                    except OSError:
+                        pass
+                self.conn.execute('DELETE FROM entries WHERE key=?', (key,))
+                size -= s
+                if size <= self.max_size:
+                    break
+
+
+class remotecache(_store):
+    """Retrieve generated files from (and store them in) a cache shared over HTTP
+    (see :mod:`faber.cacheserver`). The result of generating files is recorded
+    under `/ac/<key>`, referring to the content of each file, which is stored
+    under `/cas/<sha256 digest>`.
+
+    Uploads happen in the background. So they never stall the build, files
+    are dropped rather than queued while too much data is pending.
+    After a connection failure the cache isn't consulted again."""
+
+    def __init__(self, url, max_pending=256 << 20, timeout=10):
+        _store.__init__(self)
+        self.url = url.rstrip('/')
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.pending = 0
+        self.failed = False
+        self._lock = threading.Lock()
+        self._uploads = ThreadPoolExecutor(max_workers=2)
+
+    def finish(self):
+        # let pending uploads complete
+        self._uploads.shutdown()
+
+    def _request(self, path, data=None, method='GET'):
+        request = urllib.request.Request(self.url + path, data=data, method=method)
+        return urllib.request.urlopen(request, timeout=self.timeout)
+
+    def _fail(self, e):
+        if not self.failed:
+            logger.warning('unable to use remote cache {}: {}'.format(self.url, e))
+            self.failed = True
+
+    def _download(self, digest, mode, filename):
+        """Stream the blob `digest` into `filename`, verifying its content."""
+
+        tmp = '{}.{}.tmp'.format(filename, threading.get_ident())
+        h = hashlib.sha256()
+        try:
+            with self._request('/cas/' + digest) as r, open(tmp, 'wb') as f:
+                for chunk in iter(lambda: r.read(1 << 16), b''):
+                    h.update(chunk)
+                    f.write(chunk)
+            if h.hexdigest() != digest:
+                raise ValueError('corrupt blob {}'.format(digest))
+            os.chmod(tmp, mode)
+            os.replace(tmp, filename)
+        except Exception:
+            if os.path.lexists(tmp):
+                os.remove(tmp)
+            raise
+
+    def retrieve(self, key, filenames):
+        """Download the files stored under `key` to `filenames`, and return
+        the (stdout, stderr) tuple recorded with them. Return None
+        if there is no (complete) entry for `key`.
+        This may be called from multiple threads concurrently."""
+
+        output = None
+        if not self.failed:
+            try:
+                with self._request('/ac/' + key) as r:
+                    result = json.loads(r.read().decode('utf-8'))
+                if len(result['files']) == len(filenames):
+                    for (digest, mode), f in zip(result['files'], filenames):
+                        self._download(digest, mode, f)
+                    output = result['stdout'], result['stderr']
+            except urllib.error.HTTPError:
+                pass  # most likely not found
+            except (urllib.error.URLError, socket.timeout) as e:
+                self._fail(e)
+            except (OSError, ValueError, KeyError) as e:
+                logger.info('unable to retrieve {} from remote cache: {}'.format(key, e))
+        with self._lock:
+            if output is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return output
+
+    def store(self, key, filenames, stdout='', stderr=''):
+        """Schedule the upload of `filenames` under `key`."""
+
+        if self.failed:
+            return
+        size = sum(os.path.getsize(f) for f in filenames)
+        with self._lock:
+            if self.pending + size > self.max_pending:
+                logger.info('too many pending uploads, not uploading {}'.format(key))
+                return
+            self.pending += size
+        # read the files now, as they may be modified (or removed) before they are uploaded
+        blobs = []
+        for f in filenames:
+            with open(f, 'rb') as fh:
+                data = fh.read()
+            blobs.append((hashlib.sha256(data).hexdigest(), os.stat(f).st_mode & 0o777, data))
+        self._uploads.submit(self._upload, key, blobs, stdout, stderr, size)
+
+    def _upload(self, key, blobs, stdout, stderr, size):
+        try:
+            for digest, _, data in blobs:
+                try:  # don't upload blobs the cache already holds
+                    self._request('/cas/' + digest, method='HEAD').close()
+                except urllib.error.HTTPError:
+                    self._request('/cas/' + digest, data, 'PUT').close()
+            result = dict(files=[[d, m] for d, m, _ in blobs], stdout=stdout, stderr=stderr)
+            self._request('/ac/' + key, json.dumps(result).encode('utf-8'), 'PUT').close()
+        except urllib.error.HTTPError as e:
+            logger.info('remote cache rejected {}: {}'.format(key, e))
+        except (urllib.error.URLError, socket.timeout) as e:
+            self._fail(e)
+        except (OSError, ValueError) as e:
+            logger.info('unable to upload {} to remote cache: {}'.format(key, e))
+        finally:
+            with self._lock:
+                self.pending -= size
@@ -0,0 +1,152 @@
+#
+# Copyright (c) 2018 Stefan Seefeld
+# All rights reserved.
+#
+# This file is part of Faber. It is made available under the
+# Boost Software License, Version 1.0.
+# (Consult LICENSE or http://www.boost.org/LICENSE_1_0.txt)
+
+"""A minimal server for a remote artefact cache (see :class:`faber.cache.remotecache`).
+
+It stores action results under `/ac/<key>`, and content-addressed blobs
+under `/cas/<sha256 digest>`, in a directory, and supports HEAD, GET,
+and PUT requests for both. Blobs are verified against their address, and
+action results are written once, i.e. can't be replaced by later uploads.
+Run it with::
+
+  python -m faber.cacheserver --port 8080 /path/to/cache
+
+It is meant as a reference, and for use on a trusted network only: it
+neither authenticates clients nor limits the size of the cache, and any
+client may store (wrong) results under keys not yet in the cache. It therefore
+only listens on `localhost`, unless another address is given with `--host`."""
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from os.path import join, exists, getsize, dirname, basename
+import socketserver
+import tempfile
+import argparse
+import hashlib
+import logging
+import shutil
+import re
+import os
+
+logger = logging.getLogger(__name__)
+
+_path = re.compile(r'^/(ac|cas)/([0-9a-f]{32,64})$')
+
+
+class handler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def _filename(self):
+        """Map the request path to a filename, or report an error and return None."""
+        m = _path.match(self.path)
+        if not m:
+            self.send_error(400)
+            return None
+        kind, name = m.groups()
+        return join(self.server.root, kind, name[:2], name)
+
+    def _get(self, body):
+        filename = self._filename()
+        if not filename:
+            return
+        if not exists(filename):
+            self.send_error(404)
+            return
+        with open(filename, 'rb') as f:
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/octet-stream')
+            self.send_header('Content-Length', str(getsize(filename)))
+            self.end_headers()
+            if body:
+                shutil.copyfileobj(f, self.wfile)
+
+    def do_HEAD(self):
+        self._get(False)
+
+    def do_GET(self):
+        self._get(True)
+
+    def do_PUT(self):
+        filename = self._filename()
+        if not filename:
+            return
+        length = int(self.headers.get('Content-Length', 0))
+        os.makedirs(dirname(filename), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=dirname(filename), suffix='.tmp')
+        h = hashlib.sha256()
+        try:
+            with open(fd, 'wb') as f:
+                while length:
+                    chunk = self.rfile.read(min(length, 1 << 16))
+                    if not chunk:
+                        raise ValueError('incomplete upload')
+                    h.update(chunk)
+                    f.write(chunk)
+                    length -= len(chunk)
+            if self.path.startswith('/cas/'):
+                # blobs are addressed by their content, so verify it
+                if h.hexdigest() != basename(filename):
+                    raise ValueError('digest mismatch')
+                os.replace(tmp, filename)
+            else:
+                # action results are written once (atomically, as another
+                # upload of the same key may be in progress)
+                try:
+                    os.link(tmp, filename)
+                except FileExistsError:
+                    self.send_error(409, 'entry exists')
+                    return
+        except ValueError as e:
+            self.send_error(400, str(e))
+            return
+        finally:
+            if exists(tmp):
+                os.remove(tmp)
+        self.send_response(201)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        logger.info(format, *args)
+
+
+class _server(socketserver.ThreadingMixIn, HTTPServer):
+
+    daemon_threads = True
+
+
+def server(root, host='localhost', port=0):
+    """Create a server storing its content in `root`. Use port 0
+    to have one assigned, and find it in the result's `server_port`."""
+
+    s = _server((host, port), handler)
+    s.root = os.path.abspath(root)
+    return s
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='serve a remote artefact cache')
+    parser.add_argument('root', metavar='DIR', help='the directory to store the cache in')
+    parser.add_argument('--host', default='localhost',
+                        help='the address to listen on (use \'\' for all interfaces)')
+    parser.add_argument('--port', type=int, default=8080, help='the port to listen on')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    with server(args.root, args.host, args.port) as s:
+        logger.info('serving {} on port {}'.format(s.root, s.server_port))
+        try:
+            s.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    return True
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(0 if main() else 1)
@@ -58,12 +58,33 @@ def make_parser():
                           help='set log level (summary=1, actions=2, commands=4)')
     log_args.add_argument('-s', '--silent', action='store_true',
                           help='suppress all output')
-    parser.add_argument('-j', '--parallel', type=int, default=1,
+    parser.add_argument('-j', '--parallel', type=int,
                         help='set concurrency level')
+    parser.add_argument('--jobserver', action='store_true',
+                        help='share the concurrency level with sub-makes as a GNU make jobserver')
+    parser.add_argument('--max-load', type=float, metavar='LOAD',
+                        help='do not start new jobs while the load average is at least LOAD')
+    parser.add_argument('--max-memory', type=int, metavar='MB',
+                        help='limit the memory concurrent jobs are expected to use')
     parser.add_argument('--debug', action='store_true',
                         help='do not suppress traceback on error')
     parser.add_argument('-f', '--force', action='store_true',
                         help='update goals even if they are current')
+    parser.add_argument('--signatures', action='store_true',
+                        help='compare content signatures rather than timestamps only')
+    parser.add_argument('--cache', metavar='DIR',
+                        help='retrieve artefacts from (and store them in) the given cache')
+    parser.add_argument('--cache-size', type=int, metavar='MB',
+                        help='the maximum size of the cache (default: 5 GB)')
+    parser.add_argument('--remote-cache', metavar='URL',
+                        help='retrieve artefacts from (and store them in) the given '
+                        'remote cache (see faber.cacheserver)')
+    parser.add_argument('--workers', metavar='WORKERS', type=lambda w: w.split(','),
+                        help='run hermetic actions (such as compilations) on the given '
+                        'comma-separated list of workers (host:port, or local; see faber.worker)')
+    parser.add_argument('--snapshot', action='store_true',
+                        help='record the evaluated dependency graph, and skip evaluating it '
+                        'if it shows that nothing needs to be updated')
     parser.add_argument('-n', '--noexec', action='store_true',
                         help='do not actually execute actions')
     parser.add_argument('-i', '--intermediates', action='store_true',
@@ -74,10 +95,19 @@ def make_parser():
                         help='set timeout for individual actions')
     parser.add_argument('-p', '--profile', action='store_true',
                         help='log timing info with command')
-    parser.add_argument('--info', choices=['goals', 'tools'], nargs='?', metavar='WHAT', const='goals',
+    parser.add_argument('--trace', metavar='FILE',
+                        help='write a trace of the build in Chrome trace-event format')
+    parser.add_argument('--info', choices=['goals', 'tools', 'timings'], nargs='?', metavar='WHAT', const='goals',
                         help='print information about the build logic')
+    parser.add_argument('--generate', choices=['ninja', 'compdb'],
+                        help='write a build file for ninja, or a compilation database '
+                        '(compile_commands.json), rather than performing a build')
     parser.add_argument('--shell', action='store_true',
                         help='run interactive shell')
+    parser.add_argument('--watch', action='store_true',
+                        help='rebuild whenever a source or fabscript changes')
+    parser.add_argument('--daemon', action='store_true',
+                        help='keep the project loaded and serve build requests from faber-client')
     parser.add_argument('-v', '--version', action='version', version=faber.__version__)
     return parser
 
@@ -129,15 +159,33 @@ def main():
         info.options = args.options
         proj = project.project(info,
                                parallel=args.parallel, force=args.force,
+                               jobserver=args.jobserver,
                                intermediates=args.intermediates,
                                timeout=args.timeout,
-                               noexec=args.noexec)
+                               noexec=args.noexec,
+                               signatures=args.signatures,
+                               cache=args.cache and os.path.abspath(args.cache),
+                               cache_size=args.cache_size,
+                               remote_cache=args.remote_cache,
+                               workers=args.workers,
+                               snapshot=args.snapshot,
+                               trace=args.trace,
+                               max_load=args.max_load,
+                               max_memory=args.max_memory)
         if args.info:
             result = proj.info(args.info, args.goals)
+        elif args.generate:
+            result = proj.generate(args.generate, args.goals)
         elif args.shell:
             result = proj.shell()
         elif args.clean:
             result = proj.clean(args.clean)
+        elif args.watch:
+            from . import watch
+            result = watch.watch(proj, args.goals)
+        elif args.daemon:
+            from . import daemon
+            result = daemon.serve(proj)
         else:
             result = proj.build(args.goals)
         return result
@@ -158,4 +206,5 @@ def cli_main():
 
 
 if __name__ == "__main__":
-    main()
+    import sys
+    sys.exit(cli_main())
@@ -0,0 +1,63 @@
+#
+# Copyright (c) 2018 Stefan Seefeld
+# All rights reserved.
+#
+# This file is part of Faber. It is made available under the
+# Boost Software License, Version 1.0.
+# (Consult LICENSE or http://www.boost.org/LICENSE_1_0.txt)
+
+"""A thin client submitting build requests to a running `faber --daemon`.
+
+This module deliberately avoids importing the rest of faber, to keep
+its startup time to a minimum."""
+
+from os.path import join, abspath
+import argparse
+import socket
+import array
+import json
+import sys
+
+
+def request(builddir, **kwds):
+    """Send a request to the daemon serving `builddir` and return its result.
+    The daemon writes any output directly to our stdout and stderr."""
+
+    sys.stdout.flush()
+    sys.stderr.flush()
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.connect(join(abspath(builddir), '.faber', 'daemon'))
+        fds = array.array('i', [sys.stdout.fileno(), sys.stderr.fileno()])
+        s.sendmsg([json.dumps(kwds).encode()], [(socket.SOL_SOCKET, socket.SCM_RIGHTS, fds)])
+        s.shutdown(socket.SHUT_WR)
+        reply = b''.join(iter(lambda: s.recv(4096), b''))
+    return json.loads(reply.decode())['result']
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='Submit a request to a running faber daemon.')
+    parser.add_argument('goals', metavar='GOAL', nargs='*',
+                        help='a goal to update')
+    parser.add_argument('--builddir', default='.',
+                        help='the location of the build directory')
+    parser.add_argument('--stop', action='store_true',
+                        help='stop the daemon')
+    args = parser.parse_args(argv)
+    try:
+        if args.stop:
+            return request(args.builddir, command='stop')
+        else:
+            return request(args.builddir, command='build', goals=args.goals)
+    except OSError as e:
+        print('Error: unable to contact daemon: {}'.format(e))
+        return False
+
+
+def cli_main():
+    """Convert boolean result to process exit status."""
+    return 0 if main() else 1
+
+
+if __name__ == "__main__":
+    sys.exit(cli_main())
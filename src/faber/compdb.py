@@ -0,0 +1,62 @@
+#
+# Copyright (c) 2018 Stefan Seefeld
+# All rights reserved.
+#
+# This file is part of Faber. It is made available under the
+# Boost Software License, Version 1.0.
+# (Consult LICENSE or http://www.boost.org/LICENSE_1_0.txt)
+
+"""Write a compilation database (https://clang.llvm.org/docs/JSONCompilationDatabase.html),
+as used by clangd, clang-tidy, and other tools, listing the commands of
+all compile recipes the goals depend on."""
+
+from .config.check import check
+from .tools.compiler import compiler
+from . import scheduler
+from os.path import abspath, exists
+import json
+import os
+
+
+def _compiles(action):
+    return action.name == 'compile' and isinstance(action.tool, compiler)
+
+
+def entries(goals, directory=None):
+    """Return the database entries for `goals`, sorted by file."""
+
+    directory = abspath(directory or os.getcwd())
+    entries = {}
+    # config checks are not part of the build proper
+    for _, _, r in scheduler.walk(goals, skip=lambda a: isinstance(a, check)):
+        if r and _compiles(r[0]):
+            _, cmd, targets, sources = r
+            output = abspath(targets[0].boundname)
+            entries[output] = dict(directory=directory,
+                                   file=abspath(sources[0].boundname),
+                                   command=cmd,
+                                   output=output)
+    return sorted(entries.values(), key=lambda e: (e['file'], e['output']))
+
+
+def write(filename, goals):
+    """Write the database for `goals` to `filename`, unless it is unchanged
+    (so tools watching it don't reload it needlessly).
+    Return the number of entries added, changed, or removed."""
+
+    new = entries(goals)
+    old = []
+    if exists(filename):
+        try:
+            with open(filename) as f:
+                old = json.load(f)
+        except ValueError:
+            pass  # rewrite corrupt files
+    known = {e.get('output'): e for e in old if isinstance(e, dict)}
+    changes = sum(1 for e in new if known.pop(e['output'], None) != e) + len(known)
+    if changes or not exists(filename):
+        tmp = filename + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(new, f, indent=2)
+        os.replace(tmp, filename)
+    return changes
@@ -0,0 +1,183 @@
+#
+# Copyright (c) 2018 Stefan Seefeld
+# All rights reserved.
+#
+# This file is part of Faber. It is made available under the
+# Boost Software License, Version 1.0.
+# (Consult LICENSE or http://www.boost.org/LICENSE_1_0.txt)
+
+"""A long-running build server keeping the project loaded between builds.
+
+Requests arrive over a unix socket in the build directory (see :mod:`faber.client`).
+A client passes its stdout and stderr along with the request, so the build output
+appears in the client's terminal, and receives the build's result in return."""
+
+from . import scheduler
+from . import config as C
+from .module import module
+from .artefact import artefact
+from .artefacts.include_scan import add_reported_headers
+from contextlib import contextmanager
+from os.path import join, exists, getmtime
+import socket
+import array
+import json
+import logging
+import sys
+import os
+
+logger = logging.getLogger('scheduler')
+
+
+def address(builddir):
+    """Return the socket address of a daemon serving `builddir`."""
+    return join(os.path.abspath(builddir), '.faber', 'daemon')
+
+
+def supported():
+    return (hasattr(socket, 'AF_UNIX') and hasattr(socket, 'SCM_RIGHTS') and
+            hasattr(socket.socket, 'sendmsg'))
+
+
+def _recv_fds(sock, size, maxfds):
+    """Receive a message of up to `size` bytes, together with up to `maxfds`
+    file descriptors, and return both."""
+    fds = array.array('i')
+    msg, ancdata, _, _ = sock.recvmsg(size, socket.CMSG_LEN(maxfds * fds.itemsize))
+    for level, type, data in ancdata:
+        if level == socket.SOL_SOCKET and type == socket.SCM_RIGHTS:
+            fds.frombytes(data[:len(data) - (len(data) % fds.itemsize)])
+    return msg, list(fds)
+
+
+def _mtime(filename):
+    try:
+        return getmtime(filename)
+    except OSError:
+        return None
+
+
+@contextmanager
+def _redirect(fds):
+    """Temporarily redirect our own stdout and stderr to `fds`."""
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved = [os.dup(1), os.dup(2)]
+    os.dup2(fds[0], 1)
+    os.dup2(fds[1], 2)
+    try:
+        yield
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.dup2(saved[0], 1)
+        os.dup2(saved[1], 2)
+        for fd in saved + fds:
+            os.close(fd)
+
+
+class daemon(object):
+    """Hold a project's module, tool, and artefact graph between builds.
+    The graph is reloaded if any of the fabscripts it was built from
+    changed, otherwise only the artefacts' state is reset, so a new build
+    merely has to re-stat its inputs."""
+
+    def __init__(self, project):
+        self.project = project
+        self.root = None
+        self.scripts = {}
+
+    def stale(self):
+        if self.root is None:
+            return True
+        return any(_mtime(s) != m for s, m in self.scripts.items())
+
+    def load(self):
+        """(Re-)load the project's fabscripts."""
+        self.unload()
+        logger.info('loading project from {}'.format(self.project.srcdir))
+        self.project.__enter__()
+        try:
+            self.root = module('', self.project.srcdir, self.project.builddir)
+        except Exception:
+            self.project.__exit__(None, None, None)
+            raise
+        scripts = [join(m.srcdir, 'fabscript') for m in module._instances.values()]
+        self.scripts = {s: _mtime(s) for s in scripts}
+
+    def unload(self):
+        if self.root is not None:
+            C.finish()
+            module.finish()
+            self.root = None
+
+    def build(self, goals):
+        if self.stale():
+            self.load()
+        else:
+            scheduler.start(self.project.parameters, self.project.builddir,
+                            **self.project.sched_opts)
+            scheduler.reset()
+            # headers found by scanning are added to the graph as they are found,
+            # while those reported by compilers need to be added now
+            for a in artefact.iter():
+                if a.depfile:
+                    add_reported_headers(a)
+        try:
+            return self.project.update(self.root, goals)
+        finally:
+            scheduler.finish()
+
+    def handle(self, conn):
+        """Handle a single request. Return False if the daemon should stop."""
+
+        msg, fds = _recv_fds(conn, 65536, 2)
+        request = json.loads(msg.decode()) if msg else {}
+        if request.get('command') == 'stop' or len(fds) != 2:
+            for fd in fds:
+                os.close(fd)
+            stop = request.get('command') == 'stop'
+            conn.sendall(json.dumps(dict(result=stop)).encode())
+            return not stop
+        with _redirect(fds):
+            try:
+                result = self.build(request.get('goals'))
+            except Exception as e:
+                print('Error: {}'.format(e))
+                result = False
+        conn.sendall(json.dumps(dict(result=bool(result))).encode())
+        return True
+
+    def close(self):
+        self.unload()
+
+
+def serve(project):
+    """Serve build requests for `project` until asked to stop."""
+
+    if not supported():
+        raise RuntimeError('daemon mode is not supported on this platform')
+    path = address(project.builddir)
+    if exists(path):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+            try:
+                s.connect(path)
+            except OSError:
+                os.remove(path)  # left behind by a daemon that didn't shut down cleanly
+            else:
+                raise RuntimeError('a daemon is already serving {}'.format(project.builddir))
+    d = daemon(project)
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.bind(path)
+        s.listen()
+        logger.info('listening on {}'.format(path))
+        try:
+            running = True
+            while running:
+                conn, _ = s.accept()
+                with conn:
+                    running = d.handle(conn)
+        finally:
+            d.close()
+            os.remove(path)
+    return True
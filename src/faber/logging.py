@@ -31,7 +31,7 @@ class ProfileFormatter(logging.Formatter):
         s = super(ProfileFormatter, self).format(record)
         time = record.time if hasattr(record, 'time') else -1.
         if time >= 0.:
-            s += '\t (time={} s)'.format(time)
+            s += '\t (time={:.3f} s)'.format(time)
         return s
 
 
@@ -0,0 +1,242 @@
+#
+# Copyright (c) 2018 Stefan Seefeld
+# All rights reserved.
+#
+# This file is part of Faber. It is made available under the
+# Boost Software License, Version 1.0.
+# (Consult LICENSE or http://www.boost.org/LICENSE_1_0.txt)
+
+"""Write a ninja (https://ninja-build.org) build file, so goals can be
+updated by ninja (or tools driving it) rather than by faber itself.
+
+The file reflects the dependency graph of the loaded project, with all
+commands fully substituted. Headers are tracked through dependency files:
+objects whose compiler writes one (see :func:`faber.artefacts.include_scan.depfile`)
+use that, as long as ninja can read it (i.e. commands run in the build
+directory). For all others, ninja runs faber's include scanner (see
+:func:`scan`) before compiling, so headers included later are picked up, too.
+Actions implemented in Python have no command ninja could run, so ninja
+runs faber to perform them. The file is regenerated whenever one of the
+project's fabscripts changes."""
+
+from .artefact import nopropagate
+from .artefacts.include_scan import scan as scan_artefact, includes, ComputedInclude
+from .config.check import check
+from . import scheduler
+from os.path import abspath, relpath, join, splitext
+import argparse
+import shlex
+import sys
+import os
+
+
+def escape(value):
+    """Escape `value` for use in a variable binding."""
+    return value.replace('$', '$$')
+
+
+def escape_path(path):
+    """Escape `path` for use in a build statement."""
+    return escape(path).replace(' ', '$ ').replace(':', '$:')
+
+
+def _skip(a):
+    """Tell whether `a` is taken care of by faber itself while generating
+    (such as header scans and config checks), and is therefore not written."""
+    return bool(a.attrs & nopropagate) or isinstance(a, (scan_artefact, check))
+
+
+def _path(filename, builddir):
+    """Return `filename` as named in a build file in `builddir`."""
+    path = abspath(filename)
+    # files outside the build directory are referred to by absolute paths
+    if path.startswith(join(builddir, '')):
+        path = relpath(path, builddir)
+    return path.replace('\\', '/')
+
+
+def _escape_make(path):
+    """Escape `path` for use in a (make-style) dependency file."""
+    return path.replace('$', '$$').replace('#', '\\#').replace(' ', '\\ ')
+
+
+def scan(output, target, sources, paths, builddir):
+    """Write a dependency file `output` for `target` (as named in the build file),
+    listing the headers `sources` include (see :func:`faber.artefacts.include_scan.includes`)."""
+
+    headers = []
+    for s in sources:
+        try:
+            headers += [h for h in includes(s, paths) if h not in headers]
+        except ComputedInclude:
+            print('warning: unable to track headers included by {}'.format(s), file=sys.stderr)
+    deps = [_escape_make(_path(h, builddir)) for h in headers]
+    with open(output, 'w') as f:
+        f.write(' \\\n  '.join(['{}:'.format(_escape_make(target))] + deps) + '\n')
+
+
+class writer(object):
+
+    def __init__(self, builddir, cwd=None):
+        self.builddir = abspath(builddir)
+        # the directory commands (and their filenames) are relative to
+        self.cwd = abspath(cwd or os.getcwd())
+        self.lines = []
+        self.outputs = set()
+        self.phonies = {}
+
+    def path(self, a):
+        """Return the name of `a` (an artefact or filename) in the build file."""
+        if not isinstance(a, str):
+            if not a.isfile:
+                return a.qname
+            a = a.boundname
+        return _path(a, self.builddir)
+
+    def command(self, cmd):
+        """Return `cmd` ready to be run from the build directory."""
+        cmd = '; '.join([l for l in cmd.splitlines() if l.strip()])
+        if self.cwd != self.builddir:
+            cmd = 'cd {} && {}'.format(shlex.quote(self.cwd), cmd)
+        return cmd
+
+    def python(self, module, *args):
+        """Return a command running `module` with this interpreter."""
+        argv = [sys.executable, '-m', module] + list(args)
+        return self.command(' '.join([shlex.quote(a) for a in argv]))
+
+    def faber(self, srcdir, builddir, *args):
+        """Return a command running faber on the same project."""
+        return self.python('faber.cli', '--srcdir=' + abspath(srcdir),
+                           '--builddir=' + abspath(builddir), *args)
+
+    def variable(self, name, value, indent=0):
+        self.lines.append('{}{} = {}'.format('  ' * indent, name, escape(value)))
+
+    def build(self, outputs, rule, inputs=[], implicit=[], **variables):
+        line = 'build {}: {}'.format(' '.join([escape_path(o) for o in outputs]), rule)
+        if inputs:
+            line += ' ' + ' '.join([escape_path(i) for i in inputs])
+        if implicit:
+            line += ' | ' + ' '.join([escape_path(i) for i in implicit])
+        self.lines.append(line)
+        for k, v in sorted(variables.items()):
+            self.variable(k, v, 1)
+
+    def rule(self, name, **variables):
+        self.lines.append('rule {}'.format(name))
+        for k, v in sorted(variables.items()):
+            self.lines.append('  {} = {}'.format(k, v))
+        self.lines.append('')
+
+    def scan(self, target, sources):
+        """Write the build statement scanning `sources` of `target` for headers,
+        and return the name of the dependency file it writes. Ninja reads that
+        to tell when to scan again, and `target` depends on it."""
+
+        depfile = self.path(splitext(target.boundname)[0] + '.ninja.d')
+        fs = target.features
+        paths = fs.include._value if 'include' in fs else []
+        args = ['--builddir={}'.format(self.builddir)] + ['--include={}'.format(p) for p in paths]
+        args += [abspath(join(self.builddir, depfile)), depfile] + [s.boundname for s in sources]
+        self.build([depfile], 'scan', [self.path(s) for s in sources],
+                   cmd=self.python('faber.ninja', *args), desc='scan ' + target.name)
+        return depfile
+
+    def edge(self, action, cmd, targets, sources, prerequisites, context):
+        """Write the build statement for a recipe."""
+
+        outputs = [self.path(t) for t in targets]
+        if any(o in self.outputs for o in outputs):
+            return  # (the same artefact in multiple variants)
+        self.outputs.update(outputs)
+        inputs = [self.path(s) for s in sources if not _skip(s)]
+        implicit = set([self.path(p) for p in prerequisites if not _skip(p)])
+        implicit = sorted(implicit - set(inputs) - set(outputs))
+        desc = '{} {}'.format(action.qname, targets[0].name)
+        depfile = any(t.depfile for t in targets)
+        if callable(action.command):
+            self.build(outputs, 'faber', inputs, implicit,
+                       cmd=self.faber(*context, targets[0].qname), desc=desc)
+        elif depfile and self.cwd == self.builddir:
+            # (ninja reads the dependency file relative to the build directory)
+            depfile = [splitext(t.boundname)[0] + '.d' for t in targets if t.depfile][0]
+            self.build(outputs, 'run_depfile', inputs, implicit,
+                       cmd=self.command(cmd), desc=desc, depfile=self.path(depfile))
+        else:
+            if depfile or any(isinstance(p, scan_artefact) for p in prerequisites):
+                implicit.append(self.scan(targets[0], [s for s in sources if not _skip(s)]))
+            self.build(outputs, 'run', inputs, implicit, cmd=self.command(cmd), desc=desc)
+
+    def write(self, filename, goals, scripts, srcdir, builddir, args):
+
+        graph = list(scheduler.walk(goals))
+        prerequisites = {a: p for a, p, _ in graph}
+        self.lines += ['# generated by faber - do not edit', '',
+                       'ninja_required_version = 1.3', '']
+        self.rule('run', command='$cmd', description='$desc')
+        self.rule('run_depfile', command='$cmd', description='$desc',
+                  depfile='$depfile', deps='gcc')
+        # (the dependency file is an output, and thus not ingested by ninja)
+        self.rule('scan', command='$cmd', description='$desc', depfile='$out')
+        # faber keeps its own state in the build directory, so only run one at a time
+        self.lines += ['pool faber', '  depth = 1', '']
+        self.rule('faber', command='$cmd', description='$desc', pool='faber')
+        self.rule('regenerate', command='$cmd', description='regenerating $out',
+                  generator='1')
+        context = srcdir, builddir
+        self.build([self.path(filename)], 'regenerate', sorted(set(self.path(s) for s in scripts)),
+                   cmd=self.faber(*context, '--generate=ninja', *args))
+        self.lines.append('')
+        reachable, stack = set(goals), list(goals)
+        while stack:
+            for p in prerequisites[stack.pop()]:
+                if p not in reachable and not _skip(p):
+                    reachable.add(p)
+                    stack.append(p)
+        done = set()
+        for a, _, r in graph:
+            if a not in reachable:
+                continue
+            if r:
+                action, cmd, targets, sources = r
+                if tuple(targets) in done:
+                    continue
+                done.add(tuple(targets))
+                deps = [p for t in targets for p in prerequisites.get(t, [])]
+                self.edge(action, cmd, targets, sources, deps, context)
+            elif not a.isfile:
+                self.phonies.setdefault(a.qname, set()).update(
+                    [self.path(p) for p in prerequisites[a] if not _skip(p)])
+        for name, inputs in sorted(self.phonies.items()):
+            if name not in self.outputs:
+                self.build([name], 'phony', sorted(inputs))
+        self.lines += ['', 'default {}'.format(' '.join([escape_path(self.path(g)) for g in goals]))]
+        with open(filename, 'w') as f:
+            f.writelines([l + '\n' for l in self.lines])
+
+
+def write(filename, goals, scripts, srcdir, builddir, args=()):
+    """Write a ninja build file updating `goals` to `filename`, which is
+    regenerated whenever one of the fabscripts in `scripts` changes.
+    Precondition: the project is loaded and `goals` have been (dry-)run."""
+
+    writer(builddir).write(filename, goals, scripts, srcdir, builddir, args or [])
+
+
+def main(argv=None):
+    """Run the include scanner on behalf of ninja (see :func:`scan`)."""
+
+    parser = argparse.ArgumentParser(description='scan sources for headers')
+    parser.add_argument('output', help='the dependency file to write')
+    parser.add_argument('target', help='the target of the dependency file')
+    parser.add_argument('sources', nargs='+', help='the sources to scan')
+    parser.add_argument('--builddir', default='.', help='the directory ninja runs in')
+    parser.add_argument('--include', action='append', default=[], help='an include path')
+    args = parser.parse_args(argv)
+    scan(args.output, args.target, args.sources, args.include, abspath(args.builddir))
+    return True
+
+
+if __name__ == '__main__':
+    sys.exit(0 if main() else 1)
@@ -13,6 +13,7 @@ from .feature.condition import expr as fexpr
 from .artefact import artefact, init as artefact_init
 from .assembly import init as assembly_init
 from .module import module
+from .tool import tool
 from .error import error_reporter
 from .utils import aslist
 from . import config as C
@@ -132,12 +133,14 @@ class project(object):
         self.options = options(info.options)
         self.parameters = dict(info.parameters.items())
         info.store()
+        self.snapshot = kwds.pop('snapshot', False)
         self.sched_opts = kwds
 
     def __enter__(self):
         artefact_init()
         scheduler.init(self.parameters, self.builddir, **self.sched_opts)
         module.init(self.options, self.parameters)
+        tool.init(self.builddir)
         C.init(self.builddir)
         return self
 
@@ -149,39 +152,95 @@ class project(object):
     def build(self, goals):
         """build the project, updating the given goals or any defaults if None."""
 
+        from . import snapshot
+        opts = self.sched_opts
+        use_snapshot = self.snapshot and not any(opts.get(o) for o in ('noexec', 'force', 'signatures'))
+        if use_snapshot and snapshot.current(self, goals):
+            return True
         with self:
             m = module('', self.srcdir, self.builddir)
-            if goals:
-                try:
-                    goals = [a for g in goals for a in artefact.lookup(g)]
-                except KeyError as e:
-                    print('don\'t know how to make {}'.format(e))
-                    goals = []
-                    result = False
-            else:
-                goals = aslist(m.default)
-                # if we pick up default goals, check their conditions first
-                deps = set([d for g in goals for d in g.features.dependencies()])
-                # (allow dependencies to fail)
-                scheduler.update(list(deps))
-
-                def check(a):
-                    if a.condition is None:
-                        return True
-                    elif isinstance(a.condition, fexpr):
-                        return a.condition(a.features.eval())
-                    else:
-                        return a.condition
-
-                # now filter by condition
-                goals = [g for g in goals if check(g)]
-                result = True
-            if goals:
-                result = scheduler.update(goals)
-            elif result:
+            result = self.update(m, goals)
+            if use_snapshot:
+                if result:
+                    snapshot.record(self, goals, self.select(m, goals))
+                else:
+                    snapshot.discard(self)
+            return result
+
+    def update(self, m, goals):
+        """update the given goals or any defaults of module `m` if None.
+        Precondition: the project is loaded."""
+
+        try:
+            goals = self.select(m, goals)
+        except KeyError as e:
+            print('don\'t know how to make {}'.format(e))
+            return False
+        if goals:
+            return scheduler.update(goals)
+        print('no goals given and no "default" artefact defined - nothing to do.')
+        return True
+
+    def select(self, m, goals):
+        """Return the artefacts for the given goals or, if None, the defaults
+        of module `m` whose conditions hold. Raise KeyError for unknown goals.
+        Precondition: the project is loaded."""
+
+        if goals:
+            return [a for g in goals for a in artefact.lookup(g)]
+        else:
+            goals = aslist(m.default)
+            # if we pick up default goals, check their conditions first
+            deps = set([d for g in goals for d in g.features.dependencies()])
+            # (allow dependencies to fail)
+            scheduler.update(list(deps))
+
+            def check(a):
+                if a.condition is None:
+                    return True
+                elif isinstance(a.condition, fexpr):
+                    return a.condition(a.features.eval())
+                else:
+                    return a.condition
+
+            # now filter by condition
+            return [g for g in goals if check(g)]
+
+    def generate(self, generator, goals):
+        """write a build file for `generator` ('ninja'), or a compilation database
+        ('compdb') in the build directory, rather than performing a build.
+        Parameters are the same as for the `build` function."""
+
+        from . import ninja, compdb
+        from .config.check import check
+        with self:
+            m = module('', self.srcdir, self.builddir)
+            try:
+                aa = self.select(m, goals)
+            except KeyError as e:
+                print('don\'t know how to make {}'.format(e))
+                return False
+            if not aa:
                 print('no goals given and no "default" artefact defined - nothing to do.')
-                result = True
-        return result
+                return True
+            # the build logic depends on the results of config checks, so perform them...
+            scheduler.update([a for a in artefact.iter() if isinstance(a, check)])
+            scheduler.finish()
+            # ...while a dry run of everything else completes the dependency graph
+            # (see faber.artefacts.composite), keeping intermediates
+            scheduler.start(self.parameters, self.builddir, noexec=True, intermediates=True)
+            if not scheduler.update(aa):
+                return False
+            if generator == 'compdb':
+                filename = join(self.builddir, 'compile_commands.json')
+                changes = compdb.write(filename, aa)
+                print('output written to {} ({} changes)'.format(filename, changes))
+            else:
+                filename = join(self.builddir, 'build.ninja')
+                scripts = [join(i.srcdir, 'fabscript') for i in module._instances.values()]
+                ninja.write(filename, aa, scripts, self.srcdir, self.builddir, goals)
+                print('output written to {}'.format(filename))
+            return True
 
     def clean(self, level):
         """Clean up file artefacts."""
@@ -200,22 +259,29 @@ class project(object):
 
         with self:
             result = True
+
+            def lookup(m):
+                nonlocal result
+                if not items:
+                    return aslist(m.default)
+                try:
+                    return [a for i in items for a in artefact.lookup(i)]
+                except KeyError as e:
+                    print('don\'t know how to make {}'.format(e))
+                    result = False
+                    return []
+
             if what == 'goals':
                 m = module('', self.srcdir, self.builddir)
                 print('known artefacts:')
                 for a in sorted(artefact.iter(), key=lambda a: a.qname):
                     print('  {}'.format(a.qname))
-                if items:
-                    try:
-                        goals = [a for i in items for a in artefact.lookup(i)]
-                    except KeyError as e:
-                        print('don\'t know how to make {}'.format(e))
-                        goals = []
-                        result = False
-                else:
-                    goals = aslist(m.default)
+                goals = lookup(m)
                 if goals:
                     scheduler.print_dependency_graph(goals)
+            elif what == 'timings':
+                m = module('', self.srcdir, self.builddir)
+                scheduler.print_timings(lookup(m))
             elif what == 'tools':
                 from . import tool
                 features = lazy_set(module.params.copy())
@@ -8,9 +8,13 @@
 
 import asyncio
 from enum import Enum, Flag, IntEnum
-from os.path import dirname, lexists
-from os import stat, makedirs, remove, rmdir
+from os.path import dirname, exists, lexists, splitext, abspath
+from os import remove, rmdir
 from collections import defaultdict
+from . import trace
+from . import depfile
+from . import fscache
+import hashlib
 import logging
 
 logger = logging.getLogger('scheduler')
@@ -30,31 +34,27 @@ progress = IntEnum('progress',
                    'INIT LAUNCHED BOUND RUNNING DONE NOEXEC_DONE')
 
 
-def _cyclic(artefact, root=None):
-    if root == artefact:
-        yield True
-    root=root or artefact
-    for p in artefact.prerequisites:
-        yield from _cyclic(p, root)
-
-
-def cyclic(artefact):
-    return next(_cyclic(artefact), False)
-
-
 class dependency_error(Exception): pass
 
 
 class artefact(object):
 
+    _paths = {}  # critical paths (see critical_path())
+
     @classmethod
-    def init(cls, files=[], keep_temps=False, force=False):
+    def init(cls, files=[], keep_temps=False, force=False, signatures=None, buildlog=None,
+             deps=None):
         """set up some global state."""
         cls.counter = defaultdict(int)
         cls.files = files
         cls.temp_files = set()
         cls.keep_temps = keep_temps
         cls.force = force
+        cls.signatures = signatures
+        cls.buildlog = buildlog
+        cls.deps = deps
+        cls._paths = {}
+        fscache.init()
 
     @classmethod
     def finish(cls):
@@ -69,6 +69,12 @@ class artefact(object):
         cls._format_count('...skipped {} artefact{}...', 'skipped')
         cls._format_count('...updated {} artefact{}...', 'updated')
 
+        if cls.signatures:
+            cls.signatures.finish()
+        if cls.buildlog:
+            cls.buildlog.finish()
+        if cls.deps:
+            cls.deps.finish()
         del cls.files
 
     @classmethod
@@ -80,9 +86,10 @@ class artefact(object):
             # We may encounter symbolic links during the cleanup
             # which no longer refer to existing files. To be able
             # to detect them we need to use `lexists`...
-            if lexists(f):
+            if fscache.lexists(f):
                 dirs.append(dirname(f))
                 remove(f)
+                fscache.removed(f)
         if cls.files:
             cls.files.clear()
         # ...then clean up empty build directories
@@ -92,6 +99,7 @@ class artefact(object):
             try:
                 while d != root:
                     rmdir(d)
+                    fscache.removed(d)
                     d = dirname(d)
             except OSError:  # directory wasn't empty, move on
                 continue
@@ -110,6 +118,12 @@ class artefact(object):
         self._lock = asyncio.Lock()
         self._pqueue = None
         self._dependants = set()
+        for p in self.prerequisites:
+            p._dependants.add(self)
+            p._invalidate_paths()
+        # The level is strictly greater than that of any prerequisite,
+        # so it provides a topological order of the graph.
+        self._level = max([p._level + 1 for p in self.prerequisites], default=0)
         self._rebuilds = set()    # targets that should be force-rebuilt whenever this one is
         self.flags = flag(self.frontend.attrs)
         self.reset()
@@ -156,13 +170,48 @@ class artefact(object):
         if self.progress >= progress.BOUND:
             raise dependency_error(f'can not add {p.frontend}: '
                                    f'{self.frontend.boundname} already bound')
+        if p in self.prerequisites:
+            return
+        # Only if p isn't already ordered before us may it depend on us.
+        # (And nothing can depend on us if we have no dependants yet.)
+        if p._level >= self._level:
+            if (p is self or self._dependants) and p._reaches(self):
+                raise dependency_error(f'dependency cycle detected while adding '
+                                       f'{self.frontend} -> {p.frontend}')
+            self._raise_level(p._level + 1)
         self.prerequisites.add(p)
-        if cyclic(self):
-            raise dependency_error(f'dependency cycle detected while adding '
-                                   f'{self.frontend} -> {p.frontend}')
+        p._dependants.add(self)
+        p._invalidate_paths()
         if self._pqueue:
             self._pqueue.put_nowait(p)
 
+    def _reaches(self, target):
+        """Report whether `target` is among our (transitive) prerequisites.
+        Only the region of the graph ordered above `target` is searched."""
+
+        stack, seen = [self], {self}
+        while stack:
+            a = stack.pop()
+            if a is target:
+                return True
+            for p in a.prerequisites:
+                if p._level >= target._level and p not in seen:
+                    seen.add(p)
+                    stack.append(p)
+        return False
+
+    def _raise_level(self, level):
+        """Raise our level, as well as those of all affected dependants."""
+
+        self._level = level
+        stack = [self]
+        while stack:
+            a = stack.pop()
+            for d in a._dependants:
+                if d._level <= a._level:
+                    d._level = a._level + 1
+                    stack.append(d)
+
     async def process(self, parent=None):
         """Process this artefact:
         * process all prerequisites
@@ -185,11 +234,26 @@ class artefact(object):
                 return
             logger.info(f'progress -- {self.frontend} launching')
             # the prerequisite set may grow while we process it, so we use a queue.
+            # Prerequisites are processed in their own tasks, so deep graphs don't
+            # result in deep call stacks, and independent prerequisites run concurrently.
             self._pqueue = asyncio.Queue()
-            await asyncio.gather(*[self._pqueue.put(p) for p in self.prerequisites])
-            while not self._pqueue.empty():
-                p = await self._pqueue.get()
-                await p.process(self)
+            for p in self.prerequisites:
+                self._pqueue.put_nowait(p)
+            pending = set()
+            try:
+                while True:
+                    while not self._pqueue.empty():
+                        p = self._pqueue.get_nowait()
+                        pending.add(asyncio.ensure_future(p.process(self)))
+                    if not pending:
+                        break
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for t in done:
+                        t.result()  # propagate errors
+            except Exception:
+                for t in pending:
+                    t.cancel()
+                raise
             self._pqueue = None
             self.progress = progress.LAUNCHED
             logger.info(f'progress -- {self.frontend} launched')
@@ -201,89 +265,116 @@ class artefact(object):
         async with self._lock:
             if self.progress >= progress.BOUND:
                 return
-            try:
-                self.frontend.features.eval(update=False)
-            except Exception as e:
-                logger.critical(f'something went wrong binding {self.frontend}: {e}')
-                raise
-            self.boundname = self.frontend.boundname
-            if not self.flags & flag.NOTFILE:
-                d = dirname(self.boundname) or '.'
-                if not lexists(d):
-                    makedirs(d)
-                self.binding = binding.EXISTS if lexists(self.boundname) else binding.MISSING
-                self._timestamp = stat(self.boundname).st_mtime if self.binding == binding.EXISTS else 0
-
-            # if temp file does not exist but parent does, use parent
-            if (parent and
-                self.flags & flag.TEMP and
-                self.binding == binding.MISSING and
-                parent.binding != binding.MISSING):
-                self.binding = binding.PARENTS
-
-            msg = f'bind -- {id(self)} {self.name}: {self.boundname} '
-            msg += f'time={self._timestamp}' if self.binding == binding.EXISTS else f'{str(self.binding)}'
-            logger.info(msg)
-            self.progress = progress.BOUND
-            logger.info(f'progress -- {self.frontend} bound')
+            with trace.span(f'bind {self.name}', 'bind'):
+                try:
+                    with trace.span('features', 'features'):
+                        self.frontend.features.eval(update=False)
+                except Exception as e:
+                    logger.critical(f'something went wrong binding {self.frontend}: {e}')
+                    raise
+                self.boundname = self.frontend.boundname
+                if not self.flags & flag.NOTFILE:
+                    fscache.makedirs(dirname(self.boundname) or '.')
+                    st = fscache.stat(self.boundname)
+                    # (a dangling symlink exists, but has no timestamp)
+                    exists = st is not None or fscache.lexists(self.boundname)
+                    self.binding = binding.EXISTS if exists else binding.MISSING
+                    self._timestamp = st.st_mtime if st else 0
+
+                # if temp file does not exist but parent does, use parent
+                if (parent and
+                    self.flags & flag.TEMP and
+                    self.binding == binding.MISSING and
+                    parent.binding != binding.MISSING):
+                    self.binding = binding.PARENTS
+
+                msg = f'bind -- {id(self)} {self.name}: {self.boundname} '
+                msg += f'time={self._timestamp}' if self.binding == binding.EXISTS else f'{str(self.binding)}'
+                logger.info(msg)
+                self.progress = progress.BOUND
+                logger.info(f'progress -- {self.frontend} bound')
 
     async def compute_fate(self, parent=None):
+        """Compute the fate of this artefact, as well as that of any prerequisites
+        whose fate hasn't been computed yet (i.e., temporaries)."""
+
+        # Find prerequisites with undetermined fate, in post-order...
+        order = []
+        stack, visited = [(self, parent, False)], set()
+        while stack:
+            a, ap, expanded = stack.pop()
+            if expanded:
+                order.append((a, ap))
+            elif a not in visited and a._fate == fate.INIT:
+                visited.add(a)
+                stack.append((a, ap, True))
+                stack.extend((p, a, False) for p in a.prerequisites
+                             if p not in visited and p._fate == fate.INIT)
+        # ...and compute them bottom-up.
+        for a, ap in order:
+            await a._compute_fate(ap)
+
+    async def _compute_fate(self, parent):
+        """Compute the fate of this artefact.
+        Precondition: the fates of all prerequisites are known."""
 
         async with self._lock:
             if self._fate != fate.INIT:
                 return
-            self._fate=fate.MAKING
-
-            for p in self.prerequisites:
-                await p.compute_fate(self)
 
-            self._fate = fate.STABLE
-            last = 0
-            for p in self.prerequisites:
-                if p.flags & flag.NOPROPAGATE:
-                    continue
-                last = max(last, p.timestamp)
-                if self._fate < p.fate:
-                    logger.info(f'fate -- change {self.boundname} from {str(self._fate)} to {str(p.fate)} by dependency')
-                    self._fate = p.fate
-            else:
-                # if this a (non-existing) temporary without prerequisites, treat it MISSING
-                if self.flags & flag.TEMP:
-                    self._fate = fate.MISSING
-            if self.flags & flag.NOUPDATE:
-                logger.info(f'fate -- change {self.boundname} back to stable, NOUPDATE')
+            with trace.span(f'fate {self.name}', 'fate'):
                 self._fate = fate.STABLE
-            # If can not find or make child, can not make target.
-            elif self._fate >= fate.BROKEN:
-                self._fate = fate.CANTMAKE
-            # If children changed, make target.
-            elif self._fate >= fate.SPOIL:
-                self._fate = fate.UPDATE
-            # If target missing, make it.
-            elif self.binding == binding.MISSING:
-                self._fate = fate.MISSING
-            # If children newer, make target.
-            elif self.binding == binding.EXISTS and last > self.timestamp:
-                self._fate = fate.OUTDATED
-            # If temp's children newer than parent, make temp.
-            elif self.binding == binding.PARENTS and last > parent.timestamp:
-                self._fate = fate.NEEDTMP
-            # If deliberately touched, make it.
-            elif self.flags & flag.TOUCHED:
-                self._fate = fate.TOUCHED
-            # If force flag is set, make it.
-            elif artefact.force:
-                self._fate = fate.TOUCHED
-            # If up-to-date temp file present, use it.
-            # If target newer than non-notfile parent, mark target newer.
-            # Otherwise, stable!
-
-            if self._fate == fate.MISSING and not self.recipe and not self.prerequisites:
-                if self.flags & flag.NOCARE:
-                    self._fate = fate.STABLE
+                last = 0
+                for p in self.prerequisites:
+                    if p.flags & flag.NOPROPAGATE:
+                        continue
+                    last = max(last, p.timestamp)
+                    if self._fate < p.fate:
+                        logger.info(f'fate -- change {self.boundname} from {str(self._fate)} to {str(p.fate)} by dependency')
+                        self._fate = p.fate
                 else:
-                    self._fate = fate.CANTFIND
-            logger.info(f'fate -- {self.boundname}: {str(self._fate)}')
+                    # if this a (non-existing) temporary without prerequisites, treat it MISSING
+                    if self.flags & flag.TEMP:
+                        self._fate = fate.MISSING
+                if self.flags & flag.NOUPDATE:
+                    logger.info(f'fate -- change {self.boundname} back to stable, NOUPDATE')
+                    self._fate = fate.STABLE
+                # If can not find or make child, can not make target.
+                elif self._fate >= fate.BROKEN:
+                    self._fate = fate.CANTMAKE
+                # If children changed, make target.
+                elif self._fate >= fate.SPOIL:
+                    self._fate = fate.UPDATE
+                # If target missing, make it.
+                elif self.binding == binding.MISSING:
+                    self._fate = fate.MISSING
+                # If children newer (and their content changed), make target.
+                elif (self.binding == binding.EXISTS and last > self.timestamp and
+                      not self._unchanged()):
+                    self._fate = fate.OUTDATED
+                # If the command or the set of prerequisites changed, make target.
+                elif self.binding == binding.EXISTS and self._changed():
+                    self._fate = fate.OUTDATED
+                # If temp's children newer than parent (and their content changed), make temp.
+                elif (self.binding == binding.PARENTS and last > parent.timestamp and
+                      not self._unchanged()):
+                    self._fate = fate.NEEDTMP
+                # If deliberately touched, make it.
+                elif self.flags & flag.TOUCHED:
+                    self._fate = fate.TOUCHED
+                # If force flag is set, make it.
+                elif artefact.force:
+                    self._fate = fate.TOUCHED
+                # If up-to-date temp file present, use it.
+                # If target newer than non-notfile parent, mark target newer.
+                # Otherwise, stable!
+
+                if self._fate == fate.MISSING and not self.recipe and not self.prerequisites:
+                    if self.flags & flag.NOCARE:
+                        self._fate = fate.STABLE
+                    else:
+                        self._fate = fate.CANTFIND
+                logger.info(f'fate -- {self.boundname}: {str(self._fate)}')
 
     async def update(self):
 
@@ -316,6 +407,12 @@ class artefact(object):
                     logger.info(f'progress -- {self.frontend} running')
                     logger.info(f'update -- {self.boundname}')
                     self.status = await self.recipe()
+                    for t in self.recipe.targets:
+                        fscache.updated(t.boundname or t.frontend.boundname)
+                    if self.status and not self.flags & flag.NOTFILE:
+                        self._record()
+                        if self.frontend.depfile:
+                            self._ingest()
                     if self.flags & flag.TEMP:
                         artefact.temp_files.add(self.boundname)
                     elif not self.flags & flag.NOTFILE:
@@ -329,6 +426,129 @@ class artefact(object):
             logger.info(f'progress -- {self.frontend} done')
             self._report(failed)
 
+    def _signature(self):
+        """Compute a signature from the recipe's command and the content
+        of all prerequisites. Temporaries are represented by their own
+        signatures, as they may not exist (any more).
+        Return None if that isn't possible."""
+
+        if not self.recipe:
+            return None
+        h = hashlib.md5(self.recipe.expand().encode('utf-8'))
+        for p in sorted(self.prerequisites, key=lambda p: str(p.boundname)):
+            if p.flags & flag.NOPROPAGATE:
+                continue
+            elif p.flags & flag.NOTFILE:
+                h.update(f'\0{p.boundname}'.encode('utf-8'))
+            elif p.flags & flag.TEMP and p.recipe:
+                signature = p._signature()
+                if not signature:
+                    return None
+                h.update(f'\0{p.boundname}:{signature}'.encode('utf-8'))
+            # (prerequisites generated during this build weren't bound as existing)
+            elif p.binding == binding.EXISTS or p.recipe and p.status and exists(p.boundname):
+                digest = artefact.signatures.digest(p.boundname)
+                h.update(f'\0{p.boundname}:{digest}'.encode('utf-8'))
+            else:
+                return None
+        return h.hexdigest()
+
+    def _unchanged(self):
+        """Report whether the content of all prerequisites (as well as the command)
+        is unchanged since this artefact was last updated."""
+
+        if not artefact.signatures:
+            return False
+        recorded = artefact.signatures[self.boundname]
+        if recorded and recorded == self._signature():
+            logger.info(f'fate -- {self.boundname} has unchanged signature')
+            return True
+        return False
+
+    def _dependencies(self):
+        """Return the sorted list of prerequisite names, as recorded in the buildlog.
+        Headers reported by the compiler are tracked separately, and thus excluded."""
+        headers = set(self._headers())
+        return sorted(str(p.boundname) for p in self.prerequisites
+                      if not p.flags & flag.NOPROPAGATE and
+                      not (headers and abspath(p.boundname) in headers))
+
+    def _headers(self):
+        """Return the headers the compiler reported when this artefact was last updated."""
+        if not self.frontend.depfile or not artefact.deps:
+            return []
+        return artefact.deps.get(self.frontend.qname, [])
+
+    def _ingest(self):
+        """Read the dependency file the compiler wrote next to this artefact,
+        so the headers can be added as prerequisites during the next build."""
+
+        filename = splitext(self.boundname)[0] + '.d'
+        if artefact.deps is None or self.recipe.noexec or not lexists(filename):
+            return
+        artefact.deps[self.frontend.qname] = [abspath(h) for h in depfile.parse(filename)]
+        artefact.files.append(filename)
+
+    def _changed(self):
+        """Report whether the recipe's command or the set of prerequisites
+        changed since this artefact was last updated."""
+
+        if not artefact.buildlog or not self.recipe:
+            return False
+        recorded = artefact.buildlog[self.boundname]
+        if not recorded:
+            return False
+        command, prerequisites = recorded
+        if command != self.recipe.expand():
+            logger.info(f'fate -- {self.boundname} command changed')
+            return True
+        elif prerequisites != self._dependencies():
+            logger.info(f'fate -- {self.boundname} prerequisites changed')
+            return True
+        return False
+
+    def _record(self):
+        """Record how this artefact was generated."""
+
+        if artefact.buildlog and not self.recipe.noexec:
+            artefact.buildlog[self.boundname] = (self.recipe.expand(), self._dependencies())
+        if artefact.signatures:
+            signature = self._signature()
+            if signature:
+                artefact.signatures[self.boundname] = signature
+
+    def critical_path(self):
+        """Estimate the time it takes to update this artefact and
+        all its dependants, along the longest chain."""
+
+        paths = artefact._paths
+        stack = [self]
+        while stack:
+            a = stack[-1]
+            if a in paths:
+                stack.pop()
+                continue
+            pending = [d for d in a._dependants if d not in paths]
+            if pending:
+                stack.extend(pending)
+                continue
+            stack.pop()
+            duration = a.recipe.estimated_duration if a.recipe else 0.
+            paths[a] = duration + max([paths[d] for d in a._dependants], default=0.)
+        return paths[self]
+
+    def _invalidate_paths(self):
+        """Discard the critical paths of this artefact and its prerequisites,
+        after a dependant was added. (As paths are computed from dependants
+        on, the prerequisites of an artefact without a path have none either.)"""
+
+        paths = artefact._paths
+        stack = [self]
+        while stack:
+            a = stack.pop()
+            if paths.pop(a, None) is not None:
+                stack.extend(a.prerequisites)
+
     def _report(self, failed):
 
         if failed:
@@ -10,14 +10,25 @@ from __future__ import absolute_import
 from .artefact import artefact
 from .artefact import dependency_error as DependencyError  # noqa F401
 from .recipe import recipe
-from ..cache import filecache
+from . import trace
+from . import jobserver
+from .executor import remote as workers
+from ..cache import filecache, signatures, buildlog, depslog, timings, artefactcache, remotecache
 from ..utils import aslist
+from concurrent.futures import Future
+from functools import wraps
 import asyncio
+import threading
+import logging
 import sys
+import os
 
-__all__ = ['init', 'reset', 'clean', 'finish',
+__all__ = ['init', 'start', 'reset', 'clean', 'finish',
            'variables', 'define_artefact', 'add_dependency', 'define_recipe',
-           'run', 'update', 'print_dependency_graph', 'DependencyError']
+           'run', 'update', 'sources', 'walk', 'headers', 'record_headers',
+           'print_dependency_graph', 'print_timings', 'DependencyError']
+
+logger = logging.getLogger('scheduler')
 
 if sys.platform == 'win32':
     loop = asyncio.ProactorEventLoop()
@@ -25,17 +36,73 @@ if sys.platform == 'win32':
 
 
 artefacts = {}  # map frontends to backends
+_loop = None      # the loop (and thread) running the current update, if any
+_thread = None
+
+
+def _scheduler_thread(func):
+    """Run `func` in the scheduler's thread when called from another one,
+    as callable actions run in worker threads (see recipe.run_callable) may
+    modify the dependency graph, which is owned by the scheduler."""
+
+    @wraps(func)
+    def wrapper(*args, **kwds):
+        if _thread is None or _thread is threading.current_thread():
+            return func(*args, **kwds)
+        result = Future()
+
+        def call():
+            try:
+                result.set_result(func(*args, **kwds))
+            except BaseException as e:
+                result.set_exception(e)
+        _loop.call_soon_threadsafe(call)
+        return result.result()
+    return wrapper
 
 
 def init(params, builddir, readonly=False, **options):
+    artefacts.clear()
+    start(params, builddir, readonly, **options)
+
+
+def start(params, builddir, readonly=False, **options):
+    """Set up the global state for a new build, preserving any
+    artefacts already defined (see :func:`reset`)."""
+
     noexec = options.get('noexec', False)
     files = filecache(builddir, params) if not readonly else ()
     intermediates = options.get('intermediates', False)
-    jobs = options.get('parallel', 1)
+    jobs = options.get('parallel')
+    # as with make, an explicit -j overrides an inherited jobserver
+    js = jobserver.client.from_environment() if not jobs else None
+    if js:
+        jobs = js.jobs or os.cpu_count() or 1
+    jobs = jobs or 1
+    if not js and options.get('jobserver') and jobs > 1:
+        try:
+            js = jobserver.server(jobs)
+        except OSError as e:
+            logger.warning(f'unable to create jobserver: {e}')
     timeout = options.get('timeout', 0)
     force = options.get('force', False)
-    artefact.init(files, intermediates, force)
-    recipe.init(jobs, timeout, noexec)
+    trace.init(options.get('trace'))
+    sigs = signatures(builddir) if options.get('signatures') and not readonly else None
+    log = buildlog(builddir) if not readonly else None
+    artefact.init(files, intermediates, force, sigs, log,
+                  depslog(builddir) if not readonly else None)
+    max_load = options.get('max_load')
+    max_memory = options.get('max_memory')
+    cache = options.get('cache')
+    if cache and not readonly:
+        size = options.get('cache_size')
+        cache = artefactcache(cache, size << 20) if size else artefactcache(cache)
+    remote = options.get('remote_cache')
+    remote = remotecache(remote) if remote and not readonly else None
+    w = options.get('workers')
+    w = workers(w) if w and not noexec else None
+    recipe.init(jobs, timeout, noexec, timings(builddir) if not readonly else None,
+                max_load, max_memory, js, cache or None, remote, w)
 
 
 def reset():
@@ -49,7 +116,26 @@ def clean(level=1):
 
 
 def finish():
+    recipe.finish()
     artefact.finish()
+    trace.finish()
+
+
+def headers(name, stamp=None):
+    """Return the headers recorded for `name`, or None. If a stamp is given,
+    only return headers recorded with the same stamp."""
+    entry = artefact.deps.lookup(name) if artefact.deps else None
+    if entry is None or (stamp is not None and entry[0] != stamp):
+        return None
+    return entry[1]
+
+
+@_scheduler_thread
+def record_headers(name, headers, stamp=0):
+    """Record the headers `name` depends on, together with a stamp
+    (such as a modification time) to validate them later."""
+    if artefact.deps:
+        artefact.deps.record(name, headers, stamp)
 
 
 def variables(a):
@@ -57,15 +143,18 @@ def variables(a):
     return recipe.variables() if recipe else {}
 
 
+@_scheduler_thread
 def define_artefact(a, bind=False):
     artefacts[a] = artefact(a)
 
 
+@_scheduler_thread
 def add_dependency(a, deps):
     for d in [artefacts[d] for d in aslist(deps)]:
         artefacts[a].add_prerequisite(d)
 
 
+@_scheduler_thread
 def define_recipe(a, targets, sources=[]):
     targets = [artefacts[t] for t in targets]
     sources = [artefacts[s] for s in sources]
@@ -79,15 +168,58 @@ def run(command):
 
 
 def update(aa):
+    global _loop, _thread
     try:
         loop = asyncio.get_event_loop()
         aa = [artefacts[a] for a in aslist(aa)]
+        _loop, _thread = loop, threading.current_thread()
         loop.run_until_complete(asyncio.gather(*[a.process() for a in aa]))
         return all([a.status for a in aa])
     except Exception:
         raise
+    finally:
+        _loop, _thread = None, None
+
+
+def sources():
+    """Return the filenames of all bound source artefacts, i.e.
+    files the last update depended on without generating them."""
+
+    return [b.boundname for b in artefacts.values()
+            if b.recipe is None and b.isfile and b.boundname]
+
+
+def walk(aa, skip=None):
+    """Yield an (artefact, prerequisites, recipe) tuple for each of `aa`
+    and everything they depend on. `recipe` is None for artefacts without
+    one, or an (action, command, targets, sources) tuple, with all variables
+    in `command` substituted. Prerequisites for which `skip` returns True
+    are neither yielded nor traversed."""
+
+    stack = [artefacts[a] for a in aslist(aa)]
+    seen = set(stack)
+    seen.update([b for b in artefacts.values() if skip and skip(b.frontend)])
+    while stack:
+        b = stack.pop()
+        r = b.recipe
+        if r:
+            r = (r.action, r.expand(),
+                 [t.frontend for t in r.targets], [s.frontend for s in r.sources])
+        yield b.frontend, [p.frontend for p in b.prerequisites], r
+        for p in b.prerequisites:
+            if p not in seen:
+                seen.add(p)
+                stack.append(p)
 
 
 def print_dependency_graph(aa=[]):
     from . import graph
     graph.visualize(*[artefacts[a] for a in aslist(aa)], filename='dependencies.png')
+
+
+def print_timings(aa=[]):
+    from . import profile
+    if recipe.timings is None:
+        print('no timings recorded.')
+    else:
+        profile.report(recipe.timings, [artefacts[a] for a in aslist(aa)])
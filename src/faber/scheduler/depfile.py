@@ -0,0 +1,28 @@
+#
+# Copyright (c) 2018 Stefan Seefeld
+# All rights reserved.
+#
+# This file is part of Faber. It is made available under the
+# Boost Software License, Version 1.0.
+# (Consult LICENSE or http://www.boost.org/LICENSE_1_0.txt)
+
+"""Read the make-style dependency files compilers write with `-MD` / `-MMD`."""
+
+import re
+
+# a (possibly escaped) filename
+_token = re.compile(r'(?:\\.|[^\s\\])+')
+
+
+def parse(filename):
+    """Return the prerequisites listed in the dependency file,
+    except for the first (i.e., the source file itself)."""
+
+    with open(filename) as f:
+        content = f.read().replace('\\\n', ' ')
+    # only consider the first rule
+    rule = content.split('\n', 1)[0]
+    # the target is separated by a colon followed by whitespace
+    # (not to be confused with a drive letter)
+    _, _, prerequisites = rule.partition(': ')
+    return [re.sub(r'\\(.)', r'\1', t) for t in _token.findall(prerequisites)][1:]
@@ -0,0 +1,353 @@
+#
+# Copyright (c) 2018 Stefan Seefeld
+# All rights reserved.
+#
+# This file is part of Faber. It is made available under the
+# Boost Software License, Version 1.0.
+# (Consult LICENSE or http://www.boost.org/LICENSE_1_0.txt)
+
+"""Executors run the commands of recipes: :class:`local` spawns them as
+subprocesses, while :class:`remote` ships hermetic ones, together with
+their inputs, to worker agents (see :mod:`faber.worker`), and retrieves
+their outputs."""
+
+from concurrent.futures import ThreadPoolExecutor
+from ..cache import file_digest
+from os.path import dirname, basename
+import asyncio
+import selectors
+import subprocess
+import tempfile
+import hashlib
+import logging
+import secrets
+import socket
+import struct
+import json
+import sys
+import os
+import re
+import shlex
+import locale
+import time
+
+logger = logging.getLogger('scheduler')
+encoding = locale.getpreferredencoding(False)
+
+
+def _communicate(p, timeout=None):
+    """Read the child's output until it closes its end of the pipes.
+    Unlike `Popen.communicate`, this doesn't wait for the child itself,
+    so it can be reaped by :func:`_reap`."""
+
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    output = {p.stdout: [], p.stderr: []}
+    with selectors.DefaultSelector() as selector:
+        for f in output:
+            selector.register(f, selectors.EVENT_READ)
+        while selector.get_map():
+            remaining = None
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise subprocess.TimeoutExpired(p.args, timeout)
+            for key, _ in selector.select(remaining):
+                data = os.read(key.fd, 1 << 16)
+                if data:
+                    output[key.fileobj].append(data)
+                else:
+                    selector.unregister(key.fileobj)
+                    key.fileobj.close()
+    return b''.join(output[p.stdout]), b''.join(output[p.stderr])
+
+
+def _reap(p):
+    """Wait for the child with os.wait4, as Popen's own wait doesn't
+    report its resource usage, and return that."""
+
+    _, sts, rusage = os.wait4(p.pid, 0)
+    # let Popen know the child is gone
+    p.returncode = -os.WTERMSIG(sts) if os.WIFSIGNALED(sts) else os.WEXITSTATUS(sts)
+    return rusage
+
+
+# characters that require a shell to interpret the command
+_shell_chars = re.compile(r'[|&;<>()$`\\*?[\]#~{}!\n\r]')
+# commands the shell implements itself
+_shell_builtins = set(['.', ':', 'alias', 'break', 'case', 'cd', 'continue', 'eval',
+                       'exec', 'exit', 'export', 'for', 'if', 'read', 'readonly',
+                       'return', 'set', 'shift', 'source', 'trap', 'ulimit', 'umask',
+                       'unset', 'until', 'wait', 'while'])
+
+
+def simple_command(cmd):
+    """If cmd can be executed directly, without involving a shell,
+    return its argument list, otherwise None."""
+
+    if sys.platform == 'win32' or _shell_chars.search(cmd):
+        return None
+    try:
+        argv = shlex.split(cmd)
+    except ValueError:
+        return None
+    # a leading variable assignment needs a shell, too
+    if not argv or argv[0] in _shell_builtins or '=' in argv[0]:
+        return None
+    return argv
+
+
+def spawn(cmd, timeout=None, env=None, pass_fds=(), cwd=None):
+    """Run cmd, directly if it is a simple command, and in a shell otherwise.
+    Return a tuple (status, stdout, stderr, usage), where usage is a
+    (cpu time, max RSS) tuple, if available."""
+
+    # cmd.exe can't deal with multi-line commands, so use a temporary bat file.
+    bat = None
+    if sys.platform == 'win32' and ('\n' in cmd or '\r' in cmd):
+        bat = tempfile.NamedTemporaryFile(suffix='.bat', mode='w', delete=False)
+        with bat:
+            bat.write(cmd)
+        p = subprocess.Popen(['cmd.exe', '/Q', '/C', bat.name],
+                             shell=False,
+                             cwd=cwd,
+                             stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE)
+    else:
+        argv = simple_command(cmd)
+        try:
+            p = subprocess.Popen(argv or cmd,
+                                 shell=argv is None,
+                                 env=env,
+                                 pass_fds=pass_fds,
+                                 cwd=cwd,
+                                 stdout=subprocess.PIPE,
+                                 stderr=subprocess.PIPE)
+        except OSError as e:
+            if argv is None:
+                raise
+            # report as the shell would
+            return False, '', f'{argv[0]}: {e.strerror}', (None, None)
+    rusage = None
+    try:
+        if hasattr(os, 'wait4'):
+            stdout, stderr = _communicate(p, timeout)
+            rusage = _reap(p)
+        else:
+            stdout, stderr = p.communicate(timeout=timeout)
+        stdout = stdout and stdout.decode(encoding).strip()
+        stderr = stderr and stderr.decode(encoding).strip()
+        status = p.returncode == 0
+    except subprocess.TimeoutExpired:
+        p.kill()
+        # don't wait for any grandchildren still holding on to the pipes
+        p.stdout.close()
+        p.stderr.close()
+        p.wait()
+        status, stdout, stderr = False, '', ''
+    finally:
+        if bat:
+            os.unlink(bat.name)
+    usage = (None, None)
+    if rusage:
+        # ru_maxrss is reported in bytes on macOS, and in kilobytes elsewhere
+        rss = rusage.ru_maxrss // 1024 if sys.platform == 'darwin' else rusage.ru_maxrss
+        usage = (rusage.ru_utime + rusage.ru_stime, rss)
+    return status, stdout, stderr, usage
+
+
+# The wire protocol between executor and worker consists of JSON messages,
+# prefixed by their length, as well as files, prefixed by their size.
+_length = struct.Struct('!I')
+_size = struct.Struct('!Q')
+
+
+def _recv(sock, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(min(size - len(data), 1 << 16))
+        if not chunk:
+            raise EOFError('connection closed')
+        data += chunk
+    return bytes(data)
+
+
+def send_message(sock, msg):
+    data = json.dumps(msg).encode('utf-8')
+    sock.sendall(_length.pack(len(data)) + data)
+
+
+def recv_message(sock):
+    length, = _length.unpack(_recv(sock, _length.size))
+    return json.loads(_recv(sock, length).decode('utf-8'))
+
+
+def send_file(sock, filename):
+    with open(filename, 'rb') as f:
+        sock.sendall(_size.pack(os.fstat(f.fileno()).st_size))
+        sock.sendfile(f)
+
+
+def recv_file(sock, filename):
+    """Stream a file into `filename`, and return its sha256 digest."""
+    size, = _size.unpack(_recv(sock, _size.size))
+    h = hashlib.sha256()
+    # (the same file may be received over several connections at once)
+    fd, tmp = tempfile.mkstemp(dir=dirname(filename) or '.',
+                               prefix=basename(filename) + '.', suffix='.tmp')
+    try:
+        with open(fd, 'wb') as f:
+            while size:
+                chunk = sock.recv(min(size, 1 << 16))
+                if not chunk:
+                    raise EOFError('connection closed')
+                h.update(chunk)
+                f.write(chunk)
+                size -= len(chunk)
+        os.replace(tmp, filename)
+    except Exception:
+        if os.path.lexists(tmp):
+            os.remove(tmp)
+        raise
+    return h.hexdigest()
+
+
+class local(object):
+    """Spawn commands as subprocesses, each waited for in a thread of `pool`."""
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    async def run(self, cmd, timeout=None, env=None, pass_fds=()):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self.pool, spawn, cmd, timeout, env, pass_fds)
+
+
+class connection(object):
+    """A connection to a worker agent, running one command at a time."""
+
+    def __init__(self, address, token=None):
+        self.address = address
+        self.sock = socket.create_connection(address)
+        try:
+            send_message(self.sock, dict(token=token))
+            hello = recv_message(self.sock)
+        except Exception:
+            self.sock.close()
+            raise
+        if 'error' in hello:
+            self.sock.close()
+            raise OSError(hello['error'])
+        self.jobs = hello.get('jobs', 1)
+
+    def run(self, cmd, inputs, outputs, timeout=None):
+        """Run `cmd` on the worker, with `inputs` a list of (filename, digest, mode)
+        tuples, and `outputs` a list of filenames.
+        Return a tuple (status, stdout, stderr, usage), as :func:`spawn` does."""
+
+        send_message(self.sock, dict(command=cmd, timeout=timeout,
+                                     inputs=inputs, outputs=outputs))
+        # only transfer inputs the worker doesn't have yet
+        files = {d: f for f, d, _ in inputs}
+        for digest in recv_message(self.sock)['missing']:
+            send_file(self.sock, files[digest])
+        result = recv_message(self.sock)
+        for filename, mode in zip(outputs, result['outputs']):
+            if mode is not None:
+                os.makedirs(dirname(filename) or '.', exist_ok=True)
+                recv_file(self.sock, filename)
+                os.chmod(filename, mode)
+        return result['status'], result['stdout'], result['stderr'], tuple(result['usage'])
+
+    def close(self):
+        self.sock.close()
+
+
+def start_worker(token):
+    """Start a worker agent on this machine, accepting `token`, and return
+    its process and the address it listens on."""
+
+    env = dict(os.environ, FABER_WORKER_TOKEN=token)
+    p = subprocess.Popen([sys.executable, '-m', 'faber.worker', '--host', 'localhost', '--port', '0'],
+                         stdout=subprocess.PIPE, universal_newlines=True, env=env)
+    line = p.stdout.readline()
+    if not line.startswith('listening on '):
+        p.kill()
+        p.wait()
+        raise OSError('unable to start worker')
+    host, port = line.split()[-1].rsplit(':', 1)
+    return p, (host, int(port))
+
+
+class remote(object):
+    """Run commands on worker agents, with one slot per job a worker
+    is willing to run concurrently. Workers are given as 'host:port',
+    or as 'local', to start a worker on this machine. Workers are presented
+    `token` (by default the value of the `FABER_WORKER_TOKEN` environment variable).
+
+    Should a worker become unreachable, its slots run commands locally."""
+
+    def __init__(self, workers, token=None):
+        token = token or os.environ.get('FABER_WORKER_TOKEN')
+        self.processes = []
+        self.connections = []
+        for w in workers:
+            try:
+                if w == 'local':
+                    secret = secrets.token_hex(16)
+                    p, address = start_worker(secret)
+                    self.processes.append(p)
+                else:
+                    secret = token
+                    host, port = w.rsplit(':', 1)
+                    address = (host, int(port))
+                c = connection(address, secret)
+                self.connections += [c] + [connection(address, secret) for i in range(c.jobs - 1)]
+            except (OSError, ValueError) as e:
+                logger.warning('unable to use worker {}: {}'.format(w, e))
+        self.slots = len(self.connections)
+        self.pool = ThreadPoolExecutor(max_workers=max(self.slots, 1))
+        self.local = local(self.pool)
+        self._idle = None
+
+    def close(self):
+        for c in self.connections:
+            c.close()
+        self.pool.shutdown()
+        for p in self.processes:
+            p.terminate()
+            p.wait()
+
+    @staticmethod
+    def digest(filename):
+        """Return the (sha256) digest and the mode of the given file."""
+        st = os.stat(filename)
+        return file_digest(filename, 'sha256', st), st.st_mode & 0o777
+
+    async def run(self, cmd, inputs, outputs, timeout=None, env=None, pass_fds=()):
+        """Run `cmd` on a worker, transferring `inputs` there, and
+        `outputs` back. All filenames need to be relative.
+        `env` and `pass_fds` are only used if `cmd` has to be run locally."""
+
+        if self._idle is None:
+            self._idle = asyncio.Queue()
+            for c in self.connections:
+                self._idle.put_nowait(c)
+        try:
+            inputs = [(f,) + self.digest(f) for f in inputs]
+        except OSError:
+            return await self.local.run(cmd, timeout, env, pass_fds)
+        conn = await self._idle.get()
+        loop = asyncio.get_event_loop()
+        try:
+            if conn:
+                try:
+                    return await loop.run_in_executor(self.pool, conn.run,
+                                                      cmd, inputs, outputs, timeout)
+                except (OSError, EOFError, ValueError, KeyError) as e:
+                    logger.warning('lost worker {}:{}: {}'.format(*conn.address, e))
+                    conn.close()
+                    # from now on, run this slot's commands locally
+                    conn = None
+            return await self.local.run(cmd, timeout, env, pass_fds)
+        finally:
+            self._idle.put_nowait(conn)
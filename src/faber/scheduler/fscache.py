@@ -0,0 +1,157 @@
+#
+# Copyright (c) 2018 Stefan Seefeld
+# All rights reserved.
+#
+# This file is part of Faber. It is made available under the
+# Boost Software License, Version 1.0.
+# (Consult LICENSE or http://www.boost.org/LICENSE_1_0.txt)
+
+"""Cache file system metadata for the duration of a build, so each path
+is stat'ed at most once. Directories are listed as a whole (using
+`os.scandir`) the first time a file in them is looked up, so missing
+files can be detected without a system call of their own.
+
+Whatever the build itself changes needs to be reported via `updated()`
+and `removed()`."""
+
+import os
+import stat as S
+import sys
+import unicodedata
+
+if sys.platform in ('win32', 'darwin'):
+    # (by default) these file systems are case-insensitive,
+    # and on macOS, file names are stored in decomposed form
+    def _fold(name):
+        return unicodedata.normalize('NFC', name).lower()
+else:
+    def _fold(name):
+        return name
+
+
+class fscache(object):
+
+    def __init__(self):
+        self._stats = {}     # map paths to stat results (or None if missing)
+        self._listings = {}  # map directories to sets of (folded) names
+        self._dirs = set()   # directories known to exist
+
+    def _listing(self, d):
+        """Return the set of names in d, or None if they can't be known."""
+        if d not in self._listings:
+            try:
+                with os.scandir(d or '.') as entries:
+                    self._listings[d] = set(_fold(e.name) for e in entries)
+            except (FileNotFoundError, NotADirectoryError):
+                self._listings[d] = set()
+            except OSError:
+                self._listings[d] = None
+        return self._listings[d]
+
+    def _listed(self, path):
+        """Return False if path is known not to exist, True if it is known
+        to exist, and None if the listing of its directory isn't available."""
+        d, name = os.path.split(path)
+        if name in ('', os.curdir, os.pardir):
+            return None
+        names = self._listing(d)
+        return None if names is None else _fold(name) in names
+
+    def stat(self, path):
+        """Return the (symlink-following) stat result for path, or None."""
+        try:
+            return self._stats[path]
+        except KeyError:
+            pass
+        st = None
+        if self._listed(path) is not False:
+            try:
+                st = os.stat(path)
+            except OSError:
+                pass
+        self._stats[path] = st
+        return st
+
+    def lexists(self, path):
+        listed = self._listed(path)
+        return os.path.lexists(path) if listed is None else listed
+
+    def isfile(self, path):
+        st = self.stat(path)
+        return st is not None and S.S_ISREG(st.st_mode)
+
+    def isdir(self, path):
+        if path in self._dirs:
+            return True
+        st = self.stat(path)
+        if st is not None and S.S_ISDIR(st.st_mode):
+            self._dirs.add(path)
+            return True
+        return False
+
+    def makedirs(self, d):
+        """Make sure d exists."""
+        if self.isdir(d):
+            return
+        os.makedirs(d, exist_ok=True)
+        self._listings[d] = set()
+        # d and its (possibly new) ancestors need to be looked up again
+        while d and d not in self._dirs:
+            self._dirs.add(d)
+            self.updated(d)
+            d = os.path.dirname(d)
+
+    def updated(self, path):
+        """Report that path was (re-)generated."""
+        self._stats.pop(path, None)
+        d, name = os.path.split(path)
+        names = self._listings.get(d)
+        if names is not None:
+            names.add(_fold(name))
+
+    def removed(self, path):
+        """Report that path was removed."""
+        self._stats.pop(path, None)
+        self._dirs.discard(path)
+        self._listings.pop(path, None)
+        d, name = os.path.split(path)
+        names = self._listings.get(d)
+        if names is not None:
+            names.discard(_fold(name))
+
+
+_cache = fscache()
+
+
+def init():
+    """Forget everything cached so far."""
+    global _cache
+    _cache = fscache()
+
+
+def stat(path):
+    return _cache.stat(path)
+
+
+def lexists(path):
+    return _cache.lexists(path)
+
+
+def isfile(path):
+    return _cache.isfile(path)
+
+
+def isdir(path):
+    return _cache.isdir(path)
+
+
+def makedirs(d):
+    return _cache.makedirs(d)
+
+
+def updated(path):
+    return _cache.updated(path)
+
+
+def removed(path):
+    return _cache.removed(path)
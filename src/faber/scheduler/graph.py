@@ -12,12 +12,16 @@ import graphviz
 
 
 def walk(a, d=None):
-    """Traverse the prerequisites of `a`."""
-
-    # This of course assumes the graph not to have any cycles.
-    yield a, d
-    for p in a.prerequisites:
-        yield from walk(p, a)
+    """Traverse the prerequisites of `a`, yielding each
+    (artefact, dependant) edge once."""
+
+    stack, seen = [(a, d)], set()
+    while stack:
+        a, d = stack.pop()
+        yield a, d
+        if a not in seen:
+            seen.add(a)
+            stack.extend((p, a) for p in a.prerequisites)
 
 
 def visualize(*args, filename='dependencies', format=None):
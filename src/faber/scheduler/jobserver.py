@@ -0,0 +1,143 @@
+#
+# Copyright (c) 2018 Stefan Seefeld
+# All rights reserved.
+#
+# This file is part of Faber. It is made available under the
+# Boost Software License, Version 1.0.
+# (Consult LICENSE or http://www.boost.org/LICENSE_1_0.txt)
+
+"""Share the job budget with other processes, using the GNU make jobserver protocol.
+
+A jobserver is a pipe (or named fifo) filled with one token per job slot,
+except for one slot implicitly granted to each participating process.
+Before starting an additional job, a process reads a token, and writes
+it back once the job is done."""
+
+import asyncio
+import logging
+import os
+import re
+
+logger = logging.getLogger('process')
+
+
+class token(object):
+    """Hold a job token for the duration of a block."""
+
+    def __init__(self, client):
+        self.client = client
+        self.token = None
+
+    async def __aenter__(self):
+        self.token = await self.client.acquire()
+
+    async def __aexit__(self, *args):
+        self.client.release(self.token)
+
+
+class client(object):
+    """Acquire job tokens from a jobserver. Without a jobserver,
+    every request is granted immediately."""
+
+    def __init__(self, rfd=None, wfd=None, inherit=(), makeflags=None, jobs=None):
+        """Arguments:
+          * rfd, wfd: the (non-blocking) descriptors to read and write tokens
+          * inherit: descriptors child processes need to inherit
+          * makeflags: the MAKEFLAGS value to pass to child processes, if any
+          * jobs: the total number of job slots, if known"""
+        self.jobs = jobs
+        self.rfd = rfd
+        self.wfd = wfd
+        self.inherit = tuple(inherit)
+        self.makeflags = makeflags
+        self._implicit = True  # the token every participant holds implicitly
+        self._lock = None
+
+    @staticmethod
+    def from_environment(environ=os.environ):
+        """Connect to the jobserver advertised in MAKEFLAGS, if any."""
+
+        if os.name != 'posix':
+            return None
+        makeflags = environ.get('MAKEFLAGS', '')
+        m = re.findall(r'--jobserver-(?:auth|fds)=(\S+)', makeflags)
+        if not m:
+            return None
+        auth = m[-1]
+        jobs = re.findall(r'(?:^| )-j(\d+)', makeflags)
+        jobs = int(jobs[-1]) if jobs else None
+        try:
+            if auth.startswith('fifo:'):
+                fd = os.open(auth[5:], os.O_RDWR | os.O_NONBLOCK)
+                return client(fd, fd, jobs=jobs)
+            r, w = [int(fd) for fd in auth.split(',')]
+            os.fstat(r), os.fstat(w)
+            return client(_nonblocking(r), w, inherit=(r, w), jobs=jobs)
+        except (OSError, ValueError) as e:
+            # make only passes the descriptors on to commands it knows to be sub-makes
+            logger.warning(f'jobserver unavailable ({e}), ignoring it.')
+            return None
+
+    def __call__(self):
+        return token(self)
+
+    async def acquire(self):
+        """Acquire a token. Return None for the implicit token."""
+
+        if self._implicit or self.rfd is None:
+            self._implicit = False
+            return None
+        if not self._lock:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            loop = asyncio.get_event_loop()
+            while True:
+                try:
+                    t = os.read(self.rfd, 1)
+                    if t:
+                        return t
+                    raise RuntimeError('jobserver closed')
+                except BlockingIOError:
+                    pass
+                readable = loop.create_future()
+                loop.add_reader(self.rfd, lambda: readable.done() or readable.set_result(None))
+                try:
+                    await readable
+                finally:
+                    loop.remove_reader(self.rfd)
+
+    def release(self, token):
+        if token is None:
+            self._implicit = True
+        else:
+            os.write(self.wfd, token)
+
+    def close(self):
+        for fd in set([self.rfd, self.wfd]) - set(self.inherit) - set([None]):
+            os.close(fd)
+
+
+class server(client):
+    """Create a jobserver for `jobs` job slots, to be shared with child processes."""
+
+    def __init__(self, jobs):
+        r, w = os.pipe()
+        for fd in (r, w):
+            os.set_inheritable(fd, True)
+        os.write(w, b'+' * (jobs - 1))
+        makeflags = f' -j{jobs} --jobserver-fds={r},{w} --jobserver-auth={r},{w}'
+        client.__init__(self, _nonblocking(r), w, inherit=(r, w), makeflags=makeflags, jobs=jobs)
+
+    def close(self):
+        client.close(self)
+        for fd in self.inherit:
+            os.close(fd)
+
+
+def _nonblocking(fd):
+    """Return a non-blocking descriptor to read from the pipe `fd`.
+    As the pipe is shared with other processes, don't change the
+    original's mode, but open a new file description.
+    Raise OSError if that isn't supported."""
+
+    return os.open(f'/proc/self/fd/{fd}', os.O_RDONLY | os.O_NONBLOCK)
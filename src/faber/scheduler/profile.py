@@ -0,0 +1,85 @@
+#
+# Copyright (c) 2018 Stefan Seefeld
+# All rights reserved.
+#
+# This file is part of Faber. It is made available under the
+# Boost Software License, Version 1.0.
+# (Consult LICENSE or http://www.boost.org/LICENSE_1_0.txt)
+
+from collections import defaultdict
+
+
+def critical_path(artefacts, timings):
+    """Find the longest chain of prerequisites leading to any of `artefacts`,
+    weighted by the recorded durations. Return a (duration, chain) tuple."""
+
+    nodes, stack = set(), list(artefacts)
+    while stack:
+        a = stack.pop()
+        if a not in nodes:
+            nodes.add(a)
+            stack.extend(a.prerequisites)
+    length, via = {}, {}
+    # levels provide a topological order, so all prerequisites are visited first
+    for a in sorted(nodes, key=lambda a: a._level):
+        p = max(a.prerequisites, key=lambda p: length[p], default=None)
+        duration = timings.get(a.frontend.qname, 0.) if a.recipe else 0.
+        length[a] = duration + (length[p] if p else 0.)
+        via[a] = p
+    a = max(artefacts, key=lambda a: length[a], default=None)
+    chain = []
+    while a:
+        if a.recipe:
+            chain.append(a)
+        a = via[a]
+    return (length[chain[0]] if chain else 0.), chain
+
+
+def _format(value, unit, scale=1):
+    return '-' if value is None else '{:.2f} {}'.format(value / scale, unit)
+
+
+def _print_table(table):
+    width = [max(map(len, c)) for c in zip(*table)]
+    for row in table:
+        print('  ' + '  '.join('{:{}}'.format(c, w) for c, w in zip(row, width)).rstrip())
+
+
+def _aggregate(records, index, title):
+    """Print totals of the records, grouped by the given field."""
+
+    totals = defaultdict(lambda: [0, 0., 0., None])
+    for r in records:
+        t = totals[r[index] or '-']
+        t[0] += 1
+        t[1] += r[4]
+        t[2] += r[5] or 0.
+        if r[6] is not None:
+            t[3] = max(t[3] or 0, r[6])
+    table = [[title, 'count', 'wall', 'cpu', 'max rss']]
+    for k, (count, wall, cpu, rss) in sorted(totals.items(), key=lambda t: t[1][1], reverse=True):
+        table.append([k, str(count), _format(wall, 's'), _format(cpu, 's'), _format(rss, 'MB', 1024)])
+    _print_table(table)
+
+
+def report(timings, artefacts, limit=10):
+    """Print a summary of the recorded timings."""
+
+    records = list(timings)
+    if not records:
+        print('no timings recorded.')
+        return
+    print('slowest actions:')
+    table = [['wall', 'cpu', 'max rss', 'action', 'artefact']]
+    records.sort(key=lambda r: r[4], reverse=True)
+    for target, action, tool, module, wall, cpu, rss in records[:limit]:
+        table.append([_format(wall, 's'), _format(cpu, 's'), _format(rss, 'MB', 1024), action, target])
+    _print_table(table)
+    print('per-tool totals:')
+    _aggregate(records, 2, 'tool')
+    print('per-module totals:')
+    _aggregate(records, 3, 'module')
+    duration, chain = critical_path(artefacts, timings)
+    print('critical path: {}'.format(_format(duration, 's')))
+    for a in reversed(chain):
+        print('  {} ({})'.format(a.frontend.qname, _format(timings.get(a.frontend.qname), 's')))
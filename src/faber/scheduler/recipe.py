@@ -7,19 +7,27 @@
 # (Consult LICENSE or http://www.boost.org/LICENSE_1_0.txt)
 
 from ..utils import capture_output
-from .artefact import dependency_error
+from .artefact import artefact, dependency_error, flag
+from . import trace
+from .jobserver import client as jobserver_client
+from .executor import local, simple_command, spawn  # noqa F401
+from ..cache import file_digest
 import asyncio
-from concurrent.futures import TimeoutError
-import subprocess
-import tempfile
-import sys
+from concurrent.futures import ThreadPoolExecutor
+import itertools
+import heapq
+import hashlib
+import time
 import logging
 import os
 import re
-import locale
+from os.path import abspath, relpath, splitext
 
 logger = logging.getLogger('scheduler')
-encoding = locale.getpreferredencoding(False)
+summary_logger = logging.getLogger('summary')
+
+# (per-thread CPU time is only available from Python 3.7 on)
+thread_time = getattr(time, 'thread_time', None)
 
 
 def command_string(func, targets, sources, kwds):
@@ -36,16 +44,174 @@ def command_string(func, targets, sources, kwds):
     return '{}({})'.format(func.__name__, ', '.join(args))
 
 
+class dispatcher(object):
+    """A semaphore that hands out its slots to waiting recipes
+    in order of priority, rather than in order of arrival.
+    Slots are numbered, so their use can be traced."""
+
+    class slot(object):
+
+        def __init__(self, dispatcher, priority):
+            self.dispatcher = dispatcher
+            self.priority = priority
+            self.id = None
+
+        async def __aenter__(self):
+            self.id = await self.dispatcher.acquire(self.priority)
+            return self.id
+
+        async def __aexit__(self, *args):
+            self.dispatcher.release(self.id)
+
+    def __init__(self, slots):
+        self._free = list(range(slots))
+        self._waiters = []
+        self._counter = itertools.count()
+
+    def __call__(self, priority=0):
+        return dispatcher.slot(self, priority)
+
+    async def acquire(self, priority=0):
+        """Wait for a free slot, and return its id."""
+        if self._free and not self._waiters:
+            return heapq.heappop(self._free)
+        future = asyncio.get_event_loop().create_future()
+        # higher priorities first, ties resolved in order of arrival
+        heapq.heappush(self._waiters, (-priority, next(self._counter), future))
+        try:
+            return await future
+        except asyncio.CancelledError:
+            # if we were granted a slot already, pass it on
+            if future.done() and not future.cancelled():
+                self.release(future.result())
+            raise
+
+    def release(self, slot):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(slot)
+                return
+        heapq.heappush(self._free, slot)
+
+
+def available_memory():
+    """Return the amount of available system memory in kB, if known."""
+    try:
+        with open('/proc/meminfo') as meminfo:
+            for line in meminfo:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+class limiter(object):
+    """Throttle the admission of new jobs, based on the system load,
+    the available memory, and the memory the running jobs are expected to use.
+    A job is always admitted if no other job is running."""
+
+    class admission(object):
+
+        def __init__(self, limiter, rss):
+            self.limiter = limiter
+            self.rss = rss
+
+        async def __aenter__(self):
+            await self.limiter.acquire(self.rss)
+
+        async def __aexit__(self, *args):
+            self.limiter.release(self.rss)
+
+    def __init__(self, max_load=None, max_memory=None):
+        """Arguments:
+          * max_load: the load average above which no new jobs are admitted.
+          * max_memory: the memory (in kB) all running jobs may use together."""
+
+        self.max_load = max_load if hasattr(os, 'getloadavg') else None
+        self.max_memory = max_memory
+        self.running = 0
+        self.reserved = 0
+        self._changed = asyncio.Event()
+
+    def __call__(self, rss=0):
+        return limiter.admission(self, rss)
+
+    def admissible(self, rss=0):
+        if not self.running:
+            return True
+        if self.max_load and os.getloadavg()[0] >= self.max_load:
+            return False
+        if self.max_memory:
+            if self.reserved + rss > self.max_memory:
+                return False
+            available = available_memory()
+            if available is not None and available < rss:
+                return False
+        return True
+
+    async def acquire(self, rss=0):
+        while not self.admissible(rss):
+            # check again whenever a job finishes, or the load may have changed
+            self._changed.clear()
+            try:
+                await asyncio.wait_for(self._changed.wait(), 1.)
+            except asyncio.TimeoutError:
+                pass
+        self.running += 1
+        self.reserved += rss
+
+    def release(self, rss=0):
+        self.running -= 1
+        self.reserved -= rss
+        self._changed.set()
+
+
 class recipe(object):
 
     @classmethod
-    def init(cls, jobs=1, timeout=0, noexec=False):
-        cls.semaphore = asyncio.BoundedSemaphore(jobs)
+    def init(cls, jobs=1, timeout=0, noexec=False, timings=None,
+             max_load=None, max_memory=None, jobserver=None, cache=None, remote=None,
+             workers=None):
+        # each worker slot adds to the concurrency level
+        cls.semaphore = dispatcher(jobs + (workers.slots if workers else 0))
+        cls.limiter = limiter(max_load, max_memory and max_memory * 1024)
+        cls.jobserver = jobserver or jobserver_client()
+        # advertise the jobserver to child processes
+        cls.environment = None
+        if cls.jobserver.makeflags:
+            cls.environment = dict(os.environ, MAKEFLAGS=cls.jobserver.makeflags)
+        # subprocesses are waited for in their own threads
+        cls.executor = ThreadPoolExecutor(max_workers=jobs)
+        cls.local = local(cls.executor)
+        cls.workers = workers
         cls.timeout = timeout or None
         cls.noexec = noexec
+        cls.timings = timings
+        # the defaults for recipes that haven't been timed yet
+        cls.default_duration = timings and timings.mean() or 1.
+        cls.default_rss = timings and timings.mean_rss() or 0
+        cls.cache = cache
+        cls.remote = remote
 
     @classmethod
-    def finish(cls): pass
+    def finish(cls):
+        cls.executor.shutdown()
+        if cls.workers:
+            cls.workers.close()
+            cls.workers = None
+        cls.jobserver.close()
+        if cls.timings:
+            cls.timings.finish()
+            cls.timings = None
+        for what, cache in (('cache', cls.cache), ('remote cache', cls.remote)):
+            if cache:
+                if cache.hits or cache.misses:
+                    summary_logger.info('...{}: {} hits, {} misses...'
+                                        .format(what, cache.hits, cache.misses))
+                cache.finish()
+        cls.cache = cls.remote = None
 
     def __init__(self, action, targets, sources):
         self.action = action
@@ -54,21 +220,158 @@ class recipe(object):
         self.status = None
         self.stdout = None
         self.stderr = None
+        self.duration = None
+        self.cpu = None
+        self.rss = None
 
     async def __call__(self):
 
         if callable(self.action.command):
-            self.status, self.stdout, self.stderr = self.run_callable()
+            self.status, self.stdout, self.stderr = await self.run_callable()
         else:
+            caching = (recipe.cache or recipe.remote) and not recipe.noexec
+            key = self.cache_key() if caching else None
+            if key and await self.retrieve(key):
+                return self.status
             self.status, self.stdout, self.stderr = await self.run_async_subprocess()
+            if key and self.status:
+                self.store(key)
+        if recipe.timings is not None and self.duration is not None:
+            tool = self.action.tool
+            frontend = self.targets[0].frontend
+            recipe.timings[frontend.qname] = (self.action.qname, tool.id if tool else '',
+                                              frontend.module.name,
+                                              self.duration, self.cpu, self.rss)
         return self.status
 
+    @property
+    def estimated_duration(self):
+        """The duration recorded during the last update, or a default."""
+        if recipe.timings is None:
+            return recipe.default_duration
+        return recipe.timings.get(self.targets[0].frontend.qname, recipe.default_duration)
+
+    @property
+    def estimated_rss(self):
+        """The peak memory usage (in kB) recorded during the last update, or a default."""
+        if recipe.timings is None:
+            return recipe.default_rss
+        return recipe.timings.rss(self.targets[0].frontend.qname, recipe.default_rss)
+
+    def priority(self):
+        """Return the estimated length of the critical path
+        from our targets up to the goals being updated."""
+        return max([t.critical_path() for t in self.targets])
+
+    def _headers_known(self):
+        """Report whether all headers our targets depend on are known.
+        Headers reported by the compiler are only known after a first update."""
+
+        return not any(t.frontend.depfile and (not artefact.deps or
+                                               artefact.deps.lookup(t.frontend.qname) is None)
+                       for t in self.targets)
+
+    def hermetic_io(self, cmd):
+        """If our command may be run on a worker, return the lists of its input
+        and output files, relative to the current working directory. Otherwise return None."""
+
+        if not self.action.hermetic or not self._headers_known():
+            return None
+        cwd = os.getcwd()
+        # absolute paths into the tree can't be resolved on a worker
+        if cwd in cmd:
+            return None
+        inputs, seen = set(), set()
+        stack = [p for t in self.targets for p in t.prerequisites]
+        while stack:
+            p = stack.pop()
+            if p in seen or p.flags & (flag.NOPROPAGATE | flag.NOTFILE):
+                continue
+            seen.add(p)
+            inputs.add(p.boundname)
+            # sources (such as headers) may depend on other sources
+            if not p.recipe:
+                stack.extend(p.prerequisites)
+        outputs = [t.boundname for t in self.targets]
+        # compilers reporting dependencies write them next to their output
+        outputs += [splitext(t.boundname)[0] + '.d' for t in self.targets if t.frontend.depfile]
+        inputs = [relpath(abspath(f), cwd) for f in sorted(inputs)]
+        outputs = [relpath(abspath(f), cwd) for f in outputs]
+        if any(f.startswith(os.pardir) for f in inputs + outputs):
+            return None
+        return inputs, outputs
+
+    def cache_key(self):
+        """Compute the key to store our targets under in the artefact cache
+        from the expanded command, the tool, and the content of all prerequisites.
+        Return None if our targets can't be cached."""
+
+        if any(t.flags & flag.NOTFILE or not t.boundname for t in self.targets):
+            return None
+        if not self._headers_known():
+            return None
+        tool = self.action.tool
+        h = hashlib.md5(self.expand().encode('utf-8'))
+        h.update(f'\0{tool.id if tool else ""}'.encode('utf-8'))
+        prerequisites = set().union(*[t.prerequisites for t in self.targets])
+        for p in sorted(prerequisites, key=lambda p: str(p.boundname)):
+            if p.flags & flag.NOPROPAGATE:
+                continue
+            elif p.flags & flag.NOTFILE:
+                h.update(f'\0{p.boundname}'.encode('utf-8'))
+            else:
+                # (prerequisites generated during this update were bound as missing)
+                try:
+                    digest = file_digest(p.boundname)
+                except OSError:
+                    return None
+                h.update(f'\0{p.boundname}:{digest}'.encode('utf-8'))
+        return h.hexdigest()
+
+    async def retrieve(self, key):
+        """Retrieve our targets from the local or the remote artefact cache,
+        and report success."""
+
+        filenames = [t.boundname for t in self.targets]
+        output = recipe.cache.retrieve(key, filenames) if recipe.cache else None
+        if output is None and recipe.remote:
+            loop = asyncio.get_event_loop()
+            output = await loop.run_in_executor(recipe.executor, recipe.remote.retrieve,
+                                                key, filenames)
+            if output is not None:
+                self.store(key, *output, remote=False)
+        if output is None:
+            return False
+        logger.info(f'cache -- retrieved {self.targets[0].boundname}')
+        self.status = True
+        self.stdout, self.stderr = output
+        self.action.__status__([t.frontend for t in self.targets],
+                               True, self.expand(), 0., self.stdout, self.stderr)
+        return True
+
+    def store(self, key, stdout=None, stderr=None, remote=True):
+        """Store our targets in the local and (unless told otherwise)
+        the remote artefact cache."""
+
+        filenames = [t.boundname for t in self.targets]
+        if stdout is None:
+            stdout, stderr = self.stdout, self.stderr
+        # (empty output may be reported as bytes)
+        stdout, stderr = stdout or '', stderr or ''
+        try:
+            if recipe.cache:
+                recipe.cache.store(key, filenames, stdout, stderr)
+            if recipe.remote and remote:
+                recipe.remote.store(key, filenames, stdout, stderr)
+        except OSError as e:
+            logger.warning(f'unable to cache {self.targets[0].boundname}: {e}')
+
     def variables(self):
-        return {k: [v] for k, v in self.action.map(self.targets[0].frontend.features).items()}
+        with trace.span('variables', 'features'):
+            return {k: [v] for k, v in self.action.map(self.targets[0].frontend.features).items()}
 
-    def run_callable(self):
+    async def run_callable(self):
 
-        from ..action import CallError
         # Setting '__noexec__' allows a function to be run even in noexec mode.
         if recipe.noexec and not hasattr(self.action.command, '__noexec__'):
             return True, '', ''
@@ -76,7 +379,26 @@ class recipe(object):
         sources = [s.frontend for s in self.sources]
         vars = self.variables()
         cmd = command_string(self.action.command, targets, sources, vars)
-        with capture_output() as (out, err):
+        # Setting '__inline__' makes a function run in the scheduler's own thread,
+        # which is required if it modifies the dependency graph.
+        if hasattr(self.action.command, '__inline__'):
+            status, cmd, stdout, stderr = self.call(targets, sources, cmd)
+        else:
+            async with recipe.semaphore(self.priority()) as slot:
+                loop = asyncio.get_event_loop()
+                status, cmd, stdout, stderr = \
+                    await loop.run_in_executor(recipe.executor, self.call,
+                                               targets, sources, cmd, slot)
+        self.action.__status__(targets, status, cmd, self.duration, stdout, stderr)
+        return status, stdout, stderr
+
+    def call(self, targets, sources, cmd, slot=None):
+        """Call the action's function, and return a tuple (status, command, stdout, stderr)."""
+
+        from ..action import CallError
+        start, cpu = time.monotonic(), thread_time and thread_time()
+        with trace.span(self.action.qname, 'recipe', slot, target=self.targets[0].name), \
+             capture_output() as (out, err):
             status = True
             try:
                 status = self.action.command(targets, sources)
@@ -97,75 +419,63 @@ class recipe(object):
                 import traceback as tb
                 tb.print_exc()
                 status = False
-        stdout = out.getvalue()
-        stderr = err.getvalue()
-        self.action.__status__([t.frontend for t in self.targets],
-                               status, cmd, 0, stdout, stderr)
-        return status, stdout, stderr
+        self.duration = time.monotonic() - start
+        self.cpu = thread_time() - cpu if thread_time else None
+        return status, cmd, out.getvalue(), err.getvalue()
+
+    def expand(self):
+        """Return the command with all variables substituted.
+        For Python callables, return a (stable) string representation of the call."""
 
-    async def run_async_subprocess(self):
         vars = self.variables()
-        async with recipe.semaphore:
-            cmd = self.action.command
-            # substitute $(<[N])
-            for m in re.findall(r'(\$\(<\[(\d+)\]\))', cmd):
-                cmd = cmd.replace(m[0], self.targets[int(m[1])].boundname)
-            # substitute $(>[N])
-            for m in re.findall(r'(\$\(>\[(\d+)\]\))', cmd):
-                cmd = cmd.replace(m[0], self.sources[int(m[1])].boundname)
-
-            vars.update([('<', [t.boundname for t in self.targets])])
-            vars.update([('>', [s.boundname for s in self.sources])])
-            for v in vars:
-                cmd = cmd.replace('$({})'.format(v), ' '.join(vars.get(v, [])))
-            # cmd.exe can't deal with multi-line commands, so use a temporary bat file.
-            bat = None
-            if sys.platform == 'win32' and ('\n' in cmd or '\r' in cmd):
-                bat = tempfile.NamedTemporaryFile(suffix='.bat', mode='w', delete=False)
-                with bat:
-                    bat.write(cmd)
-                process = await asyncio.create_subprocess_exec(f'{bat.name}',
-                                                               stdout=asyncio.subprocess.PIPE,
-                                                               stderr=asyncio.subprocess.PIPE)
-            else:
-                process = await asyncio.create_subprocess_shell(cmd,
-                                                                stdout=asyncio.subprocess.PIPE,
-                                                                stderr=asyncio.subprocess.PIPE)
-            try:
-                stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=recipe.timeout)
-                stdout = stdout and stdout.decode(encoding).strip()
-                stderr = stderr and stderr.decode(encoding).strip()
-                status = process.returncode == 0
-            except TimeoutError:
-                status, stdout, stderr = False, '', ''
-            finally:
-                if bat:
-                    os.unlink(bat.name)
+        # targets sharing this recipe may not have been bound yet
+        tnames = [t.boundname or t.frontend.boundname for t in self.targets]
+        snames = [s.boundname or s.frontend.boundname for s in self.sources]
+        if callable(self.action.command):
+            return command_string(self.action.command, tnames, snames, vars)
+        cmd = self.action.command
+        # substitute $(<[N])
+        for m in re.findall(r'(\$\(<\[(\d+)\]\))', cmd):
+            cmd = cmd.replace(m[0], tnames[int(m[1])])
+        # substitute $(>[N])
+        for m in re.findall(r'(\$\(>\[(\d+)\]\))', cmd):
+            cmd = cmd.replace(m[0], snames[int(m[1])])
+
+        vars.update([('<', tnames)])
+        vars.update([('>', snames)])
+        for v in vars:
+            cmd = cmd.replace('$({})'.format(v), ' '.join(vars.get(v, [])))
+        return cmd
+
+    async def run_async_subprocess(self):
+        if recipe.noexec:
+            # only report what would be done
             self.action.__status__([t.frontend for t in self.targets],
-                                   status, cmd, 0, stdout, stderr)
+                                   True, self.expand(), 0, '', '')
+            return True, '', ''
+        name = self.targets[0].name
+        trace.begin('wait', 'wait', id(self), target=name)
+        async with recipe.semaphore(self.priority()) as slot, \
+                   recipe.limiter(self.estimated_rss), \
+                   recipe.jobserver():
+            trace.end('wait', 'wait', id(self))
+            cmd = self.expand()
+            io = self.hermetic_io(cmd) if recipe.workers else None
+            start = time.monotonic()
+            with trace.span(self.action.qname, 'recipe', slot, target=name, command=cmd):
+                if io:
+                    status, stdout, stderr, (self.cpu, self.rss) = \
+                        await recipe.workers.run(cmd, *io, recipe.timeout,
+                                                 recipe.environment, recipe.jobserver.inherit)
+                else:
+                    status, stdout, stderr, (self.cpu, self.rss) = \
+                        await recipe.local.run(cmd, recipe.timeout,
+                                               recipe.environment, recipe.jobserver.inherit)
+            self.duration = time.monotonic() - start
+            self.action.__status__([t.frontend for t in self.targets],
+                                   status, cmd, self.duration, stdout, stderr)
         return status, stdout, stderr
 
     @staticmethod
     def run_subprocess(cmd):
-        # cmd.exe can't deal with multi-line commands, so use a temporary bat file.
-        bat = None
-        if sys.platform == 'win32' and ('\n' in cmd or '\r' in cmd):
-            bat = tempfile.NamedTemporaryFile(suffix='.bat', mode='w', delete=False)
-            with bat:
-                bat.write(cmd)
-            process = subprocess.Popen(['cmd.exe', '/Q', '/C', bat.name],
-                                       shell=False,
-                                       stdout=subprocess.PIPE,
-                                       stderr=subprocess.PIPE)
-        else:
-            process = subprocess.Popen(cmd,
-                                       shell=True,
-                                       stdout=subprocess.PIPE,
-                                       stderr=subprocess.PIPE)
-        stdout, stderr = process.communicate()
-        stdout = stdout and stdout.decode(encoding).strip()
-        stderr = stderr and stderr.decode(encoding).strip()
-        status = process.returncode == 0
-        if bat:
-            os.unlink(bat.name)
-        return status, stdout, stderr
+        return spawn(cmd)[:3]
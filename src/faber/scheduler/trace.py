@@ -0,0 +1,101 @@
+#
+# Copyright (c) 2018 Stefan Seefeld
+# All rights reserved.
+#
+# This file is part of Faber. It is made available under the
+# Boost Software License, Version 1.0.
+# (Consult LICENSE or http://www.boost.org/LICENSE_1_0.txt)
+
+"""Record scheduler events in the Chrome trace-event format,
+so a build can be inspected with a trace viewer such as Perfetto."""
+
+import json
+import time
+
+_tracer = None
+
+
+class _null(object):
+    """A span that doesn't record anything."""
+    def __enter__(self): return self
+    def __exit__(self, *args): pass
+
+
+_null_span = _null()
+
+
+class _span(object):
+    """A complete event spanning the execution of a block."""
+
+    def __init__(self, tracer, name, cat, tid, args):
+        self.tracer = tracer
+        self.event = dict(name=name, cat=cat, ph='X', pid=1, tid=tid, args=args)
+
+    def __enter__(self):
+        self.event['ts'] = self.tracer.now()
+        return self
+
+    def __exit__(self, *args):
+        self.event['dur'] = self.tracer.now() - self.event['ts']
+        self.tracer.events.append(self.event)
+
+
+class tracer(object):
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.events = []
+        self.start = time.monotonic()
+        self.threads = {0: 'scheduler'}
+
+    def now(self):
+        """Return the current time in microseconds."""
+        return (time.monotonic() - self.start) * 1e6
+
+    def write(self):
+        meta = [dict(name='thread_name', ph='M', pid=1, tid=tid, args=dict(name=name))
+                for tid, name in self.threads.items()]
+        with open(self.filename, 'w') as f:
+            json.dump(dict(traceEvents=meta + self.events, displayTimeUnit='ms'), f)
+
+
+def init(filename):
+    global _tracer
+    _tracer = tracer(filename) if filename else None
+
+
+def finish():
+    global _tracer
+    if _tracer:
+        _tracer.write()
+        _tracer = None
+
+
+def enabled():
+    return _tracer is not None
+
+
+def span(name, cat, slot=None, **args):
+    """Trace the execution of a block, either in the scheduler itself,
+    or in the given job slot."""
+
+    if not _tracer:
+        return _null_span
+    tid = 0 if slot is None else slot + 1
+    if tid not in _tracer.threads:
+        _tracer.threads[tid] = f'job {slot}'
+    return _span(_tracer, name, cat, tid, args)
+
+
+def begin(name, cat, id, **args):
+    """Mark the beginning of an asynchronous event, such as waiting for a job slot."""
+    if _tracer:
+        _tracer.events.append(dict(name=name, cat=cat, ph='b', id=id, pid=1, tid=0,
+                                   ts=_tracer.now(), args=args))
+
+
+def end(name, cat, id):
+    """Mark the end of an asynchronous event."""
+    if _tracer:
+        _tracer.events.append(dict(name=name, cat=cat, ph='e', id=id, pid=1, tid=0,
+                                   ts=_tracer.now()))
@@ -0,0 +1,203 @@
+#
+# Copyright (c) 2018 Stefan Seefeld
+# All rights reserved.
+#
+# This file is part of Faber. It is made available under the
+# Boost Software License, Version 1.0.
+# (Consult LICENSE or http://www.boost.org/LICENSE_1_0.txt)
+
+"""Snapshots of the evaluated dependency graph, to tell whether goals
+are up to date without processing any fabscripts.
+
+After a successful build, the graph of its goals is recorded, with the
+commands of all recipes, together with a manifest of what it was derived
+from: the content of all fabscripts, the parameters and options, and the
+tools (executables) the commands run. As long as the manifest still holds,
+a later build of the same goals only needs to compare timestamps in the
+recorded graph. If anything would need to be updated, or can't be decided
+from timestamps alone (such as notfile artefacts with recipes), the project
+is loaded and built as usual."""
+
+from . import __version__
+from .artefact import notfile, nopropagate, intermediate, nocare, always
+from .config.check import check
+from .module import module
+from . import scheduler
+from os.path import abspath, join, exists
+from shutil import which
+from itertools import dropwhile
+import hashlib
+import logging
+import pickle
+import shlex
+import os
+
+logger = logging.getLogger('scheduler')
+
+# node kinds
+ALIAS, SOURCE, GENERATED, VOLATILE = range(4)
+
+
+def _filename(builddir):
+    return join(builddir, '.faber', 'snapshot')
+
+
+def _digest(filename):
+    try:
+        with open(filename, 'rb') as f:
+            return hashlib.md5(f.read()).hexdigest()
+    except OSError:
+        return None
+
+
+def _mtime(filename):
+    try:
+        return os.stat(filename).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _load(builddir):
+    try:
+        with open(_filename(builddir), 'rb') as f:
+            data = pickle.load(f)
+    except (OSError, pickle.PickleError, EOFError, AttributeError, ValueError):
+        return None
+    return data if isinstance(data, dict) and data.get('version') == __version__ else None
+
+
+def _skip(a):
+    """Parts of the graph that are only needed to evaluate it, rather
+    than to update goals (assembly), or that are cached elsewhere (config checks)."""
+    return bool(a.attrs & nopropagate) or isinstance(a, check)
+
+
+def _program(cmd):
+    """Return the executable `cmd` runs, if it can be found."""
+    try:
+        words = shlex.split(cmd)
+    except ValueError:
+        return None
+    # skip leading variable assignments
+    words = list(dropwhile(lambda w: '=' in w, words))
+    return words and which(words[0])
+
+
+def _manifest(project, scripts, commands):
+    tools = set(filter(None, [_program(c) for c in commands]))
+    return dict(srcdir=abspath(project.srcdir),
+                parameters=dict(project.parameters),
+                options=dict(project.options),
+                scripts={s: _digest(s) for s in scripts},
+                tools={t: _mtime(t) for t in tools})
+
+
+def _valid(manifest, project):
+    return (manifest['srcdir'] == abspath(project.srcdir) and
+            manifest['parameters'] == dict(project.parameters) and
+            manifest['options'] == dict(project.options) and
+            all(_digest(s) == d for s, d in manifest['scripts'].items()) and
+            all(_mtime(t) == m for t, m in manifest['tools'].items()))
+
+
+def _graph(goals):
+    """Return the graph for `goals` as a list of (filename, kind, flags, prerequisites,
+    command) tuples, with prerequisites (indices) preceding their dependants."""
+
+    graph = {a: (p, r) for a, p, r in scheduler.walk(goals, skip=_skip)}
+    nodes, index = [], {}
+
+    def add(a, kind, attrs, prerequisites, command=None):
+        index[a] = len(nodes)
+        name = abspath(a.boundname) if not attrs & notfile else a.qname
+        nodes.append((name, kind, attrs, [index[p] for p in prerequisites], command))
+
+    stack = [(g, False) for g in goals]
+    while stack:
+        a, expanded = stack.pop()
+        if a in index:
+            continue
+        prerequisites, recipe = graph[a]
+        prerequisites = [p for p in prerequisites if p in graph]
+        if not expanded:
+            stack.append((a, True))
+            stack.extend([(p, False) for p in prerequisites if p not in index])
+            continue
+        headers = scheduler.headers(a.qname) or [] if a.depfile else []
+        # (the headers reported while compiling this time)
+        for h in headers:
+            if h not in index:
+                index[h] = len(nodes)
+                nodes.append((h, SOURCE, nocare, [], None))
+        if recipe:
+            kind = VOLATILE if a.attrs & (notfile | always) else GENERATED
+        else:
+            kind = ALIAS if a.attrs & notfile else SOURCE
+        add(a, kind, a.attrs, prerequisites + headers, recipe and recipe[1])
+    return nodes
+
+
+def _current(nodes):
+    """Tell whether all nodes are up to date, the way the scheduler would."""
+
+    stamps = []
+    for name, kind, attrs, prerequisites, _ in nodes:
+        newest = max([stamps[p] for p in prerequisites], default=0)
+        if kind == VOLATILE:
+            logger.info('{} needs to be updated'.format(name))
+            return False
+        elif kind == ALIAS:
+            stamps.append(newest)
+            continue
+        stamp = _mtime(name)
+        if stamp is None:
+            if kind == SOURCE and attrs & nocare:
+                stamps.append(0)
+            elif kind == GENERATED and attrs & intermediate:
+                # intermediates are removed after use, so go by what they are made from
+                stamps.append(newest)
+            else:
+                logger.info('{} is missing'.format(name))
+                return False
+        elif kind == GENERATED and stamp < newest:
+            logger.info('{} is outdated'.format(name))
+            return False
+        else:
+            stamps.append(stamp)
+    return True
+
+
+def current(project, goals):
+    """Tell whether `goals` (or the defaults, if None) are known to be up to date."""
+
+    data = _load(project.builddir)
+    if not data or not _valid(data['manifest'], project):
+        return False
+    nodes = data['graphs'].get(tuple(goals or ()))
+    return nodes is not None and _current(nodes)
+
+
+def record(project, goals, aa):
+    """Record the graph for `goals` (or the defaults, if None), after they
+    have been successfully updated as artefacts `aa`.
+    Precondition: the project is loaded."""
+
+    nodes = _graph(aa)
+    scripts = [abspath(join(m.srcdir, 'fabscript')) for m in module._instances.values()]
+    manifest = _manifest(project, scripts, [n[4] for n in nodes if n[4]])
+    data = _load(project.builddir)
+    if not data or data['manifest'] != manifest:
+        data = dict(version=__version__, manifest=manifest, graphs={})
+    data['graphs'][tuple(goals or ())] = nodes
+    filename = _filename(project.builddir)
+    tmp = filename + '.tmp'
+    with open(tmp, 'wb') as f:
+        pickle.dump(data, f, pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, filename)
+
+
+def discard(project):
+    """Discard any snapshot (e.g. after a failed build)."""
+
+    if exists(_filename(project.builddir)):
+        os.remove(_filename(project.builddir))
@@ -13,6 +13,8 @@ from .action import action
 from .error import ArgumentError
 from collections import defaultdict
 from copy import deepcopy
+from shutil import which
+import subprocess
 import logging
 
 logger = logging.getLogger('tools')
@@ -55,11 +57,38 @@ class tool_type(type):
 class tool(object):
 
     _instances = defaultdict(list)
+    _probes = None
     path_spec = ''
 
+    @staticmethod
+    def init(builddir):
+        from .cache import probes
+        tool._probes = probes(builddir)
+
     @staticmethod
     def finish():
         tool._instances.clear()
+        if tool._probes:
+            tool._probes.finish()
+            tool._probes = None
+
+    @staticmethod
+    def probe(cmd, env=()):
+        """Run `cmd` to discover some property of a tool, and return its output.
+        As long as neither the executable nor any of the environment variables
+        listed in `env` change, the output is reused across invocations."""
+
+        executable = which(cmd[0])
+        if executable is None:
+            raise FileNotFoundError('{}: command not found'.format(cmd[0]))
+        key = tool._probes.key(executable, cmd, env) if tool._probes else None
+        output = tool._probes[key] if key else None
+        if output is None:
+            logger.info('probe: {}'.format(' '.join(cmd)))
+            output = subprocess.check_output(cmd, universal_newlines=True)
+            if key:
+                tool._probes[key] = output
+        return output
 
     @classmethod
     def find_version_requirement(cls, features):
@@ -14,7 +14,6 @@ from ..assembly import implicit_rule as irule
 from . import compiler
 from .cc import *
 from .gcc import makedep_wrapper
-import subprocess
 import re
 
 # known architectures for each machine type
@@ -34,9 +33,9 @@ def validate(cls, command, version, features):
 
     features = set.instantiate(features)
     version = version or cls.find_version_requirement(features)
-    v = subprocess.check_output([command, '--version']).decode()
+    v = cls.probe([command, '--version'])
     v = re.match('.* version ([0-9.]+)', v).group(1)
-    m = subprocess.check_output([command, '-dumpmachine']).decode().strip()
+    m = cls.probe([command, '-dumpmachine']).strip()
     if version and v != version:
         raise ValueError('{} version mismatch: expected {}, got {}'
                          .format(command, version, v))
@@ -72,6 +71,20 @@ class makedep(action):
 class compile(action):
 
     command = 'clang $(cppflags) $(cflags) -c -o $(<) $(>)'
+    hermetic = True
+    cppflags = map(compiler.cppflags)
+    cppflags += map(compiler.define, translate, prefix='-D')
+    cppflags += map(compiler.include, translate, prefix='-I')
+    cppflags += map(compiler.scanner, select_if, 'depfile', '-MMD')
+    cppflags += map(compiler.pchfile, translate, prefix='-include-pch ')
+    cflags = map(compiler.cflags)
+    cflags += map(compiler.link, select_if, 'shared', '-fPIC')
+
+
+class precompile(action):
+
+    command = 'clang -x c-header $(cppflags) $(cflags) -o $(<) $(>)'
+    hermetic = True
     cppflags = map(compiler.cppflags)
     cppflags += map(compiler.define, translate, prefix='-D')
     cppflags += map(compiler.include, translate, prefix='-I')
@@ -106,8 +119,10 @@ class link(action):
 
 class clang(cc):
 
+    depfile = True
     makedep = makedep_wrapper(makedep())
     compile = compile()
+    precompile = precompile()
     archive = action('ar rc $(<) $(>)')
     link = link()
 
@@ -120,9 +135,11 @@ class clang(cc):
         if command:
             self.makedep.subst('clang', command)
             self.compile.subst('clang', command)
+            self.precompile.subst('clang', command)
             self.link.subst('clang', command)
 
         irule(self.compile, types.obj, types.cxx)
+        irule(self.precompile, types.pch, types.h)
         irule(self.archive, types.lib, types.obj)
         irule(self.link, types.bin, (types.obj, types.dso, types.lib))
         irule(self.link, types.dso, (types.obj, types.dso))
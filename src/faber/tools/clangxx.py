@@ -28,6 +28,21 @@ class makedep(action):
 class compile(action):
 
     command = 'clang++ $(cppflags) $(cxxflags) -c -o $(<) $(>)'
+    hermetic = True
+    cppflags = map(compiler.cppflags)
+    cppflags += map(compiler.define, translate, prefix='-D')
+    cppflags += map(compiler.include, translate, prefix='-I')
+    cppflags += map(compiler.scanner, select_if, 'depfile', '-MMD')
+    cppflags += map(compiler.pchfile, translate, prefix='-include-pch ')
+    cxxflags = map(compiler.cxxflags)
+    cxxflags += map(cxxstd, translate, prefix='-std=c++')
+    cxxflags += map(compiler.link, select_if, 'shared', '-fPIC')
+
+
+class precompile(action):
+
+    command = 'clang++ -x c++-header $(cppflags) $(cxxflags) -o $(<) $(>)'
+    hermetic = True
     cppflags = map(compiler.cppflags)
     cppflags += map(compiler.define, translate, prefix='-D')
     cppflags += map(compiler.include, translate, prefix='-I')
@@ -63,8 +78,10 @@ class link(action):
 
 class clangxx(cxx):
 
+    depfile = True
     makedep = makedep_wrapper(makedep())
     compile = compile()
+    precompile = precompile()
     archive = action('ar rc $(<) $(>)')
     link = link()
 
@@ -77,9 +94,11 @@ class clangxx(cxx):
         if command:
             self.makedep.subst('clang++', command)
             self.compile.subst('clang++', command)
+            self.precompile.subst('clang++', command)
             self.link.subst('clang++', command)
 
         irule(self.compile, types.obj, types.cxx)
+        irule(self.precompile, types.pch, types.hxx)
         irule(self.archive, types.lib, types.obj)
         irule(self.link, types.bin, (types.obj, types.dso, types.lib))
         irule(self.link, types.dso, (types.obj, types.dso))
@@ -30,11 +30,22 @@ libs = feature('libs', attributes=multi|incidental)
 target = feature('target', feature(name='os', sub=True), feature(name='arch', sub=True))
 runpath = feature('runpath', attributes=multi|path|incidental)
 soname = feature('soname', attributes=incidental)
+# scan sources for headers 'native'ly, using the 'compiler',
+# or read the 'depfile' the compiler writes during compilation
+scanner = feature('scanner', ['native', 'compiler', 'depfile'], attributes=incidental)
+# the precompiled header to compile with, and the header it was generated from
+# (see faber.artefacts.pch)
+pchfile = feature('pchfile', attributes=incidental)
+pchheader = feature('pchheader', attributes=incidental)
+# compile sources in batches of the given size (see faber.artefacts.unity)
+unity = feature('unity', attributes=incidental)
 
 
 class compiler(tool):
 
     path_spec = '{compiler.name}-{compiler.version}/{target.arch}/{link}/'
+    # whether compile actions can write dependency files (see 'scanner=depfile')
+    depfile = False
 
     @classmethod
     def split_libs(cls, sources):
@@ -57,7 +68,9 @@ class compiler(tool):
     def check_instance_for_type(type, features=None):
         """Make sure we have a matching compiler for the given type."""
         name = {types.c: 'cc',
-                types.cxx: 'cxx'}[type]
+                types.h: 'cc',
+                types.cxx: 'cxx',
+                types.hxx: 'cxx'}[type]
         mod = import_module('.{}'.format(name), 'faber.tools')
         return getattr(mod, name).instance(features)
 
@@ -30,6 +30,8 @@ class cxx(compiler.compiler):
     makedep = action()
     # Build object files from C++ source files.
     compile = action()
+    # Precompile C++ headers.
+    precompile = action()
     # Build (static) library archives from object files.
     archive = action()
     # Link binaries (executables or shared libraries).
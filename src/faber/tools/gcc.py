@@ -15,7 +15,6 @@ from . import compiler
 from .cc import *
 import os.path
 import os
-import subprocess
 
 # known architectures for each machine type
 marchs = dict(x86_64=['x86_64', 'x86'],
@@ -30,12 +29,17 @@ arch_flags = dict(x86_64=['-m64'],
                   w32=['-m32'])
 
 
+def include_pch(fv):
+    """GCC looks up a precompiled header `<header>.gch` whenever <header> is included."""
+    return ['-Winvalid-pch', '-include', os.path.splitext(fv._value)[0]] if fv else []
+
+
 def validate(cls, command, version, features):
 
     features = set.instantiate(features)
     version = version or cls.find_version_requirement(features)
-    v = subprocess.check_output([command, '-dumpversion']).decode().strip()
-    m = subprocess.check_output([command, '-dumpmachine']).decode().strip()
+    v = cls.probe([command, '-dumpversion']).strip()
+    m = cls.probe([command, '-dumpmachine']).strip()
     if version and v != version:
         raise ValueError('{} version mismatch: expected {}, got {}'
                          .format(command, version, v))
@@ -110,6 +114,20 @@ class makedep(action):
 class compile(action):
 
     command = 'gcc $(cppflags) $(cflags) -c -o $(<) $(>)'
+    hermetic = True
+    cppflags = map(compiler.cppflags)
+    cppflags += map(compiler.define, translate, prefix='-D')
+    cppflags += map(compiler.include, translate, prefix='-I')
+    cppflags += map(compiler.scanner, select_if, 'depfile', '-MMD')
+    cppflags += map(compiler.pchfile, include_pch)
+    cflags = map(compiler.cflags)
+    cflags += map(compiler.link, select_if, 'shared', '-fPIC')
+
+
+class precompile(action):
+
+    command = 'gcc -x c-header $(cppflags) $(cflags) -o $(<) $(>)'
+    hermetic = True
     cppflags = map(compiler.cppflags)
     cppflags += map(compiler.define, translate, prefix='-D')
     cppflags += map(compiler.include, translate, prefix='-I')
@@ -144,8 +162,10 @@ class link(action):
 
 class gcc(cc):
 
+    depfile = True
     makedep = makedep_wrapper(makedep())
     compile = compile()
+    precompile = precompile()
     archive = action('ar rc $(<) $(>)')
     link = link()
 
@@ -161,10 +181,12 @@ class gcc(cc):
             prefix = command[:-3] if command.endswith('gcc') else ''
             self.makedep.subst('gcc', command)
             self.compile.subst('gcc', command)
+            self.precompile.subst('gcc', command)
             self.archive.subst('ar', prefix + 'ar')
             self.link.subst('gcc', command)
 
         irule(self.compile, types.obj, types.c)
+        irule(self.precompile, types.pch, types.h)
         irule(self.archive, types.lib, types.obj)
         irule(self.link, types.bin, (types.obj, types.dso, types.lib))
         irule(self.link, types.dso, (types.obj, types.dso))
@@ -13,7 +13,7 @@ from .. import platform
 from ..assembly import implicit_rule as irule
 from . import compiler
 from .cxx import *
-from .gcc import validate, makedep_wrapper
+from .gcc import validate, makedep_wrapper, include_pch
 
 
 class makedep(action):
@@ -28,6 +28,21 @@ class makedep(action):
 class compile(action):
 
     command = 'g++ $(cppflags) $(cxxflags) -c -o $(<) $(>)'
+    hermetic = True
+    cppflags = map(compiler.cppflags)
+    cppflags += map(compiler.define, translate, prefix='-D')
+    cppflags += map(compiler.include, translate, prefix='-I')
+    cppflags += map(compiler.scanner, select_if, 'depfile', '-MMD')
+    cppflags += map(compiler.pchfile, include_pch)
+    cxxflags = map(compiler.cxxflags)
+    cxxflags += map(cxxstd, translate, prefix='-std=c++')
+    cxxflags += map(compiler.link, select_if, 'shared', '-fPIC')
+
+
+class precompile(action):
+
+    command = 'g++ -x c++-header $(cppflags) $(cxxflags) -o $(<) $(>)'
+    hermetic = True
     cppflags = map(compiler.cppflags)
     cppflags += map(compiler.define, translate, prefix='-D')
     cppflags += map(compiler.include, translate, prefix='-I')
@@ -63,8 +78,10 @@ class link(action):
 
 class gxx(cxx):
 
+    depfile = True
     makedep = makedep_wrapper(makedep())
     compile = compile()
+    precompile = precompile()
     archive = action('ar rc $(<) $(>)')
     link = link()
 
@@ -80,10 +97,12 @@ class gxx(cxx):
             prefix = command[:-3] if command.endswith('g++') else ''
             self.makedep.subst('g++', command)
             self.compile.subst('g++', command)
+            self.precompile.subst('g++', command)
             self.archive.subst('ar', prefix + 'ar')
             self.link.subst('g++', command)
 
         irule(self.compile, types.obj, types.cxx)
+        irule(self.precompile, types.pch, types.hxx)
         irule(self.archive, types.lib, types.obj)
         irule(self.link, types.bin, (types.obj, types.dso, types.lib))
         irule(self.link, types.dso, (types.obj, types.dso))
@@ -9,6 +9,7 @@
 from ..feature import feature, path, incidental
 from ..action import action
 from ..tool import tool
+from ..scheduler import fscache
 import os
 import os.path
 import stat
@@ -19,13 +20,13 @@ stage = feature('stage', attributes=path|incidental)
 
 
 def copyfile(source, target):
-    assert os.path.isfile(source)
+    assert fscache.isfile(source)
     # copy content,...
     shutil.copyfile(source, target)
     # ...stat,...
     shutil.copystat(source, target)
     # ...owner, and group
-    st = os.stat(source)
+    st = fscache.stat(source)
     if hasattr(os, 'chown'):  # not available on Windows
         os.chown(target, st[stat.ST_UID], st[stat.ST_GID])
 
@@ -45,9 +46,9 @@ class install(action):
     def command(targets, sources):
         t = targets[0]
         s = sources[0]
-        if os.path.isfile(s._filename):
+        if fscache.isfile(s._filename):
             copyfile(s._filename, t._filename)
-        elif os.path.isdir(s._filename):
+        elif fscache.isdir(s._filename):
             copydir(s._filename, t._filename)
         else:
             raise ValueError('Cannot install "{}"; neither a file nor directory.'.format(s._filename))
@@ -22,7 +22,6 @@ try:
 except ImportError:  # python 2
     import _winreg as winreg
 from collections import OrderedDict
-from subprocess import *
 from xml.dom.minidom import parseString
 import logging
 import os
@@ -84,18 +83,34 @@ class compile(action):
     cppflags = map(compiler.cppflags)
     cppflags += map(compiler.define, translate, prefix='/D')
     cppflags += map(compiler.include, translate, prefix='/I"', suffix='"')
+    cppflags += map(compiler.pchheader, translate, prefix='/Yu"', suffix='"')
+    cppflags += map(compiler.pchheader, translate, prefix='/FI"', suffix='"')
+    cppflags += map(compiler.pchfile, translate, prefix='/Fp"', suffix='"')
     cflags = map(compiler.cflags)
     cxxflags = map(compiler.cxxflags)
     cxxflags += map(cxxstd, translate, prefix='/std:c++')
 
 
+class precompile(action):
+
+    # compile the header itself, forcing its inclusion so /Yc knows where to stop
+    command = 'cl /nologo $(cppflags) $(cxxflags) /GR /MD /EHsc /c /TP /Yc"$(>)" /FI"$(>)" /Fp$(<) /Fo$(<).obj $(>)'
+    cppflags = map(compiler.cppflags)
+    cppflags += map(compiler.define, translate, prefix='/D')
+    cppflags += map(compiler.include, translate, prefix='/I"', suffix='"')
+    cxxflags = map(compiler.cxxflags)
+    cxxflags += map(cxxstd, translate, prefix='/std:c++')
+
+
 class link(action):
 
-    command = 'link /nologo $(ldflags) /out:$(<) $(>) $(libs)'
+    command = 'link /nologo $(ldflags) /out:$(<) $(>) $(pchobj) $(libs)'
     ldflags = map(compiler.ldflags)
     ldflags += map(compiler.linkpath, translate, prefix='/libpath:"', suffix='"')
     ldflags += map(compiler.link, select_if, 'shared', '/DLL')
     libs = map(compiler.libs, translate, suffix='.lib')
+    # the object precompile generated along with the precompiled header
+    pchobj = map(compiler.pchfile, translate, prefix='"', suffix='.obj"')
 
     def submit(self, targets, sources):
         # sources may contain object files as well as libraries
@@ -112,7 +127,8 @@ class link(action):
 
 class archive(action):
 
-    command = 'lib /nologo /out:$(<) $(>)'
+    command = 'lib /nologo /out:$(<) $(>) $(pchobj)'
+    pchobj = map(compiler.pchfile, translate, prefix='"', suffix='.obj"')
 
 
 class msvc(cc, cxx):
@@ -122,9 +138,12 @@ class msvc(cc, cxx):
     known_archs = ['x86_64', 'x86']
     win_archs = {'x86_64': 'x64',
                  'x86': 'x86'}
+    # environment variables affecting the output of vcvarsall.bat
+    probe_env = ('PATH', 'INCLUDE', 'LIB', 'LIBPATH')
 
     makedep = makedep_wrapper()
     compile = compile()
+    precompile = precompile()
     archive = archive()
     link = link()
 
@@ -169,12 +188,13 @@ class msvc(cc, cxx):
 
         self.makedep.cmd.subst('cl', '"{}\\{}"'.format(path, 'cl'))
         self.compile.subst('cl', '"{}\\{}"'.format(path, 'cl'))
+        self.precompile.subst('cl', '"{}\\{}"'.format(path, 'cl'))
         self.archive.subst('lib', '"{}\\{}"'.format(path, 'lib'))
         self.link.subst('link', '"{}\\{}"'.format(path, 'link'))
 
         # Extract INCLUDE, LIB, and LIBPATH from setup script
         setup = join(product_dir, 'vcvarsall.bat')
-        output = check_output([setup, msvc.win_archs[arch], '&', 'set']).decode()
+        output = self.probe([setup, msvc.win_archs[arch], '&', 'set'], env=msvc.probe_env)
         vars = dict(line.split('=', 1) for line in output.splitlines() if '=' in line)
         self.vars = {k: vars[k] for k in ('INCLUDE', 'LIB', 'LIBPATH')}
         include = compiler.include(*[i for i in self.vars['INCLUDE'].split(pathsep) if i])
@@ -185,6 +205,7 @@ class msvc(cc, cxx):
 
         irule(self.compile, types.obj, types.c)
         irule(self.compile, types.obj, types.cxx)
+        irule(self.precompile, types.pch, (types.hxx, types.h))
         irule(self.archive, types.lib, types.obj)
         irule(self.link, types.bin, (types.obj, types.dso, types.lib))
         irule(self.link, types.dso, (types.obj, types.dso, types.lib))
@@ -192,7 +213,7 @@ class msvc(cc, cxx):
     @classmethod
     def find_path(cls, product_dir, arch):
         setup = join(product_dir, 'vcvarsall.bat')
-        output = check_output([setup, arch, '&', 'set']).decode()
+        output = cls.probe([setup, arch, '&', 'set'], env=msvc.probe_env)
         vars = dict(line.split('=', 1) for line in output.splitlines() if '=' in line)
         path = vars['Path']
         for p in path.split(pathsep):
@@ -211,7 +232,7 @@ class msvc(cc, cxx):
                            '-requires', 'Microsoft.VisualStudio.Component.VC.Tools.x86.x64',
                            '-format', 'xml']
             logger.debug(f"executing {' '.join(vswhere_cmd)}")
-            output = check_output(vswhere_cmd).decode()
+            output = cls.probe(vswhere_cmd)
             instances = parseString(output).getElementsByTagName('instance')
             for i in instances:
                 installation_path = i.getElementsByTagName('installationPath')[0].childNodes[0].data
@@ -13,7 +13,6 @@ from ..tool import tool
 from .compiler import include, ldflags, linkpath, libs, target, runpath
 from .. import platform
 from os.path import join
-import subprocess
 import re
 import logging
 
@@ -39,7 +38,7 @@ class python(tool):
     run = run()
 
     def check_python(self, cmd):
-        return subprocess.check_output([self.command, '-c', cmd], universal_newlines=True).strip()
+        return self.probe([self.command, '-c', cmd], env=('PYTHONHOME',)).strip()
 
     def check_sysconfig(self, cmd):
         r = self.check_python(f'import sysconfig as c; print(c.{cmd})')
@@ -9,7 +9,6 @@
 from ..action import action
 from ..feature import set
 from ..tool import tool
-import subprocess
 import re
 
 
@@ -17,7 +16,7 @@ def validate(cls, command, version, features):
 
     features = set.instantiate(features)
     version = version or cls.find_version_requirement(features)
-    v = subprocess.check_output([command, '--version']).decode().strip()
+    v = cls.probe([command, '--version']).strip()
     v = re.match('.* ([0-9.]+)', v).group(1)
     if version and v != version:
         raise ValueError('{} version mismatch: expected {}, got {}'
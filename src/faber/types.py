@@ -120,6 +120,9 @@ class library(type):
 
 c = type('c', ['c'])
 cxx = type('cxx', ['cc', 'cxx', 'cpp', 'C'])
+h = type('h', ['h'])
+hxx = type('hxx', ['hpp', 'hxx', 'hh', 'H'])
+pch = type('pch', ['gch'], Windows=['pch'])
 obj = type('obj', ['o'], Windows=['obj'])
 bin = type('bin', [''], Windows=['exe'])
 lib = library('lib', ['a'], Windows=['lib'])
@@ -9,6 +9,7 @@
 from contextlib import contextmanager
 import string
 import sys
+import threading
 
 
 def add_metaclass(metaclass):
@@ -22,29 +23,61 @@ def add_metaclass(metaclass):
     return wrapper
 
 
+_captured = threading.local()
+_capturing = 0
+_capture_lock = threading.Lock()
+
+
+class _stream(object):
+    """Forward output to the current thread's capture buffer, if any,
+    so output can be captured per thread without swapping sys.stdout."""
+
+    def __init__(self, stream, name):
+        self._stream = stream
+        self._name = name
+
+    def _target(self):
+        return getattr(_captured, self._name, None) or self._stream
+
+    def write(self, data):
+        return self._target().write(data)
+
+    def flush(self):
+        return self._target().flush()
+
+    def __getattr__(self, name):
+        return getattr(self._target(), name)
+
+
 @contextmanager
 def capture_output():
-    if sys.version_info < (3, 0):
-        from io import StringIO
-
-        class TextIO(StringIO):
-            def write(self, data):
-                if not isinstance(data, unicode):  # noqa F821
-                    data = unicode(data, getattr(self, '_encoding', 'utf-8'), 'replace')  # noqa F821
-                StringIO.write(self, data)
-    else:
-        from io import StringIO as TextIO
-    out = TextIO()
-    err = TextIO()
-    stdout = sys.stdout
-    sys.stdout = out
-    stderr = sys.stderr
-    sys.stderr = err
+    """Capture the calling thread's output to sys.stdout and sys.stderr.
+    The forwarding streams are only installed while some thread captures,
+    so they always wrap the streams current at that time."""
+    global _capturing
+    from io import StringIO
+    with _capture_lock:
+        if not _capturing:
+            sys.stdout = _stream(sys.stdout, 'stdout')
+            sys.stderr = _stream(sys.stderr, 'stderr')
+        _capturing += 1
+    out = StringIO()
+    err = StringIO()
+    stdout = getattr(_captured, 'stdout', None)
+    stderr = getattr(_captured, 'stderr', None)
+    _captured.stdout, _captured.stderr = out, err
     try:
         yield out, err
     finally:
-        sys.stdout = stdout
-        sys.stderr = stderr
+        _captured.stdout, _captured.stderr = stdout, stderr
+        with _capture_lock:
+            _capturing -= 1
+            if not _capturing:
+                # leave streams alone that were replaced in the meantime
+                if isinstance(sys.stdout, _stream):
+                    sys.stdout = sys.stdout._stream
+                if isinstance(sys.stderr, _stream):
+                    sys.stderr = sys.stderr._stream
 
 
 def aslist(o):
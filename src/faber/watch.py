@@ -0,0 +1,155 @@
+#
+# Copyright (c) 2018 Stefan Seefeld
+# All rights reserved.
+#
+# This file is part of Faber. It is made available under the
+# Boost Software License, Version 1.0.
+# (Consult LICENSE or http://www.boost.org/LICENSE_1_0.txt)
+
+"""Continuous builds: rebuild whenever a file known to the build graph changes."""
+
+from . import scheduler
+from .daemon import daemon
+from os.path import abspath, dirname, join
+import select
+import struct
+import time
+import logging
+import sys
+import os
+
+summary_logger = logging.getLogger('summary')
+
+
+class poller(object):
+    """Detect modifications by periodically comparing file timestamps."""
+
+    def __init__(self, files, interval=0.5):
+        self.interval = interval
+        self.stamps = {f: self._stamp(f) for f in files}
+
+    @staticmethod
+    def _stamp(filename):
+        try:
+            st = os.stat(filename)
+            return st.st_mtime_ns, st.st_size
+        except OSError:
+            return None
+
+    def wait(self):
+        """Block until at least one file changed, and return the changed files."""
+        while True:
+            time.sleep(self.interval)
+            changed = [f for f, s in self.stamps.items() if self._stamp(f) != s]
+            if changed:
+                return changed
+
+    def close(self):
+        pass
+
+
+class inotify(object):
+    """Detect modifications using Linux's inotify API.
+    Rather than the files themselves their directories are watched,
+    so files replaced by editors (write to a temporary, then rename)
+    are noticed, too."""
+
+    IN_ATTRIB = 0x004
+    IN_CLOSE_WRITE = 0x008
+    IN_MOVED_TO = 0x080
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_CLOEXEC = 0o2000000
+    _event = struct.Struct('iIII')
+
+    def __init__(self, files, latency=0.05):
+        import ctypes
+        self._libc = ctypes.CDLL(None, use_errno=True)
+        self.latency = latency
+        self.files = set(files)
+        self.fd = self._libc.inotify_init1(self.IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.dirs = {}
+        mask = (self.IN_ATTRIB | self.IN_CLOSE_WRITE | self.IN_MOVED_TO |
+                self.IN_CREATE | self.IN_DELETE)
+        try:
+            for d in set(dirname(f) for f in self.files):
+                wd = self._libc.inotify_add_watch(self.fd, os.fsencode(d), mask)
+                if wd < 0:
+                    raise OSError(ctypes.get_errno(), 'unable to watch {}'.format(d))
+                self.dirs[wd] = d
+        except Exception:
+            self.close()
+            raise
+
+    def _read(self):
+        data = os.read(self.fd, 65536)
+        changed = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = self._event.unpack_from(data, offset)
+            offset += self._event.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            if wd in self.dirs:
+                filename = join(self.dirs[wd], os.fsdecode(name))
+                if filename in self.files:
+                    changed.add(filename)
+        return changed
+
+    def wait(self):
+        """Block until at least one file changed, and return the changed files."""
+        changed = set()
+        while not changed:
+            changed = self._read()
+        # modifications tend to come in bursts, so collect them all
+        while select.select([self.fd], [], [], self.latency)[0]:
+            changed |= self._read()
+        return sorted(changed)
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+def watcher(files):
+    """Return a watcher for the given files, using inotify where available,
+    and polling otherwise."""
+
+    files = [abspath(f) for f in files]
+    if sys.platform.startswith('linux'):
+        try:
+            return inotify(files)
+        except (OSError, AttributeError) as e:
+            summary_logger.info('...unable to use inotify ({}), polling instead...'.format(e))
+    return poller(files)
+
+
+def watch(project, goals):
+    """Build `goals`, then rebuild whenever one of their sources or
+    one of the project's fabscripts changes, until interrupted."""
+
+    d = daemon(project)
+    root = join(project.srcdir, 'fabscript')
+    try:
+        while True:
+            try:
+                d.build(goals)
+            except Exception as e:
+                print('Error: {}'.format(e))
+            files = set(d.scripts) | set(scheduler.sources()) | {root}
+            summary_logger.info('...watching {} files for changes...'.format(len(files)))
+            w = watcher(files)
+            try:
+                changed = w.wait()
+            finally:
+                w.close()
+            for f in changed:
+                summary_logger.info('...{} changed...'.format(f))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        d.close()
+    return True
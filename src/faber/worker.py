@@ -0,0 +1,174 @@
+#
+# Copyright (c) 2018 Stefan Seefeld
+# All rights reserved.
+#
+# This file is part of Faber. It is made available under the
+# Boost Software License, Version 1.0.
+# (Consult LICENSE or http://www.boost.org/LICENSE_1_0.txt)
+
+"""A worker agent, running commands on behalf of builds on other hosts
+(see :class:`faber.scheduler.executor.remote`).
+
+Each request carries a command together with its inputs, identified by
+their content digest. Inputs the worker hasn't seen yet are transferred,
+and kept in a content-addressed store for later requests. The command
+is then run in a fresh directory populated with its inputs, and its
+outputs are streamed back. Run it with::
+
+  python -m faber.worker --port 9000 [--jobs N] [DIR]
+
+The worker relies on the tools (compilers, system headers, etc.) used
+by the commands being installed on its host just as on the client.
+
+As the worker runs whatever commands it is sent, it only listens on
+`localhost` by default. To listen on other addresses (with `--host`),
+a token needs to be set in the `FABER_WORKER_TOKEN` environment variable,
+which clients then have to present (by setting the same variable)."""
+
+from .scheduler.executor import spawn, send_message, recv_message, send_file, recv_file
+from os.path import join, exists, dirname, normpath, isabs
+import socketserver
+import ipaddress
+import hmac
+import argparse
+import tempfile
+import logging
+import shutil
+import signal
+import sys
+import os
+
+logger = logging.getLogger('process')
+
+
+class handler(socketserver.BaseRequestHandler):
+
+    def handle(self):
+        try:
+            hello = recv_message(self.request)
+            token = str(hello.get('token') or '') if isinstance(hello, dict) else ''
+            if not hmac.compare_digest(token.encode('utf-8'),
+                                       (self.server.token or '').encode('utf-8')):
+                send_message(self.request, dict(error='invalid token'))
+                logger.warning('rejecting {}: invalid token'.format(self.client_address[0]))
+                return
+            send_message(self.request, dict(jobs=self.server.jobs))
+            while True:
+                self.run(recv_message(self.request))
+        except EOFError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.warning('dropping connection: {}'.format(e))
+
+    def _receive(self, inputs):
+        """Receive all inputs missing in the store."""
+
+        store = self.server.store
+        missing = []
+        for _, digest, _ in inputs:
+            if digest not in missing and not exists(join(store, digest)):
+                missing.append(digest)
+        send_message(self.request, dict(missing=missing))
+        for digest in missing:
+            # (the same input may be received over several connections at once)
+            fd, tmp = tempfile.mkstemp(dir=store, suffix='.incoming')
+            os.close(fd)
+            if recv_file(self.request, tmp) != digest:
+                os.remove(tmp)
+                raise ValueError('corrupt input {}'.format(digest))
+            os.replace(tmp, join(store, digest))
+
+    def run(self, request):
+
+        self._receive(request['inputs'])
+        work = tempfile.mkdtemp(prefix='faber-')
+        try:
+            def path(f):
+                f = normpath(f)
+                if isabs(f) or f.startswith(os.pardir):
+                    raise ValueError('invalid path {}'.format(f))
+                return join(work, f)
+            for f, digest, mode in request['inputs']:
+                os.makedirs(dirname(path(f)), exist_ok=True)
+                shutil.copyfile(join(self.server.store, digest), path(f))
+                os.chmod(path(f), mode)
+            outputs = [path(f) for f in request['outputs']]
+            for f in outputs:
+                os.makedirs(dirname(f), exist_ok=True)
+            logger.info(request['command'])
+            status, stdout, stderr, usage = spawn(request['command'], request['timeout'], cwd=work)
+            modes = [os.stat(f).st_mode & 0o777 if exists(f) else None for f in outputs]
+            # (empty output may be reported as bytes)
+            send_message(self.request, dict(status=status, stdout=stdout or '', stderr=stderr or '',
+                                            outputs=modes, usage=usage))
+            for f, mode in zip(outputs, modes):
+                if mode is not None:
+                    send_file(self.request, f)
+        finally:
+            shutil.rmtree(work, ignore_errors=True)
+
+
+def is_local(host):
+    """Tell whether `host` only accepts connections from this machine."""
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+class server(socketserver.ThreadingTCPServer):
+    """Serve requests, storing inputs in `store`. Use port 0
+    to have one assigned, and find it in `server_address`.
+    Clients need to present `token`, if given."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, store, host='localhost', port=0, jobs=None, token=None):
+        if not token and not is_local(host):
+            raise ValueError('a token is required to listen on {!r}'.format(host))
+        socketserver.ThreadingTCPServer.__init__(self, (host, port), handler)
+        self.store = os.path.abspath(store)
+        self.jobs = jobs or os.cpu_count() or 1
+        self.token = token
+        os.makedirs(self.store, exist_ok=True)
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='run commands for remote builds')
+    parser.add_argument('store', metavar='DIR', nargs='?',
+                        help='the directory to store inputs in (default: a temporary one)')
+    parser.add_argument('--host', default='localhost',
+                        help='the address to listen on (use \'\' for all interfaces; '
+                        'anything but localhost requires FABER_WORKER_TOKEN to be set)')
+    parser.add_argument('--port', type=int, default=9000, help='the port to listen on')
+    parser.add_argument('-j', '--jobs', type=int,
+                        help='the number of commands to run concurrently (default: number of CPUs)')
+    args = parser.parse_args(argv)
+    token = os.environ.get('FABER_WORKER_TOKEN')
+    if not token and not is_local(args.host):
+        parser.error('listening on {!r} requires FABER_WORKER_TOKEN to be set'.format(args.host))
+    logging.basicConfig(level=logging.WARNING)
+    store = args.store or tempfile.mkdtemp(prefix='faber-worker-')
+    # clean up when terminated
+    signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+    try:
+        with server(store, args.host, args.port, args.jobs, token) as s:
+            host, port = s.server_address[:2]
+            # let whoever started us know where to find us
+            print('listening on {}:{}'.format(host, port), flush=True)
+            try:
+                s.serve_forever()
+            except KeyboardInterrupt:
+                pass
+    finally:
+        if not args.store:
+            shutil.rmtree(store, ignore_errors=True)
+    return True
+
+
+if __name__ == '__main__':
+    sys.exit(0 if main() else 1)
@@ -17,12 +17,18 @@ class frontend(object):
     class fset(object):
         def eval(self, update=True): pass
 
+    class module(object):
+        name = ''
+
     def __init__(self, name, attrs):
         self.name = name
+        self.qname = self.name
         self.boundname = self.name
         self.attrs = attrs
         self.features = frontend.fset()
+        self.module = frontend.module()
         self.logfile=False
+        self.depfile=False
 
     def __status__(self, status): pass
 
@@ -34,6 +40,10 @@ def touch(fname, times=None):
 
 class action(object):
 
+    qname = 'touch'
+    tool = None
+    hermetic = False
+
     def __init__(self):
         self.command = lambda targets, sources, **vars: [touch(t.boundname) for t in targets]
 
@@ -10,6 +10,8 @@ from faber.scheduler.artefact import *
 from . import make_artefact, touch
 import pytest
 from os.path import exists, join
+import os
+import sys
 
 
 @pytest.mark.asyncio
@@ -134,3 +136,231 @@ async def test_temp_dep3(tempdir):
     await c.process()
     assert b.recipe.status, 'b was not updated'
     assert c.recipe.status, 'c was not updated'
+
+
+@pytest.mark.asyncio
+async def test_signatures(tempdir):
+    """Test that an artefact is only updated if the content of its prerequisites changed."""
+    from faber.scheduler.recipe import recipe
+    from faber.cache import signatures
+
+    async def process():
+        artefact.init(signatures=signatures(tempdir))
+        recipe.init()
+        a = make_artefact(join(tempdir, 'a'))
+        b = make_artefact(join(tempdir, 'b'), touch=True, prerequisites=[a])
+        await b.process()
+        artefact.finish()
+        return b
+
+    with open(join(tempdir, 'a'), 'w') as f:
+        f.write('hello')
+    b = await process()
+    assert b.recipe.status, 'b was not updated'
+    st = os.stat(b.name)
+    # make a appear newer than b, without changing its content
+    touch(join(tempdir, 'a'), (st.st_atime + 10, st.st_mtime + 10))
+    b = await process()
+    assert b.recipe.status is None, 'b was wrongly updated'
+    with open(join(tempdir, 'a'), 'w') as f:
+        f.write('world')
+    touch(join(tempdir, 'a'), (st.st_atime + 20, st.st_mtime + 20))
+    b = await process()
+    assert b.recipe.status, 'b was not updated'
+
+
+@pytest.mark.asyncio
+async def test_temp_signatures(tempdir):
+    """Test that an artefact is only updated if the content of the sources
+    of an intermediate prerequisite (which is removed after use) changed."""
+    from faber.scheduler.recipe import recipe
+    from faber.cache import signatures
+
+    async def process():
+        artefact.init(signatures=signatures(tempdir))
+        recipe.init()
+        a = make_artefact(join(tempdir, 'a'))
+        b = make_artefact(join(tempdir, 'b'), attrs=flag.TEMP, touch=True, prerequisites=[a])
+        c = make_artefact(join(tempdir, 'c'), touch=True, prerequisites=[b])
+        await c.process()
+        artefact.finish()
+        return b, c
+
+    with open(join(tempdir, 'a'), 'w') as f:
+        f.write('hello')
+    b, c = await process()
+    assert c.recipe.status, 'c was not updated'
+    assert not exists(b.name), 'b was not removed'
+    st = os.stat(c.name)
+    # make a appear newer than c, without changing its content
+    touch(join(tempdir, 'a'), (st.st_atime + 10, st.st_mtime + 10))
+    b, c = await process()
+    assert b.recipe.status is None, 'b was wrongly updated'
+    assert c.recipe.status is None, 'c was wrongly updated'
+    with open(join(tempdir, 'a'), 'w') as f:
+        f.write('world')
+    touch(join(tempdir, 'a'), (st.st_atime + 20, st.st_mtime + 20))
+    b, c = await process()
+    assert b.recipe.status, 'b was not updated'
+    assert c.recipe.status, 'c was not updated'
+
+
+@pytest.mark.asyncio
+async def test_buildlog(tempdir):
+    """Test that an artefact is updated if its command or prerequisites changed."""
+    from faber.scheduler.recipe import recipe
+    from faber.cache import buildlog
+
+    async def process(flags, prerequisites):
+        artefact.init(buildlog=buildlog(tempdir))
+        recipe.init()
+        prerequisites = [make_artefact(join(tempdir, p)) for p in prerequisites]
+        b = make_artefact(join(tempdir, 'b'), touch=True, prerequisites=prerequisites)
+        b.recipe.action.map = lambda features: {'flags': flags}
+        await b.process()
+        artefact.finish()
+        return b
+
+    touch(join(tempdir, 'a'))
+    touch(join(tempdir, 'c'))
+    b = await process('-O1', ['a'])
+    assert b.recipe.status, 'b was not updated'
+    b = await process('-O1', ['a'])
+    assert b.recipe.status is None, 'b was wrongly updated'
+    b = await process('-O2', ['a'])
+    assert b.recipe.status, 'b was not updated after its command changed'
+    b = await process('-O2', ['a', 'c'])
+    assert b.recipe.status, 'b was not updated after its prerequisites changed'
+    b = await process('-O2', ['a', 'c'])
+    assert b.recipe.status is None, 'b was wrongly updated'
+
+
+@pytest.mark.asyncio
+@pytest.mark.skipif(sys.platform == 'win32', reason='requires a POSIX shell')
+async def test_cache(tempdir):
+    """Test that artefacts are retrieved from the cache if their command
+    and the content of their prerequisites are unchanged."""
+    from faber.scheduler.recipe import recipe
+    from faber.cache import artefactcache
+
+    a, b, log = join(tempdir, 'a'), join(tempdir, 'b'), join(tempdir, 'log')
+
+    async def process(max_size=1 << 20):
+        cache = artefactcache(join(tempdir, 'cache'), max_size)
+        artefact.init()
+        recipe.init(cache=cache)
+        b_ = make_artefact(b, touch=True, prerequisites=[make_artefact(a)])
+        b_.recipe.action.command = f'cat {a} > $(<) && echo run >> {log}'
+        await b_.process()
+        hits = cache.hits
+        recipe.finish()
+        artefact.finish()
+        return b_, hits
+
+    def runs():
+        with open(log) as f:
+            return len(f.readlines())
+
+    with open(a, 'w') as f:
+        f.write('hello')
+    b_, hits = await process()
+    assert b_.recipe.status and runs() == 1 and hits == 0
+    # a removed artefact is retrieved from the cache...
+    os.remove(b)
+    b_, hits = await process()
+    assert b_.recipe.status and runs() == 1 and hits == 1
+    with open(b) as f:
+        assert f.read() == 'hello'
+    # ...unless a prerequisite changed
+    with open(a, 'w') as f:
+        f.write('world')
+    b_, hits = await process()
+    assert b_.recipe.status and runs() == 2 and hits == 0
+    # entries are evicted once the cache grows too large
+    os.remove(b)
+    await process(max_size=0)
+    os.remove(b)
+    b_, hits = await process()
+    assert b_.recipe.status and runs() == 3 and hits == 0
+
+
+@pytest.mark.asyncio
+@pytest.mark.usefixtures('scheduler')
+async def test_cycle():
+    """Test that dependency cycles are detected, no matter in which order edges are added."""
+    a = make_artefact('a', attrs=flag.NOTFILE)
+    b = make_artefact('b', attrs=flag.NOTFILE)
+    c = make_artefact('c', attrs=flag.NOTFILE)
+    d = make_artefact('d', attrs=flag.NOTFILE)
+    c.add_prerequisite(d)
+    a.add_prerequisite(b)
+    b.add_prerequisite(c)
+    with pytest.raises(dependency_error):
+        d.add_prerequisite(a)
+    with pytest.raises(dependency_error):
+        a.add_prerequisite(a)
+    # a diamond is not a cycle
+    a.add_prerequisite(d)
+
+
+@pytest.mark.asyncio
+@pytest.mark.usefixtures('scheduler')
+async def test_deep_graph():
+    """Test that deep dependency chains don't exhaust the stack."""
+    depth = 3 * sys.getrecursionlimit()
+    a = make_artefact('a0', attrs=flag.NOTFILE)
+    for i in range(1, depth):
+        b = make_artefact(f'a{i}', attrs=flag.NOTFILE)
+        b.add_prerequisite(a)
+        a = b
+    await a.process()
+    assert a.progress == progress.DONE, 'a is still incomplete'
+
+
+@pytest.mark.asyncio
+@pytest.mark.usefixtures('scheduler')
+async def test_critical_path():
+    """Test that the critical path follows the longest chain of dependants."""
+    a = make_artefact('a', touch=True)
+    b = make_artefact('b', touch=True, prerequisites=[a])
+    c = make_artefact('c', touch=True, prerequisites=[b])
+    d = make_artefact('d', attrs=flag.NOTFILE, prerequisites=[a, c])
+    assert d.critical_path() == 0.
+    assert c.critical_path() == 1.
+    assert a.critical_path() == 3.
+    # new dependants extend the paths of all prerequisites
+    e = make_artefact('e', touch=True, prerequisites=[c])
+    f = make_artefact('f', touch=True)
+    f.add_prerequisite(e)
+    assert c.critical_path() == 3.
+    assert a.critical_path() == 5.
+
+
+def test_depslog(tempdir):
+    """Test that the deps log survives reloading, truncation and compaction."""
+    from faber.cache import depslog
+
+    log = depslog(tempdir)
+    log.record('a.o', ['a.h', 'b.h'], 1)
+    log['b.o'] = ['b.h']
+    log.finish()
+    log = depslog(tempdir)
+    assert log.lookup('a.o') == (1, ['a.h', 'b.h'])
+    assert log.get('b.o') == ['b.h']
+    assert log.get('c.o') is None
+    log.record('c.o', ['c.h'])
+    log.finish()
+    # simulate an interrupted write
+    with open(log.filename, 'r+b') as f:
+        f.truncate(os.path.getsize(log.filename) - 2)
+    log = depslog(tempdir)
+    assert log.get('c.o') is None and log.get('b.o') == ['b.h']
+    # superseded records are eventually compacted away
+    for i in range(depslog.compaction_count + 1):
+        log.record('a.o', ['a.h'], i)
+    log.finish()
+    size = os.path.getsize(log.filename)
+    log = depslog(tempdir)
+    assert os.path.getsize(log.filename) < size
+    assert log.lookup('a.o') == (depslog.compaction_count, ['a.h'])
+    assert log.get('b.o') == ['b.h']
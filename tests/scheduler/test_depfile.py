@@ -0,0 +1,20 @@
+#
+# Copyright (c) 2018 Stefan Seefeld
+# All rights reserved.
+#
+# This file is part of Faber. It is made available under the
+# Boost Software License, Version 1.0.
+# (Consult LICENSE or http://www.boost.org/LICENSE_1_0.txt)
+
+from faber.scheduler import depfile
+from os.path import join
+
+
+def test_parse(tempdir):
+    """Test that prerequisites are read from a make-style dependency file."""
+    filename = join(tempdir, 'hello.d')
+    with open(filename, 'w') as f:
+        f.write('build/hello.o: hello.cpp greet.h \\\n'
+                ' include/with\\ space.h\n'
+                'greet.h:\n')
+    assert depfile.parse(filename) == ['greet.h', 'include/with space.h']
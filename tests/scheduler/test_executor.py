@@ -0,0 +1,83 @@
+#
+# Copyright (c) 2018 Stefan Seefeld
+# All rights reserved.
+#
+# This file is part of Faber. It is made available under the
+# Boost Software License, Version 1.0.
+# (Consult LICENSE or http://www.boost.org/LICENSE_1_0.txt)
+
+from faber.scheduler.executor import remote
+from faber.worker import server
+from test.common import cwd
+import threading
+import pytest
+import sys
+import os
+from os.path import join
+
+
+@pytest.mark.asyncio
+@pytest.mark.skipif(sys.platform == 'win32', reason='requires a POSIX shell')
+async def test_remote(tempdir):
+
+    s = server(join(tempdir, 'store'), 'localhost', 0, jobs=2)
+    t = threading.Thread(target=s.serve_forever)
+    t.start()
+    src = join(tempdir, 'src')
+    os.makedirs(join(src, 'include'))
+    with open(join(src, 'include', 'in'), 'w') as f:
+        f.write('content\n')
+    w = remote(['localhost:{}'.format(s.server_address[1])])
+    try:
+        assert w.slots == 2
+        with cwd(src):
+            cmd = 'cat include/in > out/result && pwd >> out/result'
+            status, stdout, stderr, _ = await w.run(cmd, ['include/in'], ['out/result'])
+            assert status
+            with open('out/result') as f:
+                content, where = f.read().splitlines()
+            # the command ran elsewhere...
+            assert content == 'content' and where != os.getcwd()
+            # ...and its inputs were kept for later
+            assert len(os.listdir(join(tempdir, 'store'))) == 1
+            status, _, stderr, _ = await w.run('false', ['include/in'], [])
+            assert not status
+        # without a worker, commands are run locally
+        s.shutdown()
+        s.server_close()
+        for c in w.connections:
+            c.sock.shutdown(2)
+        with cwd(src):
+            os.remove('out/result')
+            status, _, _, _ = await w.run(cmd, ['include/in'], ['out/result'])
+            assert status
+            with open('out/result') as f:
+                assert f.read().splitlines()[1] == os.getcwd()
+    finally:
+        w.close()
+        s.shutdown()
+        s.server_close()
+        t.join()
+
+
+def test_token(tempdir):
+
+    # workers only listen publicly with a token...
+    with pytest.raises(ValueError):
+        server(join(tempdir, 'store'), '', 0)
+    s = server(join(tempdir, 'store'), 'localhost', 0, jobs=1, token='secret')
+    t = threading.Thread(target=s.serve_forever)
+    t.start()
+    try:
+        address = 'localhost:{}'.format(s.server_address[1])
+        # ...which clients need to present
+        w = remote([address])
+        assert w.slots == 0
+        w.close()
+        w = remote([address], token='secret')
+        assert w.slots == 1
+        w.close()
+    finally:
+        s.shutdown()
+        s.server_close()
+        t.join()
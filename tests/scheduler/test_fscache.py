@@ -0,0 +1,39 @@
+#
+# Copyright (c) 2018 Stefan Seefeld
+# All rights reserved.
+#
+# This file is part of Faber. It is made available under the
+# Boost Software License, Version 1.0.
+# (Consult LICENSE or http://www.boost.org/LICENSE_1_0.txt)
+
+from faber.scheduler.fscache import fscache
+from os.path import join
+from unittest.mock import patch
+import os
+
+
+def test_fscache(tempdir):
+    """Test that paths are stat'ed at most once, and that
+    reported changes are taken into account."""
+    a = join(tempdir, 'a')
+    with open(a, 'w'):
+        pass
+    fs = fscache()
+    with patch('os.stat', wraps=os.stat) as stat:
+        assert fs.isfile(a) and fs.stat(a) and fs.lexists(a)
+        # missing files are found in the directory listing
+        assert not fs.lexists(join(tempdir, 'b')) and fs.stat(join(tempdir, 'b')) is None
+        assert stat.call_count == 1
+    d = join(tempdir, 'x', 'y')
+    fs.makedirs(d)
+    assert fs.isdir(d) and fs.lexists(join(tempdir, 'x'))
+    assert fs.isdir(os.curdir) and fs.isdir(join(tempdir, os.curdir))
+    b = join(d, 'b')
+    assert not fs.lexists(b)
+    with open(b, 'w'):
+        pass
+    fs.updated(b)
+    assert fs.lexists(b) and fs.isfile(b)
+    os.remove(b)
+    fs.removed(b)
+    assert not fs.lexists(b) and fs.stat(b) is None
@@ -0,0 +1,58 @@
+#
+# Copyright (c) 2018 Stefan Seefeld
+# All rights reserved.
+#
+# This file is part of Faber. It is made available under the
+# Boost Software License, Version 1.0.
+# (Consult LICENSE or http://www.boost.org/LICENSE_1_0.txt)
+
+import asyncio
+import os
+import sys
+import pytest
+
+pytestmark = pytest.mark.skipif(not os.path.exists('/proc/self/fd'),
+                                reason='requires /proc/self/fd')
+
+
+@pytest.mark.asyncio
+async def test_tokens():
+    """Test that no more than the available tokens are handed out."""
+    from faber.scheduler.jobserver import server
+
+    js = server(3)
+    try:
+        tokens = [await js.acquire() for i in range(3)]
+        assert tokens == [None, b'+', b'+']
+        pending = asyncio.ensure_future(js.acquire())
+        await asyncio.sleep(0.1)
+        assert not pending.done()
+        js.release(tokens.pop())
+        assert await asyncio.wait_for(pending, timeout=1) == b'+'
+    finally:
+        js.close()
+
+
+@pytest.mark.asyncio
+async def test_client():
+    """Test that a jobserver advertised in MAKEFLAGS is picked up,
+    and that its tokens are shared with child processes."""
+    from faber.scheduler.jobserver import server, client
+    from faber.scheduler.recipe import spawn
+
+    js = server(2)
+    try:
+        c = client.from_environment(dict(MAKEFLAGS='k' + js.makeflags))
+        assert c.inherit == js.inherit
+        assert c.jobs == 2
+        assert await c.acquire() is None
+        assert await c.acquire() == b'+'
+        c.release(b'+')
+        c.close()
+        if sys.platform != 'win32':
+            env = dict(os.environ, MAKEFLAGS=js.makeflags)
+            status, stdout, _, _ = spawn('echo $MAKEFLAGS', env=env, pass_fds=js.inherit)
+            assert status and '--jobserver-auth=' in stdout
+        assert client.from_environment(dict(MAKEFLAGS='-k')) is None
+    finally:
+        js.close()
@@ -7,6 +7,7 @@
 # (Consult LICENSE or http://www.boost.org/LICENSE_1_0.txt)
 
 import asyncio
+import sys
 import pytest
 
 
@@ -18,3 +19,103 @@ async def test_timeout():
         await asyncio.wait_for(asyncio.sleep(1), timeout=0.1)
     except asyncio.TimeoutError:
         pass
+
+
+@pytest.mark.asyncio
+async def test_dispatcher():
+    """Test that waiting recipes are granted slots in order of priority."""
+    from faber.scheduler.recipe import dispatcher
+
+    d = dispatcher(1)
+    order = []
+
+    async def run(priority):
+        async with d(priority):
+            order.append(priority)
+            await asyncio.sleep(0)
+
+    slot = await d.acquire()
+    tasks = [asyncio.ensure_future(run(p)) for p in (1, 3, 2)]
+    await asyncio.sleep(0)  # let all tasks queue up
+    d.release(slot)
+    await asyncio.gather(*tasks)
+    assert order == [3, 2, 1]
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason='requires a POSIX shell')
+def test_spawn():
+    """Test that a subprocess' output and resource usage are reported."""
+    from faber.scheduler.recipe import spawn
+
+    status, stdout, stderr, (cpu, rss) = spawn('echo hello')
+    assert status and stdout == 'hello'
+    assert cpu is not None and rss > 0
+    # output exceeding the pipe buffers, on both streams
+    status, stdout, stderr, usage = spawn('yes | head -c 200000; yes | head -c 200000 >&2; exit 3')
+    assert not status
+    assert len(stdout) == len(stderr) == 199999
+    status, stdout, stderr, usage = spawn('sleep 5', timeout=0.1)
+    assert not status
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason='requires a POSIX shell')
+def test_simple_command():
+    """Test that only commands without shell syntax are executed directly."""
+    from faber.scheduler.recipe import simple_command, spawn
+
+    assert simple_command('gcc -c -DX=1 "a b.c" -o a.o') == \
+        ['gcc', '-c', '-DX=1', 'a b.c', '-o', 'a.o']
+    for cmd in ['echo $HOME', 'a && b', 'a > b', 'cd x', 'X=1 a', 'ls *.c', 'a\nb']:
+        assert simple_command(cmd) is None
+    status, stdout, stderr, usage = spawn('echo "a  b"')
+    assert status and stdout == 'a  b'
+    status, stdout, stderr, usage = spawn('no-such-command x')
+    assert not status and 'no-such-command' in stderr
+
+
+@pytest.mark.asyncio
+async def test_limiter():
+    """Test that jobs are only admitted if their expected memory usage fits."""
+    from faber.scheduler.recipe import limiter
+
+    l = limiter(max_memory=100)
+    # the first job is always admitted
+    await l.acquire(150)
+    assert not l.admissible(10)
+    second = asyncio.ensure_future(l.acquire(10))
+    await asyncio.sleep(0)
+    assert not second.done()
+    l.release(150)
+    await asyncio.wait_for(second, 1.)
+    assert l.admissible(90) and not l.admissible(91)
+
+
+@pytest.mark.asyncio
+async def test_callables():
+    """Test that callable actions run concurrently, with their output
+    captured separately."""
+    from faber.scheduler.artefact import artefact
+    from faber.scheduler.recipe import recipe
+    from . import frontend, action
+    import time
+
+    def command(targets, sources):
+        time.sleep(0.2)
+        print(targets[0].name)
+
+    artefact.init()
+    recipe.init(jobs=2)
+    try:
+        rr = []
+        for name in ('a', 'b'):
+            a = artefact(frontend(name, 0))
+            r = recipe(action(), [a], [])
+            r.action.command = command
+            rr.append(r)
+        start = time.monotonic()
+        assert all(await asyncio.gather(*[r() for r in rr]))
+        assert time.monotonic() - start < 0.35
+        assert [r.stdout for r in rr] == ['a\n', 'b\n']
+    finally:
+        recipe.finish()
+        artefact.finish()
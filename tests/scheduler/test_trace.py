@@ -0,0 +1,34 @@
+#
+# Copyright (c) 2018 Stefan Seefeld
+# All rights reserved.
+#
+# This file is part of Faber. It is made available under the
+# Boost Software License, Version 1.0.
+# (Consult LICENSE or http://www.boost.org/LICENSE_1_0.txt)
+
+from faber.scheduler import trace
+from os.path import join
+import json
+
+
+def test_trace(tempdir):
+    """Test that traced events are written in Chrome trace-event format."""
+    filename = join(tempdir, 'trace.json')
+    trace.init(filename)
+    assert trace.enabled()
+    with trace.span('bind', 'bind'):
+        pass
+    trace.begin('wait', 'wait', 1)
+    trace.end('wait', 'wait', 1)
+    with trace.span('compile', 'recipe', 0, command='cc'):
+        pass
+    trace.finish()
+    assert not trace.enabled()
+    with open(filename) as f:
+        events = json.load(f)['traceEvents']
+    threads = {e['tid']: e['args']['name'] for e in events if e['ph'] == 'M'}
+    assert threads == {0: 'scheduler', 1: 'job 0'}
+    spans = [e for e in events if e['ph'] == 'X']
+    assert [(e['name'], e['tid']) for e in spans] == [('bind', 0), ('compile', 1)]
+    assert spans[1]['args']['command'] == 'cc'
+    assert [e['ph'] for e in events if e['name'] == 'wait'] == ['b', 'e']
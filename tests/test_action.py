@@ -15,6 +15,7 @@ from faber.utils import capture_output
 from test.common import pyecho
 from os.path import exists
 import pytest
+import sys
 try:
     from unittest.mock import patch
 except ImportError:
@@ -50,6 +51,18 @@ def test_call_index():
     assert err.getvalue() == ''
 
 
+def test_capture_output(capsys):
+    """Check that capturing doesn't leave its streams installed,
+    so later output goes to the streams that are current then."""
+    stdout, stderr = sys.stdout, sys.stderr
+    with capture_output() as (out, err):
+        print('captured')
+    assert sys.stdout is stdout and sys.stderr is stderr
+    assert out.getvalue() == 'captured\n'
+    print('not captured')
+    assert capsys.readouterr().out == 'not captured\n'
+
+
 @pytest.mark.usefixtures('module')
 def test_recipe():
     """Check that an artefact's __recipe__ method is called to report
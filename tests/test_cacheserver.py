@@ -0,0 +1,82 @@
+#
+# Copyright (c) 2018 Stefan Seefeld
+# All rights reserved.
+#
+# This file is part of Faber. It is made available under the
+# Boost Software License, Version 1.0.
+# (Consult LICENSE or http://www.boost.org/LICENSE_1_0.txt)
+
+from faber.cacheserver import server
+from faber.cache import remotecache
+from test.common import tempdir
+import urllib.request
+import urllib.error
+import threading
+import hashlib
+import pytest
+import os
+from os.path import join
+
+
+def test_remotecache():
+
+    with tempdir() as root:
+        s = server(join(root, 'cache'), 'localhost')
+        t = threading.Thread(target=s.serve_forever)
+        t.start()
+        try:
+            url = 'http://localhost:{}'.format(s.server_port)
+            out = join(root, 'out')
+            with open(out, 'wb') as f:
+                f.write(b'content')
+            os.chmod(out, 0o755)
+            key = hashlib.md5(b'key').hexdigest()
+
+            cache = remotecache(url)
+            assert cache.retrieve(key, [out]) is None
+            cache.store(key, [out], 'stdout', 'stderr')
+            cache.finish()
+            assert cache.pending == 0
+
+            os.remove(out)
+            cache = remotecache(url)
+            assert cache.retrieve(key, [out]) == ('stdout', 'stderr')
+            with open(out, 'rb') as f:
+                assert f.read() == b'content'
+            assert os.stat(out).st_mode & 0o777 == 0o755
+            assert (cache.hits, cache.misses) == (1, 0)
+            cache.finish()
+
+            # blobs whose content doesn't match their address are rejected
+            digest = hashlib.sha256(b'content').hexdigest()
+            request = urllib.request.Request(url + '/cas/' + digest, data=b'other', method='PUT')
+            with pytest.raises(urllib.error.HTTPError):
+                urllib.request.urlopen(request)
+            # ...as are attempts to replace action results
+            request = urllib.request.Request(url + '/ac/' + key, data=b'{}', method='PUT')
+            with pytest.raises(urllib.error.HTTPError) as e:
+                urllib.request.urlopen(request)
+            assert e.value.code == 409
+        finally:
+            s.shutdown()
+            s.server_close()
+            t.join()
+
+
+def test_unreachable():
+
+    with tempdir() as root:
+        out = join(root, 'out')
+        with open(out, 'w') as f:
+            f.write('content')
+        # find a port nobody listens on
+        s = server(join(root, 'cache'), 'localhost')
+        url = 'http://localhost:{}'.format(s.server_port)
+        s.server_close()
+        cache = remotecache(url, timeout=1)
+        assert cache.retrieve('0' * 32, [out]) is None
+        assert cache.failed
+        # a failed cache isn't consulted again
+        cache.store('0' * 32, [out])
+        cache.finish()
+        assert cache.pending == 0
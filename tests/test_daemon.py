@@ -0,0 +1,60 @@
+#
+# Copyright (c) 2018 Stefan Seefeld
+# All rights reserved.
+#
+# This file is part of Faber. It is made available under the
+# Boost Software License, Version 1.0.
+# (Consult LICENSE or http://www.boost.org/LICENSE_1_0.txt)
+
+from faber import daemon, client
+from test.common import tempdir, write_fabscript
+import pytest
+import subprocess
+import time
+import sys
+import os
+from os.path import join, exists
+
+script = """
+copy = action('copy', 'cp $(>) $(<)')
+out = rule(copy, 'out', 'in')
+default = out
+"""
+
+
+@pytest.mark.skipif(not daemon.supported(), reason='requires unix sockets with fd passing')
+def test_daemon():
+
+    with tempdir() as root:
+        write_fabscript(root, script)
+        with open(join(root, 'in'), 'w') as f:
+            f.write('first')
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+        server = subprocess.Popen([sys.executable, '-m', 'faber.cli', '--daemon',
+                                   '--srcdir', root, '--builddir', root], env=env)
+        try:
+            for i in range(100):
+                if exists(daemon.address(root)):
+                    break
+                time.sleep(0.1)
+            assert client.request(root, command='build', goals=[])
+            with open(join(root, 'out')) as f:
+                assert f.read() == 'first'
+            # update a source...
+            time.sleep(0.01)
+            with open(join(root, 'in'), 'w') as f:
+                f.write('second')
+            assert client.request(root, command='build', goals=[])
+            with open(join(root, 'out')) as f:
+                assert f.read() == 'second'
+            # ...and the fabscript
+            write_fabscript(root, script.replace("'out'", "'out2'"))
+            assert client.request(root, command='build', goals=['out2'])
+            assert exists(join(root, 'out2'))
+            assert not client.request(root, command='build', goals=['unknown'])
+            assert client.request(root, command='stop')
+            assert server.wait(10) == 0
+            assert not exists(daemon.address(root))
+        finally:
+            if server.poll() is None:
+                server.kill()
@@ -7,10 +7,15 @@
 # (Consult LICENSE or http://www.boost.org/LICENSE_1_0.txt)
 
 from faber import cli
-from test.common import cwd, argv
+from test.common import cwd, argv, tempdir
+import subprocess
+import time
+import json
+import shutil
 import pytest
 import sys
-from os.path import join
+import os
+from os.path import join, dirname, abspath, basename, splitext
 
 compilers = {'gcc': {'cc': 'gcc', 'cxx': 'g++'},
              'clang': {'cc': 'clang', 'cxx': 'clang++'},
@@ -70,6 +75,82 @@ def test_implicit_rules(compiler):
         assert faber(clean)
 
 
+def test_pch(compiler):
+
+    args = []
+    if compiler:
+        args.append(get_cxx_opt(compiler))
+    with cwd(join('examples', 'pch')):
+        assert faber(*args)
+        assert faber(clean)
+
+
+def test_unity(compiler):
+
+    args = []
+    if compiler:
+        args.append(get_cxx_opt(compiler))
+    with cwd(join('examples', 'unity')):
+        assert faber(*args)
+        assert faber(clean)
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason='requires a POSIX shell')
+def test_ninja(compiler):
+
+    args = []
+    if compiler:
+        args.append(get_cxx_opt(compiler))
+    with tempdir() as root:
+        srcdir, builddir = join(root, 'src'), join(root, 'build')
+        shutil.copytree(join('examples', 'unity'), srcdir)
+        with cwd(srcdir):
+            assert faber('--builddir={}'.format(builddir), '--generate=ninja', *args)
+        with open(join(builddir, 'build.ninja')) as f:
+            content = f.read()
+        # the unity source is generated by faber, and compiled by ninja
+        assert 'faber.cli' in content and 'hello.unity0.cc' in content
+        if shutil.which('ninja'):
+            # ninja runs faber to generate the unity source
+            path = dirname(dirname(abspath(cli.__file__)))
+            env = dict(os.environ, PYTHONPATH=os.pathsep.join([path, os.environ.get('PYTHONPATH', '')]))
+
+            def ninja(*args):
+                return subprocess.check_output(['ninja', '-C', builddir] + list(args), env=env)
+            ninja()
+            hello = [join(d, f) for d, _, fs in os.walk(builddir) for f in fs if f == 'hello']
+            assert hello and subprocess.check_output(hello[0]).startswith(b'hello world!')
+            assert b'no work to do' in ninja('-n')
+            # headers included after generating the build file are tracked, too
+            with open(join(srcdir, 'extra.hpp'), 'w') as f:
+                f.write('#pragma once\n')
+            with open(join(srcdir, 'farewell.cpp'), 'a') as f:
+                f.write('#include "extra.hpp"\n')
+            ninja()
+            assert b'no work to do' in ninja('-n')
+            time.sleep(0.01)
+            os.utime(join(srcdir, 'extra.hpp'))
+            assert b'farewell.o' in ninja('-n')
+
+
+def test_compdb(compiler):
+
+    args = []
+    if compiler:
+        args.append(get_cxx_opt(compiler))
+    with tempdir() as builddir, cwd(join('examples', 'unity')):
+        assert faber('--builddir={}'.format(builddir), '--generate=compdb', *args)
+        filename = join(builddir, 'compile_commands.json')
+        with open(filename) as f:
+            entries = json.load(f)
+        # one entry per compilation, the unity batch included
+        assert sorted([splitext(basename(e['file']))[0] for e in entries]) == ['farewell', 'hello.unity0']
+        # an unchanged database isn't rewritten
+        mtime = os.stat(filename).st_mtime_ns
+        assert faber('--builddir={}'.format(builddir), '--generate=compdb', *args)
+        assert os.stat(filename).st_mtime_ns == mtime
+
+
 def test_modular(compiler):
 
     args = []
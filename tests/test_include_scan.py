@@ -0,0 +1,54 @@
+#
+# Copyright (c) 2018 Stefan Seefeld
+# All rights reserved.
+#
+# This file is part of Faber. It is made available under the
+# Boost Software License, Version 1.0.
+# (Consult LICENSE or http://www.boost.org/LICENSE_1_0.txt)
+
+from faber.artefacts.include_scan import includes, scanner, ComputedInclude
+from faber.tools.gxx import gxx
+from faber.scheduler import fscache
+from test.common import tempdir
+from os.path import join
+from os import mkdir
+import pytest
+
+
+def write(filename, content):
+    with open(filename, 'w') as f:
+        f.write(content)
+
+
+def test_includes():
+    """Test that headers are found the way the preprocessor would find them."""
+    with tempdir() as root:
+        mkdir(join(root, 'inc'))
+        write(join(root, 'main.c'), '#include "a.h"\n'
+                                    '  #  include <b.h>\n'
+                                    '#include <stdio.h>\n'
+                                    '// #include "commented.h"\n')
+        write(join(root, 'a.h'), '#include "b.h"\n')
+        write(join(root, 'inc', 'b.h'), '#include "a.h"\n#include "c.h"\n')
+        write(join(root, 'inc', 'c.h'), '\n')
+        # without include paths, only 'a.h' can be found
+        assert includes(join(root, 'main.c')) == [join(root, 'a.h')]
+        headers = includes(join(root, 'main.c'), [join(root, 'inc')])
+        assert sorted(headers) == sorted([join(root, 'a.h'),
+                                          join(root, 'inc', 'b.h'),
+                                          join(root, 'inc', 'c.h')])
+        # changes to a header are picked up (by the next build)
+        write(join(root, 'inc', 'c.h'), '#include HEADER\n')
+        fscache.init()
+        with pytest.raises(ComputedInclude):
+            includes(join(root, 'main.c'), [join(root, 'inc')])
+
+
+def test_scanner():
+    """Test that the scanner stands in for its fallback."""
+    if not gxx.instances():
+        pytest.skip('no g++ compiler found')
+    cxx = gxx.instance()
+    scan = scanner.instance(cxx.makedep)
+    assert scan.qname == cxx.makedep.qname == 'gxx.makedep'
+    assert scan.tool is cxx
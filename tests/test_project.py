@@ -72,6 +72,30 @@ def test_parameters():
         assert info.parameters == dict(answer='42')
 
 
+def test_changed_parameters():
+    """Test that artefacts are updated if a parameter their command uses changed."""
+
+    script = """
+from faber.tools.compiler import cxxflags
+flags = action('flags', 'echo $(cxxflags) > $(<)')
+out = rule(flags, 'out', 'in')
+default = out
+"""
+    with tempdir() as root:
+        srcdir = join(root, 'src')
+        mkdir(srcdir)
+        write_fabscript(srcdir, script)
+        with open(join(srcdir, 'in'), 'w') as f:
+            f.write('')
+        builddir = join(root, 'build')
+        for flags in ('-O1', '-O2'):
+            info = buildinfo(builddir, srcdir)
+            info.parameters = dict(cxxflags=flags)
+            assert project(info).build(None)
+            with open(join(builddir, 'out')) as f:
+                assert f.read().strip() == flags
+
+
 def test_inplace_project():
 
     with tempdir() as root:
@@ -0,0 +1,52 @@
+#
+# Copyright (c) 2018 Stefan Seefeld
+# All rights reserved.
+#
+# This file is part of Faber. It is made available under the
+# Boost Software License, Version 1.0.
+# (Consult LICENSE or http://www.boost.org/LICENSE_1_0.txt)
+
+from faber.project import project, buildinfo
+from test.common import tempdir, write_fabscript, cwd
+import time
+from os.path import getsize
+
+script = """
+# count how often this script is processed
+with open('loads', 'a') as f:
+    f.write('x')
+copy = action('copy', 'cp $(>) $(<)')
+out = rule(copy, 'out', 'in')
+default = out
+"""
+
+
+def build():
+    return project(buildinfo('.', '.'), snapshot=True).build(None)
+
+
+def test_snapshot():
+
+    with tempdir() as root, cwd(root):
+        write_fabscript(root, script)
+        with open('in', 'w') as f:
+            f.write('first')
+        assert build()
+        assert getsize('loads') == 1
+        # nothing changed, so the fabscript isn't processed again...
+        assert build()
+        assert getsize('loads') == 1
+        # ...until a source changes
+        time.sleep(0.01)
+        with open('in', 'w') as f:
+            f.write('second')
+        assert build()
+        assert getsize('loads') == 2
+        with open('out') as f:
+            assert f.read() == 'second'
+        assert build()
+        assert getsize('loads') == 2
+        # a modified fabscript invalidates the snapshot
+        write_fabscript(root, script + '\n')
+        assert build()
+        assert getsize('loads') == 3
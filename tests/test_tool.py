@@ -8,7 +8,11 @@
 
 from faber.tool import *
 from faber.feature import *
+from test.common import tempdir
+from os.path import join
 import pytest
+import sys
+import os
 
 
 def test_tool():
@@ -69,3 +73,49 @@ def test_action():
     assert a.a._tool is a
     assert b.a._cls is B
     assert b.a._tool is b
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason='requires a shell script')
+def test_probe():
+
+    with tempdir() as root:
+        script = join(root, 'probe')
+        log = join(root, 'log')
+
+        def write(output):
+            with open(script, 'w') as f:
+                f.write(f'#!/bin/sh\necho run >> {log}\necho {output} $PROBE_VAR\n')
+            os.chmod(script, 0o755)
+
+        def runs():
+            with open(log) as f:
+                return len(f.readlines())
+
+        write('first')
+        tool.init(root)
+        try:
+            assert tool.probe([script]) == 'first\n'
+            assert tool.probe([script]) == 'first\n'
+            assert runs() == 1
+            tool.finish()
+            # the cache persists...
+            tool.init(root)
+            assert tool.probe([script]) == 'first\n'
+            assert runs() == 1
+            # ...but is invalidated by changes to the executable...
+            write('second!')
+            assert tool.probe([script]) == 'second!\n'
+            assert runs() == 2
+            # ...the arguments...
+            assert tool.probe([script, '-v']) == 'second!\n'
+            assert runs() == 3
+            # ...and relevant environment variables
+            os.environ['PROBE_VAR'] = 'value'
+            assert tool.probe([script]) == 'second!\n'
+            assert tool.probe([script], env=('PROBE_VAR',)) == 'second! value\n'
+            assert runs() == 4
+            with pytest.raises(FileNotFoundError):
+                tool.probe([join(root, 'missing')])
+        finally:
+            os.environ.pop('PROBE_VAR', None)
+            tool.finish()
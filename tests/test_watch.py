@@ -0,0 +1,57 @@
+#
+# Copyright (c) 2018 Stefan Seefeld
+# All rights reserved.
+#
+# This file is part of Faber. It is made available under the
+# Boost Software License, Version 1.0.
+# (Consult LICENSE or http://www.boost.org/LICENSE_1_0.txt)
+
+from faber.watch import poller, inotify, watcher
+from test.common import tempdir
+import pytest
+import threading
+import time
+import sys
+import os
+from os.path import join
+
+
+def modify(filename, delay=0.2):
+    def write():
+        time.sleep(delay)
+        with open(filename + '.tmp', 'w') as f:
+            f.write('modified')
+        # replace the file the way editors typically do
+        os.replace(filename + '.tmp', filename)
+    t = threading.Thread(target=write)
+    t.start()
+    return t
+
+
+def check(kind):
+
+    with tempdir() as root:
+        a, b = join(root, 'a'), join(root, 'b')
+        for f in (a, b):
+            with open(f, 'w') as o:
+                o.write('original')
+        w = kind([a, b])
+        try:
+            t = modify(b)
+            assert w.wait() == [b]
+            t.join()
+        finally:
+            w.close()
+
+
+def test_poller():
+    check(lambda files: poller(files, interval=0.05))
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason='requires inotify')
+def test_inotify():
+    check(inotify)
+    with tempdir() as root:
+        w = watcher([join(root, 'a')])
+        assert isinstance(w, inotify)
+        w.close()